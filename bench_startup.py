@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# pylint: disable=invalid-name
+
+"""Measure how long each entry point spends importing modules, and its peak
+   memory use, in each mode. Each run is a real run of the script, in a fresh
+   interpreter with -X importtime, using a copy of the config file with the mode
+   changed - but against a scratch copy of the database, with stub_api.py in
+   place of the real APIs and a PNG file in place of the display, so nothing the
+   Pi uses is touched."""
+
+import os
+import sys
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+import yaml
+import eco_indicator
+import eco_storage
+
+ENTRY_POINTS = ['store_data.py', 'update_display.py']
+MODES = ['agile_import', 'agile_export', 'carbon', 'agile_carbon', 'tracker']
+
+parser = argparse.ArgumentParser(description=('Benchmark start up time and memory use of the Eco Indicator scripts'))
+parser.add_argument('--conf', '-c', default='config.yaml', help='specify config file to base the runs on')
+parser.add_argument('--script', '-s', action='append', choices=ENTRY_POINTS,
+                    help='script to benchmark (can be repeated, default: store_data.py and update_display.py)')
+parser.add_argument('--mode', '-m', action='append', choices=MODES,
+                    help='mode to benchmark (can be repeated, default: the one in the config file)')
+parser.add_argument('--repeat', '-r', type=int, default=3, help='runs of each, the best is reported')
+parser.add_argument('--top', '-t', type=int, default=8, help='how many of the slowest imports to list')
+
+args = parser.parse_args()
+conf_file = args.conf
+
+def parse_importtime(stderr: str) -> tuple:
+    """Pull the -X importtime lines out of a script's stderr. Returns the total time
+    spent importing (microseconds) and a list of (cumulative us, module) for the
+    top-level imports, i.e. the ones the script itself asked for."""
+    total = 0
+    top_level = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        total += int(self_us)
+        name = name[1:] # after the separator's space, there are two spaces per level of nesting
+        if not name.startswith('  '):
+            top_level.append((int(cumulative_us), name.strip()))
+    return total, top_level
+
+def run_once(script: str, run_conf: str) -> tuple:
+    """Run a script once. Returns wall time (s), peak RSS (kB), import time (us),
+    the top-level imports and the exit status."""
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-X', 'importtime', script, '--conf', run_conf],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    stderr = proc.stderr.read()
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - start
+    import_us, top_level = parse_importtime(stderr)
+    return wall, usage.ru_maxrss, import_us, top_level, proc.returncode
+
+def start_stub() -> tuple:
+    """Start stub_api.py on a free port. Returns the process and its base URL."""
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    stub = subprocess.Popen([sys.executable, 'stub_api.py', '--port', str(port), '--seed', '1'],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    else:
+        stub.kill()
+        raise SystemExit('Error: stub_api.py didn\'t start.')
+    return stub, 'http://127.0.0.1:' + str(port)
+
+def scratch_conf(mode: str, scratch_dir: str, stub_url: str) -> dict:
+    """The config for benchmarking a mode: the real one with the mode changed,
+    using a database in scratch_dir (a copy of the real one if it's for this
+    mode, otherwise empty until store_data.py fills it), the stub APIs and a PNG
+    file for the display."""
+    run_conf = dict(base_conf, Mode=mode)
+    scratch_db = os.path.join(scratch_dir, mode + '.sqlite')
+    # not db_file(), which would restore the copy in RAM if it isn't there
+    live_db = eco_storage.shared_database(run_conf) or eco_storage.DB_FILE
+    if eco_storage.working_dir(run_conf) and not eco_storage.shared_database(run_conf):
+        working = os.path.join(eco_storage.working_dir(run_conf), eco_storage.DB_FILE)
+        live_db = working if os.path.exists(working) else live_db
+    if mode == base_conf['Mode'] and os.path.exists(live_db):
+        eco_storage.copy_database(live_db, scratch_db)
+    run_conf['Storage'] = {'Database': scratch_db}
+    run_conf['Upstream'] = {'OctopusAPI': stub_url + '/v1/products/', 'CarbonAPI': stub_url}
+    run_conf['Targets'] = [{'DisplayType': 'png', 'File': os.path.join(scratch_dir, mode + '.png')}]
+    run_conf.pop('Sync', None) # not from a hub either
+    return run_conf
+
+os.chdir(sys.path[0])
+config = eco_indicator.get_config(conf_file)
+with open(conf_file) as base_file:
+    base_conf = yaml.safe_load(base_file)
+
+scripts = args.script or ENTRY_POINTS
+modes = args.mode or [config['Mode']]
+
+print('{:<20} {:<14} {:>9} {:>10} {:>10} {:>6}'.format(
+    'script', 'mode', 'wall ms', 'import ms', 'peak kB', 'exit'))
+
+stub_process, stub_base = start_stub()
+try:
+    with tempfile.TemporaryDirectory() as scratch_path:
+        for mode in modes:
+            run_file = os.path.join(scratch_path, mode + '.yaml')
+            with open(run_file, 'w') as run_yaml:
+                yaml.safe_dump(scratch_conf(mode, scratch_path, stub_base), run_yaml)
+            for script in scripts:
+                runs = [run_once(script, run_file) for _ in range(args.repeat)]
+                wall, _, import_us, top_level, status = min(runs, key=lambda run: run[0])
+                print('{:<20} {:<14} {:>9.0f} {:>10.1f} {:>10} {:>6}'.format(
+                    script, mode, wall * 1000, import_us / 1000, max(run[1] for run in runs), status))
+                for cumulative_us, name in sorted(top_level, reverse=True)[:args.top]:
+                    print('    {:>8.1f}ms  {}'.format(cumulative_us / 1000, name))
+finally:
+    stub_process.terminate()
+    stub_process.wait()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# pylint: disable=invalid-name
+
+"""Draw the Inky pictures for fixed data in every mode and at every display size,
+   with the clock and timezone frozen, and compare them pixel by pixel with the
+   known-good (golden) pictures in golden/, timing each one against a budget.
+   Differences are saved as pictures with the changed pixels picked out. Run it
+   with --update to make new golden pictures once a change is right. test_renders.py
+   runs it under pytest."""
+
+import os
+import sys
+import io
+import time
+import datetime
+import argparse
+from math import sin
+from contextlib import redirect_stdout
+import eco_indicator
+import eco_series
+
+DEFAULT_BUDGET = 250 # ms per picture, about what a Pi Zero 2 W takes
+RESOLUTIONS = ((212, 104), (250, 122), (800, 480))
+NUM_SLOTS = 48
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+VERSIONS_FILE = 'VERSIONS' # in the golden directory, what the pictures were drawn with
+
+# a Monday afternoon in winter, ten minutes into a slot
+FROZEN_NOW = datetime.datetime(2024, 1, 15, 16, 40, 0, tzinfo=datetime.timezone.utc)
+
+class FrozenDatetime(datetime.datetime):
+    """datetime, stuck at FROZEN_NOW. The drawing code imports datetime when it
+    runs, so it gets this one once freeze_time() has been called."""
+
+    @classmethod
+    def now(cls, tz=None):
+        now = FROZEN_NOW.astimezone(tz)
+        return now if tz is not None else now.replace(tzinfo=None)
+
+    @classmethod
+    def utcnow(cls):
+        return FROZEN_NOW.replace(tzinfo=None)
+
+def freeze_time():
+    """Stop the clock at FROZEN_NOW, in the UK's timezone, for this process."""
+    os.environ['TZ'] = 'Europe/London'
+    time.tzset()
+    datetime.datetime = FrozenDatetime
+
+def render_versions() -> dict:
+    """The versions of what decides exactly which pixels text comes out as."""
+    from importlib import metadata
+    import PIL
+    from PIL import features
+
+    try:
+        roboto = metadata.version('font-roboto')
+    except metadata.PackageNotFoundError:
+        roboto = 'unknown'
+    return {'Pillow': PIL.__version__, 'FreeType': features.version('freetype2') or 'unknown',
+            'font-roboto': roboto}
+
+def read_versions(golden_dir: str) -> dict:
+    """The versions the golden pictures were drawn with, or {} if we don't know."""
+    try:
+        with open(os.path.join(golden_dir, VERSIONS_FILE)) as versions_file:
+            return dict(line.split(None, 1) for line in versions_file.read().splitlines() if line.strip())
+    except FileNotFoundError:
+        return {}
+
+def write_versions(golden_dir: str):
+    """Record what the golden pictures were drawn with."""
+    with open(os.path.join(golden_dir, VERSIONS_FILE), 'w') as versions_file:
+        for name, version in render_versions().items():
+            versions_file.write(name + ' ' + version + '\n')
+
+def slot_time(num: int) -> str:
+    """The SQLite time of the num'th slot from the current one."""
+    start = FROZEN_NOW.replace(minute=FROZEN_NOW.minute // 30 * 30)
+    return (start + datetime.timedelta(minutes=30 * num)).strftime("%Y-%m-%d %H:%M:%S")
+
+def price(num: int) -> float:
+    """An Agile-ish price, going negative for a couple of hours overnight."""
+    return round(18 + 14 * sin(num / 5) - (9 if 20 <= num <= 23 else 0), 2)
+
+def intensity(num: int) -> float:
+    """A carbon intensity with a daily swing."""
+    return float(round(180 + 120 * sin(num / 7 + 1)))
+
+def half_hourly(values, gap: range = range(0)) -> eco_series.SlotSeries:
+    """A day of slots from (price, intensity) functions, with the slots in gap missing."""
+    return eco_series.SlotSeries.from_rows(
+        [(slot_time(num),) + values(num) + (None,) for num in range(NUM_SLOTS) if num not in gap],
+        aligned=True)
+
+def tracker_days() -> tuple:
+    """Today's and tomorrow's Tracker prices, newest first, and a month of history
+    with 7-day averages."""
+    today = FROZEN_NOW.date()
+    days = [today - datetime.timedelta(days=back) for back in range(30, -2, -1)]
+    elec = [round(24 + 3 * sin(num / 4), 2) for num in range(len(days))]
+    gas = [round(6.5 + 0.8 * sin(num / 6), 2) if num != 12 else None for num in range(len(days))]
+
+    def average(values, num):
+        window = [value for value in values[max(0, num - 6):num + 1] if value is not None]
+        return sum(window) / len(window)
+
+    trend = [(day.isoformat(), elec[num], gas[num], average(elec, num), average(gas, num))
+             for num, day in enumerate(days)]
+    latest = eco_series.SlotSeries.from_rows([(day + ' 00:00:00', elec_price, None, gas_price)
+                                              for day, elec_price, gas_price, _, _ in reversed(trend[-2:])])
+    return latest, trend
+
+def cases() -> dict:
+    """name: (mode, data, trend) for each set of data drawn."""
+    return {'agile_import': ('agile_import', half_hourly(lambda num: (price(num), None)), None),
+            'agile_export': ('agile_export', half_hourly(lambda num: (round(price(num) * 0.6 + 3, 2), None)), None),
+            'carbon': ('carbon', half_hourly(lambda num: (None, intensity(num))), None),
+            'carbon_gaps': ('carbon', half_hourly(lambda num: (None, intensity(num)), range(6, 10)), None),
+            'agile_carbon': ('agile_carbon', half_hourly(lambda num: (price(num), intensity(num))), None),
+            'tracker': ('tracker',) + tracker_days()}
+
+def draw(conf: dict, data, trend, resolution: tuple):
+    """Draw one picture, quietly. Returns it and how long it took in ms."""
+    display = eco_indicator.HeadlessInky(resolution)
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        if conf['Mode'] == 'tracker':
+            eco_indicator.update_inky_tracker(conf, data, False, display, trend=trend)
+        else:
+            eco_indicator.update_inky(conf, data, False, display)
+    return display.image, (time.perf_counter() - start) * 1000
+
+def diff_image(golden, actual):
+    """The golden picture faded to grey, with the pixels which differ in magenta.
+    Returns it and how many pixels differ."""
+    from PIL import Image, ImageChops
+
+    golden, actual = golden.convert('RGB'), actual.convert('RGB')
+    changed = ImageChops.difference(golden, actual).convert('L').point(lambda level: 255 if level else 0)
+    faded = Image.blend(golden.convert('L').convert('RGB'), Image.new('RGB', golden.size, 'white'), 0.7)
+    faded.paste(Image.new('RGB', golden.size, (255, 0, 255)), mask=changed)
+    return faded, changed.histogram()[255]
+
+def main():
+    """Check (or with --update, draw) every picture."""
+    parser = argparse.ArgumentParser(description=('Check the Inky pictures against golden copies'))
+    parser.add_argument('--conf', '-c',
+                        help='config file to draw with (default config.yaml.default, so everyone gets the same)')
+    parser.add_argument('--golden', '-g', default=GOLDEN_DIR,
+                        help='directory of golden pictures (default golden, next to this script)')
+    parser.add_argument('--output', '-o', default='render_checks',
+                        help='directory for the pictures which differ, and their diffs (default render_checks)')
+    parser.add_argument('--update', action='store_true', help='draw the golden pictures rather than checking them')
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET,
+                        help='milliseconds each picture may take (default ' + str(DEFAULT_BUDGET) + ')')
+    parser.add_argument('--repeat', type=int, default=3, help='time the best of this many draws (default 3)')
+    parser.add_argument('--case', action='append', help='only check this case (can be repeated)')
+
+    args = parser.parse_args()
+    conf_file = os.path.abspath(args.conf) if args.conf else 'config.yaml.default'
+    golden_dir = os.path.abspath(args.golden)
+    output_dir = os.path.abspath(args.output)
+
+    os.chdir(sys.path[0])
+    freeze_time()
+    with redirect_stdout(io.StringIO()):
+        config = eco_indicator.get_config(conf_file)
+
+    from PIL import Image
+
+    if args.update:
+        os.makedirs(golden_dir, exist_ok=True)
+        write_versions(golden_dir)
+    else:
+        os.makedirs(output_dir, exist_ok=True)
+        made_with = read_versions(golden_dir)
+        if made_with != render_versions():
+            print('The golden pictures were drawn with ' + str(made_with or 'unknown versions') +
+                  ', this is ' + str(render_versions()) + ', so text may come out a pixel or two different.')
+
+    failed = 0
+    for name, (mode, data, trend) in cases().items():
+        if args.case and name not in args.case:
+            continue
+        case_conf = dict(config, Mode=mode)
+        for resolution in RESOLUTIONS:
+            picture = name + '_' + str(resolution[0]) + 'x' + str(resolution[1]) + '.png'
+            try:
+                # the first draw loads the fonts, so time the ones after
+                img, _ = draw(case_conf, data, trend, resolution)
+                elapsed = min(draw(case_conf, data, trend, resolution)[1] for _ in range(max(args.repeat, 1)))
+            except (Exception, SystemExit) as error: # pylint: disable=broad-except
+                failed += 1
+                print(picture + ': failed to draw - ' + (str(error) or type(error).__name__))
+                continue
+
+            if args.update:
+                img.save(os.path.join(golden_dir, picture), format='PNG')
+                print(picture + ': saved, {:.0f}ms'.format(elapsed))
+                continue
+
+            problems = []
+            try:
+                golden = Image.open(os.path.join(golden_dir, picture))
+            except FileNotFoundError:
+                problems.append('no golden picture')
+                golden = None
+            if golden is not None:
+                if golden.size != img.size:
+                    problems.append('size changed from {}x{}'.format(*golden.size))
+                else:
+                    diff, num_changed = diff_image(golden, img)
+                    if num_changed:
+                        problems.append(str(num_changed) + ' pixels differ')
+                        diff.save(os.path.join(output_dir, picture.replace('.png', '.diff.png')), format='PNG')
+                if problems:
+                    img.save(os.path.join(output_dir, picture), format='PNG')
+            if elapsed > args.budget:
+                problems.append('over budget')
+
+            if problems:
+                failed += 1
+            print(picture + ': {:.0f}ms'.format(elapsed) + (' - ' + ', '.join(problems) if problems else ' ok'))
+
+    if failed:
+        raise SystemExit(str(failed) + ' pictures failed, see ' + output_dir + '.')
+
+if __name__ == '__main__':
+    main()
@@ -5,14 +5,20 @@
    use the appropriate method to clear it."""
 
 import eco_indicator
+import eco_profile
+import eco_lock
 import argparse
 
 parser = argparse.ArgumentParser(description=('Clear the attached display'))
 parser.add_argument('--conf', '-c', default='config.yaml', help='specify config file')
+eco_profile.add_arguments(parser)
 
 args = parser.parse_args()
+eco_profile.start(args, 'clear_display')
 conf_file = args.conf
 
 config = eco_indicator.get_config(conf_file)
 
-eco_indicator.clear_display(config)
+# not in the middle of update_display.py drawing on it
+with eco_lock.display(config):
+    eco_indicator.clear_display(config)
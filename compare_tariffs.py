@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# pylint: disable=invalid-name
+
+"""Work out what half-hourly consumption would have cost (and how much carbon it
+   would have emitted) under each tariff we have data for, by household and
+   by period."""
+
+import os
+import sys
+import csv
+import time
+import argparse
+import eco_indicator
+import eco_storage
+import eco_tariffs
+
+parser = argparse.ArgumentParser(description=('Compare tariffs for half-hourly consumption using SQLite data'))
+parser.add_argument('--conf', '-c', default='config.yaml', help='specify config file')
+parser.add_argument('--csv', help='consumption CSV with timestamp, kwh and optionally '
+                    'gas_kwh and household columns')
+parser.add_argument('--table', action='store_true',
+                    help='read consumption from the consumption table in the database instead')
+parser.add_argument('--source', '-s', action='append', default=[],
+                    help='extra data to compare, as LABEL=DATABASE:MODE (can be repeated)')
+parser.add_argument('--period', choices=eco_tariffs.PERIODS.keys(), default='total',
+                    help='group results by day, month or in total')
+parser.add_argument('--from', dest='date_from', help='only consider consumption from this UTC date')
+parser.add_argument('--to', dest='date_to', help='only consider consumption before this UTC date')
+parser.add_argument('--output', '-o', help='also write the results to this CSV file')
+
+args = parser.parse_args()
+conf_file = args.conf
+
+# paths on the command line are relative to where we were run from
+csv_file = os.path.abspath(args.csv) if args.csv else None
+output_file = os.path.abspath(args.output) if args.output else None
+sources = []
+for source in args.source:
+    try:
+        label, location = source.split('=', 1)
+        db_file, mode = location.rsplit(':', 1)
+    except ValueError as bad_source:
+        raise SystemExit('Error: --source must look like LABEL=DATABASE:MODE, not ' + source) from bad_source
+    if mode not in eco_tariffs.PRICE_LOOKUP:
+        raise SystemExit('Error: unknown mode ' + mode + ' for ' + label)
+    sources.append((label, os.path.abspath(db_file), mode))
+
+os.chdir(sys.path[0])
+config = eco_indicator.get_config(conf_file)
+
+if config['Mode'] not in eco_tariffs.PRICE_LOOKUP:
+    raise SystemExit('Error: invalid mode ' + config['Mode'] + ' in config.')
+
+# our own database always comes first
+sources.insert(0, (config['Mode'], os.path.abspath(eco_storage.db_file(config)), config['Mode']))
+
+if csv_file:
+    chunks = eco_tariffs.read_csv_chunks(csv_file)
+elif args.table:
+    chunks = eco_tariffs.read_table_chunks(eco_storage.db_file(config))
+else:
+    raise SystemExit('Error: give a consumption --csv file, or --table to use the database.')
+
+date_from = eco_tariffs.to_sqlite_time(args.date_from) if args.date_from else None
+date_to = eco_tariffs.to_sqlite_time(args.date_to) if args.date_to else None
+
+start_time = time.perf_counter()
+results = eco_tariffs.compare_tariffs(sources, chunks, args.period, date_from, date_to)
+print('Compared ' + str(len(sources)) + ' sources in {:.2f}s.'.format(time.perf_counter() - start_time))
+
+header = ['household', 'period', 'source', 'kwh', 'elec_cost_p', 'gas_kwh', 'gas_cost_p',
+          'total_cost_p', 'carbon_g', 'unpriced_slots']
+lines = []
+for (household, period, label), totals in sorted(results.items()):
+    costs = [totals['elec_cost'], totals['gas_cost']]
+    total_cost = None if costs == [None, None] else sum(cost or 0 for cost in costs)
+    lines.append([household, period, label, totals['kwh'], totals['elec_cost'], totals['gas_kwh'],
+                  totals['gas_cost'], total_cost, totals['carbon'], totals['unpriced']])
+
+for line in lines:
+    print(' '.join(str(line[i]) for i in range(3)) + ': ' +
+          ', '.join(name + ' ' + ('{:.1f}'.format(value) if isinstance(value, float) else str(value))
+                    for name, value in zip(header[3:], line[3:]) if value is not None))
+
+if output_file:
+    with open(output_file, 'w', newline='') as out:
+        writer = csv.writer(out)
+        writer.writerow(header)
+        writer.writerows(lines)
+    print('Results written to ' + output_file)
@@ -0,0 +1,103 @@
+"""
+Functions to keep a typical price/carbon profile for each half hour of the week,
+from the values stored so far, and to use it to fill the graph past the end of
+the published data with estimates
+"""
+
+import time
+import sqlite3
+from math import nan, isnan
+from datetime import datetime, timedelta, timezone
+from eco_series import FIELDS, SLOT_SECONDS, to_epoch
+
+SQLITE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# how much each new week counts: 0.2 means the profile mostly reflects the last
+# five weeks or so, and follows the seasons
+ALPHA = 0.2
+
+# the values each mode shows, and so the ones worth a profile
+MODE_FIELDS = {'agile_import': ['value_inc_vat'],
+               'agile_export': ['value_inc_vat'],
+               'carbon': ['intensity'],
+               'agile_carbon': ['value_inc_vat', 'intensity']}
+
+def create_baseline(cursor):
+    """Make sure the profile tables exist: one row per field, weekday and half
+    hour (local time, which is what prices follow), and how far through the
+    stored data each field's profile has got."""
+    cursor.execute('CREATE TABLE IF NOT EXISTS baseline (field STRING, weekday INTEGER, slot INTEGER, '
+                   'value REAL, samples INTEGER, PRIMARY KEY (field, weekday, slot)) WITHOUT ROWID')
+    cursor.execute('CREATE TABLE IF NOT EXISTS baseline_state (field STRING PRIMARY KEY, through STRING)')
+
+def week_slot(epoch: int) -> tuple:
+    """(weekday, half hour of the day) in local time for a slot."""
+    local = time.localtime(epoch)
+    return local.tm_wday, local.tm_hour * 2 + local.tm_min // 30
+
+def update_profile(cursor, field: str, now: datetime = None) -> int:
+    """Fold the slots which have finished since the last update into the profile, as
+    an exponentially weighted moving average for each half hour of the week.
+    Only the new slots are read, so this costs the same however much history
+    there is. Returns how many slots were added."""
+    if now is None:
+        now = datetime.now(timezone.utc)
+
+    cursor.execute('SELECT through FROM baseline_state WHERE field = ?', (field,))
+    state = cursor.fetchone()
+    through = state[0] if state else ''
+    # only finished slots: forecasts for the future are still changing
+    cursor.execute('SELECT valid_from, ' + field + ' FROM eco WHERE valid_from > ? AND valid_from <= ? '
+                   'AND ' + field + ' IS NOT NULL ORDER BY valid_from',
+                   (through, (now - timedelta(minutes=30)).strftime(SQLITE_FORMAT)))
+    new_rows = cursor.fetchall()
+    if not new_rows:
+        return 0
+
+    cursor.execute('SELECT weekday, slot, value, samples FROM baseline WHERE field = ?', (field,))
+    profile = {(weekday, slot): [value, samples] for weekday, slot, value, samples in cursor.fetchall()}
+    updated = set()
+    for valid_from, value in new_rows:
+        key = week_slot(to_epoch(valid_from))
+        entry = profile.get(key)
+        if entry is None:
+            profile[key] = [value, 1]
+        else:
+            entry[0] += ALPHA * (value - entry[0])
+            entry[1] += 1
+        updated.add(key)
+
+    cursor.executemany('INSERT OR REPLACE INTO baseline VALUES (?, ?, ?, ?, ?)',
+                       [(field,) + key + tuple(profile[key]) for key in updated])
+    cursor.execute('INSERT OR REPLACE INTO baseline_state VALUES (?, ?)', (field, new_rows[-1][0]))
+    return len(new_rows)
+
+def estimates(cursor, fields: list, last_epoch: int, num_slots: int) -> list:
+    """(epoch, values) for the num_slots slots after last_epoch, from the profile.
+    Values are in eco table order, NaN where there's no estimate."""
+    profiles = {}
+    for field in fields:
+        cursor.execute('SELECT weekday, slot, value FROM baseline WHERE field = ?', (field,))
+        profiles[field] = {(weekday, slot): value for weekday, slot, value in cursor.fetchall()}
+
+    rows = []
+    for num in range(1, num_slots + 1):
+        epoch = last_epoch + num * SLOT_SECONDS
+        key = week_slot(epoch)
+        rows.append((epoch, tuple(profiles[field].get(key, nan) if field in profiles else nan
+                                  for field in FIELDS)))
+    return rows
+
+def with_estimates(cursor, series, mode: str, num_slots: int):
+    """The series, made up to num_slots slots with estimates if it's shorter."""
+    missing = num_slots - len(series)
+    if missing <= 0 or len(series) == 0 or mode not in MODE_FIELDS:
+        return series
+    try:
+        rows = estimates(cursor, MODE_FIELDS[mode], series.times[-1], missing)
+    except sqlite3.OperationalError:
+        return series # no profile yet, store_data.py makes it
+    if all(isnan(value) for _, values in rows for value in values):
+        return series
+    print('Estimated ' + str(len(rows)) + ' slots past the published data.')
+    return series.with_estimates(rows)
@@ -0,0 +1,91 @@
+"""
+Functions to keep Tracker prices as a daily series, for longer than the eco
+table keeps them, with a rolling average worked out as they arrive, so the
+display can show today, tomorrow and the trend without reading the eco table
+"""
+
+from datetime import date, timedelta
+import eco_series
+
+MAX_DAYS = 90 # how much history is kept
+DEFAULT_DAYS = 30 # how much of it the trend shows
+AVERAGE_DAYS = 7 # the rolling average is over this many days
+
+def create_daily(cursor):
+    """Make sure the daily table exists: one row per day, with the day's prices
+    and their rolling averages up to and including that day."""
+    cursor.execute('CREATE TABLE IF NOT EXISTS daily (day STRING PRIMARY KEY, value_inc_vat REAL, '
+                   'gas_value_inc_vat REAL, value_inc_vat_avg REAL, gas_value_inc_vat_avg REAL) '
+                   'WITHOUT ROWID')
+
+def history_days(conf: dict) -> int:
+    """How many days of trend to draw, from InkyPHAT: TrackerDays."""
+    days = (conf.get('InkyPHAT') or {}).get('TrackerDays', DEFAULT_DAYS)
+    if not (isinstance(days, int) and 2 <= days <= MAX_DAYS):
+        print('TrackerDays misconfigured: ' + str(days) + ' (must be 2 to ' + str(MAX_DAYS) +
+              '). Using default of ' + str(DEFAULT_DAYS) + '.')
+        days = DEFAULT_DAYS
+    return days
+
+def mean(values: list):
+    """The mean of the values we have, or None if there aren't any."""
+    known = [value for value in values if value is not None]
+    return sum(known) / len(known) if known else None
+
+def update_averages(cursor, since: str):
+    """Work out the rolling averages again for every day from since on."""
+    start = (date.fromisoformat(since) - timedelta(days=AVERAGE_DAYS - 1)).isoformat()
+    cursor.execute('SELECT day, value_inc_vat, gas_value_inc_vat FROM daily WHERE day >= ? ORDER BY day',
+                   (start,))
+    rows = cursor.fetchall()
+    updates = []
+    for idx, (day, _, _) in enumerate(rows):
+        if day < since:
+            continue
+        window_start = (date.fromisoformat(day) - timedelta(days=AVERAGE_DAYS - 1)).isoformat()
+        window = [row for row in rows[:idx + 1] if row[0] >= window_start]
+        updates.append((mean([row[1] for row in window]), mean([row[2] for row in window]), day))
+    cursor.executemany('UPDATE daily SET value_inc_vat_avg = ?, gas_value_inc_vat_avg = ? WHERE day = ?',
+                       updates)
+
+def update_daily(cursor, today: date = None) -> int:
+    """Copy the days in the eco table which are new or have changed into the daily
+    table, update the averages from there on and drop days older than we keep.
+    In Tracker mode the eco table only has a row a day for the last few days, so
+    this is cheap. Returns how many days were written."""
+    if today is None:
+        today = date.today()
+
+    # Tracker prices start at local midnight, which is the day before in UTC in summer
+    cursor.execute("SELECT date(valid_from, '+12 hours'), value_inc_vat, gas_value_inc_vat FROM eco "
+                   "ORDER BY valid_from")
+    days = cursor.fetchall()
+    if not days:
+        return 0
+
+    cursor.execute('SELECT day, value_inc_vat, gas_value_inc_vat FROM daily WHERE day >= ?', (days[0][0],))
+    stored = {day: (elec, gas) for day, elec, gas in cursor.fetchall()}
+    changed = [(day, elec, gas) for day, elec, gas in days if stored.get(day) != (elec, gas)]
+    if changed:
+        cursor.executemany('INSERT OR REPLACE INTO daily (day, value_inc_vat, gas_value_inc_vat) '
+                           'VALUES (?, ?, ?)', changed)
+        update_averages(cursor, changed[0][0])
+
+    cursor.execute('DELETE FROM daily WHERE day < ?', ((today - timedelta(days=MAX_DAYS)).isoformat(),))
+    return len(changed)
+
+def latest(cursor) -> eco_series.SlotSeries:
+    """The last two days (tomorrow and today, or today and yesterday), newest
+    first, laid out like rows of the eco table for update_inky_tracker."""
+    cursor.execute("SELECT day || ' 00:00:00', value_inc_vat, NULL, gas_value_inc_vat FROM daily "
+                   "ORDER BY day DESC LIMIT 2")
+    return eco_series.SlotSeries.from_rows(cursor)
+
+def trend(cursor, days: int = MAX_DAYS, today: date = None) -> list:
+    """(day, price, gas price, average price, average gas price) for the last
+    few days and tomorrow, oldest first."""
+    if today is None:
+        today = date.today()
+    cursor.execute('SELECT day, value_inc_vat, gas_value_inc_vat, value_inc_vat_avg, gas_value_inc_vat_avg '
+                   'FROM daily WHERE day > ? ORDER BY day', ((today - timedelta(days=days)).isoformat(),))
+    return cursor.fetchall()
@@ -0,0 +1,75 @@
+"""
+Functions to turn each upstream API's responses into rows ready to insert:
+(valid_from, value) tuples with times in SQLite format. Each page's layout is
+checked once, up front, and a page which doesn't look right is rejected whole,
+so nothing from it gets written
+"""
+
+import re
+
+# the APIs only ever send UTC times in these forms, so match them rather than
+# going through strptime: '2024-01-01T23:30:00Z' (Octopus) or '2024-01-01T23:30Z'
+# (carbonintensity.org.uk)
+ISO_TIME = re.compile(r'(\d{4}-\d\d-\d\d)T(\d\d:\d\d)(:\d\d)?Z')
+
+def iso_to_sqlite(timestamp) -> str:
+    """An API time in SQLite format, or an error if it isn't one."""
+    match = ISO_TIME.fullmatch(timestamp) if isinstance(timestamp, str) else None
+    if match is None:
+        raise ValueError('unrecognised time ' + repr(timestamp))
+    day, hours_minutes, seconds = match.groups()
+    return day + ' ' + hours_minutes + (seconds or ':00')
+
+def is_number(value) -> bool:
+    """True for an int or float from the JSON (not a bool, which is an int too)."""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def rejected(api: str, problem: str):
+    """The error for a page which isn't what we expected."""
+    return SystemExit('Error: unexpected response from ' + api + ' (' + problem + '), nothing from it was stored.')
+
+def octopus_rates(page: dict) -> tuple:
+    """Decode one page of Octopus standard-unit-rates. Returns the rows and when
+    the last of them ends (in SQLite format)."""
+    if not isinstance(page, dict) or not isinstance(page.get('results'), list):
+        raise rejected('Octopus', 'no list of results')
+    rows = []
+    ends = ''
+    try:
+        for result in page['results']:
+            value = result['value_inc_vat']
+            if not is_number(value):
+                raise ValueError('value_inc_vat of ' + repr(value))
+            rows.append((iso_to_sqlite(result['valid_from']), value))
+            if result.get('valid_to') is not None:
+                ends = max(ends, iso_to_sqlite(result['valid_to']))
+    except KeyError as error:
+        raise rejected('Octopus', 'result ' + str(len(rows)) + ' has no ' + str(error)) from error
+    except (TypeError, ValueError) as error:
+        raise rejected('Octopus', 'result ' + str(len(rows)) + ': ' + str(error)) from error
+    return rows, ends
+
+def carbon_intensity(page: dict) -> tuple:
+    """Decode a carbonintensity.org.uk response, national (a list of slots under
+    'data') or regional (a region under 'data', with the list of slots in its
+    own 'data'). Returns the rows and when the last of them ends. A forecast
+    can be missing (null), which is stored as such."""
+    data = page.get('data') if isinstance(page, dict) else None
+    if isinstance(data, dict):
+        data = data.get('data')
+    if not isinstance(data, list):
+        raise rejected('carbonintensity.org.uk', 'no list of slots')
+    rows = []
+    ends = ''
+    try:
+        for slot in data:
+            forecast = slot['intensity']['forecast']
+            if forecast is not None and not is_number(forecast):
+                raise ValueError('forecast of ' + repr(forecast))
+            rows.append((iso_to_sqlite(slot['from']), forecast))
+            ends = max(ends, iso_to_sqlite(slot['to']))
+    except KeyError as error:
+        raise rejected('carbonintensity.org.uk', 'slot ' + str(len(rows)) + ' has no ' + str(error)) from error
+    except (TypeError, ValueError) as error:
+        raise rejected('carbonintensity.org.uk', 'slot ' + str(len(rows)) + ': ' + str(error)) from error
+    return rows, ends
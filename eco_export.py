@@ -0,0 +1,162 @@
+"""
+Functions for streaming the stored history out of the database in batches, as
+CSV, JSON lines or Parquet, used by export_data.py
+"""
+
+import os
+import sys
+import csv
+import json
+import sqlite3
+from eco_indicator import db_uri
+
+BATCH_SIZE = 5000 # rows per query
+
+# the tables worth exporting, and their primary keys, which put the rows in order
+# (and pick out one row) so each batch can carry on from where the last ended
+TABLE_KEYS = {'eco': ('valid_from',),
+              'forecast_history': ('field', 'valid_from', 'revised_at')}
+
+FORMATS = ('csv', 'jsonl', 'parquet')
+
+def format_for(out_file: str) -> str:
+    """Guess the format from the output file's extension, CSV if it's not obvious."""
+    extension = os.path.splitext(out_file)[1].lower().lstrip('.')
+    if extension in ('json', 'jsonl', 'ndjson'):
+        return 'jsonl'
+    if extension in ('parquet', 'pq'):
+        return 'parquet'
+    return 'csv'
+
+def table_columns(db_file: str, table: str) -> list:
+    """Return (name, declared type) for each column of a table, or an empty list if
+    the table isn't there."""
+    conn = sqlite3.connect(db_uri(db_file, 'ro'), uri=True)
+    try:
+        return [(column[1], column[2]) for column in conn.execute('PRAGMA table_info(' + table + ')')]
+    finally:
+        conn.close()
+
+def read_batches(db_file: str, table: str, columns: list, date_from: str = None,
+                 date_to: str = None, batch_size: int = BATCH_SIZE):
+    """Yield lists of up to batch_size rows of the given columns, in primary key
+    order (which for eco is time order). Each batch is a separate query which starts after the last row of the one
+    before, using the primary key, so no lock is held between batches and
+    store_data.py can carry on writing while a long export runs."""
+    keys = TABLE_KEYS[table]
+    # the key columns are fetched after the wanted ones, to know where to carry on from
+    select = 'SELECT ' + ', '.join(list(columns) + list(keys)) + ' FROM ' + table
+    order = ' ORDER BY ' + ', '.join(keys) + ' LIMIT ?'
+    conditions = []
+    params = []
+    if date_from:
+        conditions.append('valid_from >= ?')
+        params.append(date_from)
+    if date_to:
+        conditions.append('valid_from < ?')
+        params.append(date_to)
+
+    conn = sqlite3.connect(db_uri(db_file, 'ro'), uri=True)
+    try:
+        last_key = None
+        while True:
+            batch_conditions = list(conditions)
+            batch_params = list(params)
+            if last_key is not None:
+                batch_conditions.append('(' + ', '.join(keys) + ') > (' + ', '.join('?' * len(keys)) + ')')
+                batch_params.extend(last_key)
+            where = ' WHERE ' + ' AND '.join(batch_conditions) if batch_conditions else ''
+            try:
+                rows = conn.execute(select + where + order, batch_params + [batch_size]).fetchall()
+            except sqlite3.Error as error:
+                raise SystemError('Database error: ' + str(error)) from error
+            if not rows:
+                break
+            last_key = rows[-1][len(columns):]
+            yield [row[:len(columns)] for row in rows]
+            if len(rows) < batch_size:
+                break
+    finally:
+        conn.close()
+
+def write_csv(out, columns: list, batches) -> int:
+    """Write batches as CSV with a header row, missing values left empty."""
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    count = 0
+    for batch in batches:
+        writer.writerows(batch)
+        count += len(batch)
+    return count
+
+def write_jsonl(out, columns: list, batches) -> int:
+    """Write batches as JSON lines, one object per row, missing values as null."""
+    count = 0
+    for batch in batches:
+        out.writelines(json.dumps(dict(zip(columns, row))) + '\n' for row in batch)
+        count += len(batch)
+    return count
+
+def write_parquet(out_file: str, columns: list, types: list, batches) -> int:
+    """Write batches as a Parquet file, one row group per batch. Needs pyarrow."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as no_pyarrow:
+        raise SystemExit('Error: writing Parquet needs pyarrow - try pip3 install pyarrow, '
+                         'or export as CSV or JSON lines instead.') from no_pyarrow
+
+    def arrow_type(declared: str):
+        if 'INT' in declared.upper():
+            return pyarrow.int64()
+        if declared.upper() in ('REAL', 'FLOAT', 'DOUBLE'):
+            return pyarrow.float64()
+        return pyarrow.string()
+
+    schema = pyarrow.schema([(name, arrow_type(declared)) for name, declared in zip(columns, types)])
+    count = 0
+    with pyarrow.parquet.ParquetWriter(out_file, schema) as writer:
+        for batch in batches:
+            writer.write_table(pyarrow.Table.from_pydict(
+                {name: [row[idx] for row in batch] for idx, name in enumerate(columns)}, schema=schema))
+            count += len(batch)
+    return count
+
+def export(db_file: str, table: str, out_file: str, export_format: str, columns: list = None,
+           date_from: str = None, date_to: str = None, batch_size: int = BATCH_SIZE) -> int:
+    """Export a table (or some of its columns) to a file, or stdout if out_file is
+    '-'. The file is written alongside and renamed into place when it's complete,
+    so nothing ever reads half an export. Returns the number of rows written."""
+    if table not in TABLE_KEYS:
+        raise SystemExit('Error: unable to export ' + table + ', choose from ' + ', '.join(TABLE_KEYS))
+    available = dict(table_columns(db_file, table))
+    if not available:
+        raise SystemExit('Error: there is no ' + table + ' table in ' + db_file + '.')
+    columns = columns or list(available)
+    unknown = [column for column in columns if column not in available]
+    if unknown:
+        raise SystemExit('Error: ' + table + ' has no column ' + ', '.join(unknown) +
+                         ' - it has ' + ', '.join(available) + '.')
+
+    batches = read_batches(db_file, table, columns, date_from, date_to, batch_size)
+
+    if out_file == '-':
+        if export_format == 'parquet':
+            raise SystemExit('Error: Parquet has to be written to a file.')
+        writer = write_jsonl if export_format == 'jsonl' else write_csv
+        return writer(sys.stdout, columns, batches)
+
+    partial = out_file + '.partial'
+    try:
+        if export_format == 'parquet':
+            count = write_parquet(partial, columns, [available[column] for column in columns], batches)
+        else:
+            with open(partial, 'w', newline='') as out:
+                writer = write_jsonl if export_format == 'jsonl' else write_csv
+                count = writer(out, columns, batches)
+    except BaseException:
+        if os.path.exists(partial):
+            os.unlink(partial)
+        raise
+    os.replace(partial, out_file)
+    return count
@@ -0,0 +1,105 @@
+"""
+Functions to keep track of which half hour slots we have data for, so that holes
+left by missed runs or partial API responses can be found (and filled) without
+scanning the whole table, and so the displays can put each slot in its place
+"""
+
+from datetime import datetime, timedelta
+
+SQLITE_FORMAT = "%Y-%m-%d %H:%M:%S"
+SLOT_LENGTH = timedelta(minutes=30)
+
+# only these columns hold half-hourly data, Tracker prices are daily
+TRACKED_FIELDS = ('value_inc_vat', 'intensity')
+
+def to_sqlite_time(api_time: str) -> str:
+    """An API timestamp (2023-03-01T00:00:00Z or 2023-03-01T00:00Z) in SQLite date
+    format. Slots always start on the minute, so the seconds are always zero."""
+    return api_time[:10] + ' ' + api_time[11:16] + ':00'
+
+def shift(sqlite_time: str, slots: int) -> str:
+    """Move an SQLite time on (or back) by a number of slots."""
+    return (datetime.strptime(sqlite_time, SQLITE_FORMAT) + slots * SLOT_LENGTH).strftime(SQLITE_FORMAT)
+
+def create_coverage(cursor, field: str):
+    """Make sure the coverage table exists, and has been worked out for this field.
+    Each row is an unbroken run of slots we have data for. The first time, this
+    has to look at every row in the eco table; after that it's kept up to date
+    as data comes in."""
+    # repair_attempts counts the fetches of the gap before a run which didn't fill any of it
+    cursor.execute('CREATE TABLE IF NOT EXISTS coverage (field STRING, run_start STRING, '
+                   'run_end STRING, repair_attempts INTEGER NOT NULL DEFAULT 0, '
+                   'PRIMARY KEY (field, run_start))')
+    cursor.execute('PRAGMA table_info(coverage)')
+    if 'repair_attempts' not in [column[1] for column in cursor.fetchall()]:
+        # made before failed repairs were counted
+        cursor.execute('ALTER TABLE coverage ADD COLUMN repair_attempts INTEGER NOT NULL DEFAULT 0')
+    cursor.execute('SELECT 1 FROM coverage WHERE field = ? LIMIT 1', (field,))
+    if cursor.fetchone() is None:
+        cursor.execute('SELECT MIN(valid_from), MAX(valid_from) FROM eco WHERE ' +
+                       field + ' IS NOT NULL')
+        first, last = cursor.fetchone()
+        if first is not None:
+            update_coverage(cursor, field, first, last)
+
+def slot_runs(slot_times: list) -> list:
+    """Group sorted SQLite times into runs of consecutive slots, as (start, end) pairs."""
+    runs = []
+    for slot_time in slot_times:
+        if runs and shift(runs[-1][1], 1) == slot_time:
+            runs[-1][1] = slot_time
+        else:
+            runs.append([slot_time, slot_time])
+    return runs
+
+def update_coverage(cursor, field: str, span_start: str, span_end: str):
+    """Bring the coverage of a field up to date after data between span_start and
+    span_end (inclusive, SQLite times) has been written. Only the rows in the
+    span and the runs which touch it are looked at."""
+    cursor.execute('SELECT valid_from FROM eco WHERE valid_from BETWEEN ? AND ? AND ' +
+                   field + ' IS NOT NULL ORDER BY valid_from', (span_start, span_end))
+    new_runs = slot_runs([row[0] for row in cursor.fetchall()])
+
+    for run_start, run_end in new_runs:
+        # merge with any runs it overlaps or sits right next to
+        cursor.execute('SELECT run_start, run_end FROM coverage WHERE field = ? AND '
+                       'run_start <= ? AND run_end >= ?',
+                       (field, shift(run_end, 1), shift(run_start, -1)))
+        touching = cursor.fetchall()
+        for other_start, other_end in touching:
+            run_start = min(run_start, other_start)
+            run_end = max(run_end, other_end)
+        cursor.executemany('DELETE FROM coverage WHERE field = ? AND run_start = ?',
+                           [(field, other_start) for other_start, _ in touching])
+        cursor.execute('INSERT INTO coverage (field, run_start, run_end) VALUES (?, ?, ?)',
+                       (field, run_start, run_end))
+
+def trim_coverage(cursor, cutoff: str):
+    """Forget coverage from before cutoff (an SQLite time), once the old rows have gone."""
+    cursor.execute('DELETE FROM coverage WHERE run_end < ?', (cutoff,))
+    cursor.execute('UPDATE coverage SET run_start = (SELECT MIN(valid_from) FROM eco '
+                   'WHERE valid_from >= ?) WHERE run_start < ?', (cutoff, cutoff))
+
+def find_gaps(cursor, field: str, since: str = None, max_attempts: int = None) -> list:
+    """Return the holes in a field's data as (first missing slot, last missing slot)
+    pairs of SQLite times. This reads one row per run, not one per slot. Holes
+    which end before since, or which have been fetched max_attempts times without
+    any of them being filled, are left out."""
+    cursor.execute('SELECT run_start, run_end, repair_attempts FROM coverage WHERE field = ? '
+                   'ORDER BY run_start', (field,))
+    runs = cursor.fetchall()
+    return [(shift(previous_end, 1), shift(next_start, -1))
+            for (_, previous_end, _), (next_start, _, attempts) in zip(runs, runs[1:])
+            if (since is None or shift(next_start, -1) >= since)
+            and (max_attempts is None or attempts < max_attempts)]
+
+def record_repair(cursor, field: str, gap_start: str, gap_end: str) -> bool:
+    """After fetching a hole, count it as a failed attempt if none of it has been
+    filled. Returns True if some of it was."""
+    cursor.execute('SELECT 1 FROM eco WHERE valid_from BETWEEN ? AND ? AND ' + field +
+                   ' IS NOT NULL LIMIT 1', (gap_start, gap_end))
+    if cursor.fetchone() is not None:
+        return True
+    cursor.execute('UPDATE coverage SET repair_attempts = repair_attempts + 1 '
+                   'WHERE field = ? AND run_start = ?', (field, shift(gap_end, 1)))
+    return False
@@ -0,0 +1,72 @@
+"""
+Functions for running lots of households' displays from one place, for
+run_households.py: the data is fetched once for each region (and kind of data)
+into a database shared by every household there, and each household's
+pictures are drawn from that
+"""
+
+import os
+import copy
+import eco_targets
+
+# which shared database each mode's data lives in, by what goes after the region
+# in its name. Agile import prices and carbon intensity go in different columns,
+# so they can share one (as they do in agile_carbon mode), but export and Tracker
+# prices would overwrite import prices, so they get their own
+DATABASE_SUFFIXES = {'agile_import': '',
+                     'carbon': '',
+                     'agile_carbon': '',
+                     'agile_export': '_export',
+                     'tracker': '_tracker'}
+
+def database_name(conf: dict) -> str:
+    """The shared database a household's data is in, e.g. B.sqlite, so that
+    render_images.py --data can use the same directory."""
+    return conf['DNORegion'] + DATABASE_SUFFIXES[conf['Mode']] + '.sqlite'
+
+def fetch_mode(modes: set) -> str:
+    """The one mode which fetches everything some households sharing a database need."""
+    if len(modes) == 1:
+        return next(iter(modes))
+    # only agile_import, carbon and agile_carbon share a database
+    return 'agile_carbon'
+
+def group_households(households: list) -> dict:
+    """Sort (name, config) pairs by the database they share. Returns
+    {database name: [(name, config), ...]}, in the order they were given."""
+    groups = {}
+    for name, conf in households:
+        if conf['Mode'] not in DATABASE_SUFFIXES:
+            raise SystemExit('Error: household ' + name + ' has an invalid mode ' + str(conf['Mode']) + '.')
+        groups.setdefault(database_name(conf), []).append((name, conf))
+    return groups
+
+def fetch_conf(households: list, database: str) -> dict:
+    """The config store_data.py fetches a shared database's data with: the first
+    household's, with a mode which covers all of them."""
+    conf = copy.deepcopy(households[0][1])
+    conf.pop('Targets', None)
+    conf['Mode'] = fetch_mode({household_conf['Mode'] for _, household_conf in households})
+    conf['ForecastHistory'] = any(household_conf.get('ForecastHistory') is True
+                                  for _, household_conf in households)
+    conf['Storage'] = {'Database': database}
+    return conf
+
+def household_conf(name: str, conf: dict, database: str) -> dict:
+    """A household's config, set to use the shared database, with each of its targets
+    named after the household so they don't get mixed up with another household's
+    in the database."""
+    conf = copy.deepcopy(conf)
+    conf['Storage'] = {'Database': database}
+    conf['Targets'] = [dict(target, Name=name + ':' + eco_targets.target_name(target))
+                       for target in eco_targets.targets(conf)]
+    return conf
+
+def drawable(conf: dict) -> bool:
+    """True if a household only has png targets: a display has to be updated by
+    the Pi it's plugged into, which can sync from a hub rather than fetch for itself."""
+    return all(target['DisplayType'] == 'png' for target in eco_targets.targets(conf))
+
+def fetch_config_file(data_dir: str, database: str) -> str:
+    """Where the config for fetching a shared database is written."""
+    return os.path.join(data_dir, '.' + os.path.splitext(database)[0] + '.yaml')
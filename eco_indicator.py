@@ -2,7 +2,10 @@
 Functions to support operation of the Blinkt and Inky displays
 """
 
-import yaml
+from math import isnan
+from functools import lru_cache
+import eco_profile
+import eco_daily
 
 # Blinkt! defaults
 DEFAULT_BRIGHTNESS = 10
@@ -12,6 +15,28 @@ DEFAULT_SLOTSPERPIXEL = 1
 DEFAULT_HIGHPRICE = 30.0
 DEFAULT_LOWSLOTDURATION = 3
 DEFAULT_DATADURATION = 24
+DEFAULT_GREENWEIGHT = 0.5
+DEFAULT_COLOURLEVELS = True
+DEFAULT_DITHER = False
+
+# the outputs update_display.py can send to, as Targets in config.yaml
+TARGET_TYPES = ('blinkt', 'inkyphat', 'png')
+
+# Nominal colours of the inks on 7-colour Inky Impression panels, by the name of
+# the palette index constant the Inky library gives each one
+PANEL_COLOURS = {'BLACK': (0, 0, 0),
+                 'WHITE': (255, 255, 255),
+                 'GREEN': (0, 255, 0),
+                 'BLUE': (0, 0, 255),
+                 'RED': (255, 0, 0),
+                 'YELLOW': (255, 255, 0),
+                 'ORANGE': (255, 140, 0)}
+
+# 4x4 ordered dither thresholds
+BAYER_MATRIX = ((0, 8, 2, 10),
+                (12, 4, 14, 6),
+                (3, 11, 1, 9),
+                (15, 7, 13, 5))
 
 def update_blinkt(conf: dict, blinkt_data: dict, demo: bool):
     """Recieve a parsed configuration file and price data from the database,
@@ -50,6 +75,11 @@ def update_blinkt(conf: dict, blinkt_data: dict, demo: bool):
             short_unit = "p"
             data_name = "Export"
 
+        if conf['Mode'] == "agile_carbon":
+            tuple_idx = 1
+            short_unit = "p"
+            data_name = "Price"
+
         if conf['Mode'] == "tracker":
             tuple_idx = 1
             short_unit = "p"
@@ -60,32 +90,22 @@ def update_blinkt(conf: dict, blinkt_data: dict, demo: bool):
 
         print("Displaying " + str(slots_per_pixel) + " slots per Blinkt! pixel.")
 
-        # group data into however many slots we are using per pixel
-        blinkt_data = [blinkt_data[i:i + slots_per_pixel] for i in range(0, len(blinkt_data), slots_per_pixel)]
-
-        # calculate the mean for the grouped data and replace the group with one list item
-        new_data = []
-
-        for group in blinkt_data:
-
-            total_sum = sum(item[tuple_idx] for item in group)
-            mean = round(total_sum / len(group),1)
-
-            first_item = list(group[0])
-            first_item[tuple_idx] = mean
-
-            new_data.append([tuple(first_item)])
-
-        blinkt_data = new_data
+        # group data into however many slots we are using per pixel, each the mean of
+        # its slots - slots missing from the database are left out of the mean
+        blinkt_data = blinkt_data.resample(slots_per_pixel)
 
         if len(blinkt_data) < 8:
             print("Not enough data to fill the display - we will get dark pixels.")
 
         blinkt.clear()
         i = 0
-        for row in blinkt_data:
+        for value in blinkt_data.column(tuple_idx):
+            if isnan(value):
+                print(str(i) + ': no data -> dark')
             for level, data in conf['Blinkt']['Colours'].items():
-                slot_data = row[0][tuple_idx]
+                if isnan(value):
+                    break
+                slot_data = round(value, 1)
                 if slot_data >= data[data_name]:
                     print(str(i) + ': ' + str(slot_data) + short_unit + ' -> ' + data['Name'])
                     blinkt.set_pixel(i, data['R'], data['G'], data['B'],
@@ -99,22 +119,25 @@ def update_blinkt(conf: dict, blinkt_data: dict, demo: bool):
         blinkt.set_clear_on_exit(False)
         blinkt.show()
 
-def update_inky_tracker(conf: dict, inky_data: dict, demo: bool):
+def update_inky_tracker(conf: dict, inky_data: dict, demo: bool, inky_display=None,
+                        push: bool = True, trend: list = None):
     """Recieve a parsed configuration file and price/carbon data from the database,
     as well as a flag indicating demo mode, and then update the Inky
-    display appropriately.
+    display appropriately. Pass a HeadlessInky as inky_display to draw without
+    a display attached; the picture is returned either way. With push=False
+    the picture is only drawn, leaving the display as it is.
 
     Notes: list 'inky_data' as passed from update_display.py is an ordered
     list of tuples. In each tuple, index [0] is the time in SQLite date
     format, index [1] is the electricity price in p/kWh as a float, index [2]
-    is blank as it would be the carbon intensity, and index [3] is the gas price."""
+    is blank as it would be the carbon intensity, and index [3] is the gas price.
+    'trend' is the daily history from eco_daily.trend, drawn as a line graph
+    for each fuel if the display has room for it."""
 
     from datetime import datetime
     from datetime import timedelta
-    from PIL import Image, ImageFont, ImageDraw
+    from PIL import Image, ImageDraw
     from font_roboto import RobotoMedium, RobotoBlack
-    from inky.auto import auto
-    from inky.eeprom import read_eeprom
 
     def price_diff_to_symbol(price_today: float, price_tomorrow: float) -> tuple[str, int]:
 
@@ -137,16 +160,8 @@ def update_inky_tracker(conf: dict, inky_data: dict, demo: bool):
     if demo:
         raise SystemExit("Demo mode not implemented!")
 
-    inky_eeprom = read_eeprom()
-
-    if inky_eeprom is None:
-        raise SystemExit("Error: Inky pHAT display not found")
-
-    try:
-        # detect display type automatically
-        inky_display = auto(ask_user=False, verbose=True)
-    except TypeError as inky_version:
-        raise TypeError("You need to update the Inky library to >= v1.1.0") from inky_version
+    if inky_display is None:
+        inky_display = find_inky()
 
     img = Image.new("P", (inky_display.WIDTH, inky_display.HEIGHT), inky_display.WHITE)
     draw = ImageDraw.Draw(img)
@@ -211,16 +226,17 @@ def update_inky_tracker(conf: dict, inky_data: dict, demo: bool):
 
     # draw info and today's date
 
-    font = ImageFont.truetype(RobotoMedium, size=int(20 * font_scale_factor))
+    font = load_font(RobotoMedium, int(20 * font_scale_factor))
     x_pos = 4 * x_scale_factor
     y_pos = 0 * y_scale_factor
     draw.text((x_pos, y_pos), "Gas", inky_display.BLACK, font)
     x_pos = (inky_display.WIDTH) - (40 * x_scale_factor)
     draw.text((x_pos, y_pos), "Elec", inky_display.BLACK, font)
 
-    font = ImageFont.truetype(RobotoBlack, size=int(15 * font_scale_factor))
+    font = load_font(RobotoBlack, int(15 * font_scale_factor))
     date_string = today.strftime("%a %-d %b")
-    width, height = draw.textsize(date_string, font)
+    left, top, right, bottom = draw.textbbox((0, 0), date_string, font)
+    width = right - left
     x_pos = (inky_display.WIDTH / 2) - (width / 2)
     draw.text((x_pos, y_pos), date_string, inky_display.BLACK, font)
 
@@ -232,7 +248,7 @@ def update_inky_tracker(conf: dict, inky_data: dict, demo: bool):
 
     # draw today's prices
 
-    font = ImageFont.truetype(RobotoBlack, size=int(35 * font_scale_factor))
+    font = load_font(RobotoBlack, int(35 * font_scale_factor))
     x_pos = 4 * x_scale_factor
     y_pos = 20 * y_scale_factor
     draw.text((x_pos, y_pos), "{:.1f}p".format(gas_tracker_price_today), inky_display.RED, font)
@@ -243,7 +259,7 @@ def update_inky_tracker(conf: dict, inky_data: dict, demo: bool):
 
     # draw "Tomorrow" labels
 
-    font = ImageFont.truetype(RobotoMedium, size=int(15 * font_scale_factor))
+    font = load_font(RobotoMedium, int(15 * font_scale_factor))
     x_pos = 4 * x_scale_factor
     y_pos = 60 * y_scale_factor
     draw.text((x_pos, y_pos), "Tomorrow:", inky_display.BLACK, font)
@@ -253,26 +269,26 @@ def update_inky_tracker(conf: dict, inky_data: dict, demo: bool):
     # draw tomorrow's data or draw a placeholder
 
     if check == 1 or check == 3: # we have electricity data for tomorrow
-        font = ImageFont.truetype(RobotoMedium, size=int(20 * font_scale_factor))
+        font = load_font(RobotoMedium, int(20 * font_scale_factor))
         x_pos = inky_display.WIDTH - (95 * x_scale_factor)
         y_pos = 75 * y_scale_factor
         draw.text((x_pos, y_pos), "{:.1f}p".format(elec_tracker_price_tomorrow), inky_display.BLACK, font)
         symbol, colour = price_diff_to_symbol(elec_tracker_price_today, elec_tracker_price_tomorrow)
-        font = ImageFont.truetype(RobotoMedium, size=int(15 * font_scale_factor))
+        font = load_font(RobotoMedium, int(15 * font_scale_factor))
         draw.text((x_pos + 60 * x_scale_factor, y_pos + 3 * y_scale_factor), symbol, colour, font)
         print("Electricity Tracker price tomorrow: {:.2f}p".format(elec_tracker_price_tomorrow))
 
     if check == 2 or check == 3: # we have gas data for tomorrow
-        font = ImageFont.truetype(RobotoMedium, size=int(20 * font_scale_factor))
+        font = load_font(RobotoMedium, int(20 * font_scale_factor))
         x_pos = 4 * x_scale_factor
         y_pos = 75 * y_scale_factor
         draw.text((x_pos, y_pos), "{:.1f}p".format(gas_tracker_price_tomorrow), inky_display.BLACK, font)
         symbol, colour = price_diff_to_symbol(gas_tracker_price_today, gas_tracker_price_tomorrow)
-        font = ImageFont.truetype(RobotoMedium, size=int(15 * font_scale_factor))
+        font = load_font(RobotoMedium, int(15 * font_scale_factor))
         draw.text((x_pos + 60 * x_scale_factor, y_pos + 3 * y_scale_factor), symbol, colour, font)
         print("Gas Tracker price tomorrow: {:.2f}p".format(gas_tracker_price_tomorrow))
 
-    font = ImageFont.truetype(RobotoMedium, size=int(15 * font_scale_factor))
+    font = load_font(RobotoMedium, int(15 * font_scale_factor))
 
     if check == 0 or check == 1: # we don't have gas data for tomorrow
         x_pos = 4 * x_scale_factor
@@ -286,73 +302,41 @@ def update_inky_tracker(conf: dict, inky_data: dict, demo: bool):
         draw.text((x_pos, y_pos), "No data yet.", inky_display.BLACK, font)
         print("No electricity data for tomorrow yet.")
 
+    # the last few weeks, where there's room below the prices
+    if trend:
+        trend = trend[-eco_daily.history_days(conf):]
+        top = 100 * y_scale_factor
+        bottom = inky_display.HEIGHT - 10 * y_scale_factor
+        if bottom - top >= 40 * y_scale_factor:
+            font = load_font(RobotoMedium, int(13 * font_scale_factor))
+            half_width = inky_display.WIDTH / 2
+            # gas on the left, like the prices above
+            for idx, x_pos in ((2, 0), (1, half_width)):
+                draw_sparkline(draw, inky_display, (x_pos + 8 * x_scale_factor, top,
+                                                    x_pos + half_width - 8 * x_scale_factor, bottom),
+                               [day[idx] for day in trend], [day[idx + 2] for day in trend], font)
+            print("Trend drawn for the last " + str(len(trend)) + " days.")
+        else:
+            print("No room for the trend on this display.")
+
     if conf['InkyPHAT']['DisplayOrientation'] == 'inverted':
         img=img.rotate(180)
 
-    inky_display.set_image(img)
-    inky_display.show()
-
-def update_inky(conf: dict, inky_data: dict, demo: bool):
-    """Recieve a parsed configuration file and price/carbon data from the database,
-    as well as a flag indicating demo mode, and then update the Inky
-    display appropriately.
-
-    Notes: list 'inky_data' as passed from update_display.py is an ordered
-    list of tuples. In each tuple, index [0] is the time in SQLite date
-    format and index [1] is the price in p/kWh as a float. index [2] is
-    the carbon intensity as an integer."""
-
-    if demo:
-        raise SystemExit("Demo mode not implemented!")
-
-    from math import ceil
-    from datetime import datetime, timedelta
-    import pytz
-    from tzlocal import get_localzone
-    from PIL import Image, ImageFont, ImageDraw
-    from font_roboto import RobotoMedium, RobotoBlack
-    from inky.auto import auto
-    from inky.eeprom import read_eeprom
-
-    inky_eeprom = read_eeprom()
-
-    if inky_eeprom is None:
-        raise SystemExit("Error: Inky pHAT display not found")
+    if push:
+        inky_display.set_image(img)
+        inky_display.show()
+    return img
 
-    local_tz = get_localzone()
+def inky_stats(conf: dict, inky_data) -> dict:
+    """Work out everything update_inky shows about a SlotSeries which doesn't
+    depend on the display: the value to show and how to format it, the highest
+    and lowest windows and slots, and the average line. It's done once however
+    many displays the data goes to. Estimates past the published data are left
+    out: they're a guide, not something to plan around."""
 
-    try:
-        # detect display type automatically
-        inky_display = auto(ask_user=False, verbose=True)
-    except TypeError as inky_version:
-        raise TypeError("You need to update the Inky library to >= v1.1.0") from inky_version
-    #make an image framebuffer, explicit background colour of white (required for some Inky displays)
-    img = Image.new("P", (inky_display.WIDTH, inky_display.HEIGHT), inky_display.WHITE)
-    draw = ImageDraw.Draw(img)
-
-    # deal with scaling for newer SSD1608 pHATs
-    if inky_display.resolution == (250, 122):
-        font_scale_factor = 1.2
-        x_scale_factor = 1.25
-        y_scale_factor = 1.25
-        graph_x_width = 126 * x_scale_factor
-
-    # original Inky pHAT
-    if inky_display.resolution == (212, 104):
-        font_scale_factor = 1
-        x_scale_factor = 1
-        y_scale_factor = 1
-        graph_x_width = 126 * x_scale_factor
-
-    # Inky Impression 7.3
-    if inky_display.resolution == (800, 480):
-        font_scale_factor = 2
-        x_scale_factor = 3
-        y_scale_factor = 2
-        graph_x_width = 126 * x_scale_factor    
+    from datetime import datetime
 
-    data_duration = conf['InkyPHAT']['DataDuration']
-    graph_x_unit = graph_x_width / (data_duration * 2) # half hour slots!
+    inky_data = inky_data.published()
 
     if conf['Mode'] == "carbon":
         tuple_idx = 2
@@ -376,80 +360,208 @@ def update_inky(conf: dict, inky_data: dict, demo: bool):
         high_value = conf['InkyPHAT']['HighPrice']
         format_str = "{0:.1f}"
 
+    if conf['Mode'] == "agile_carbon":
+        tuple_idx = 1
+        short_unit = "p"
+        descriptor = "Price from "
+        high_value = conf['InkyPHAT']['HighPrice']
+        format_str = "{0:.1f}"
+
     # figure out highest priced slots
     high_slot_duration = conf['InkyPHAT']['LowSlotDuration']
     num_high_slots = int(2 * high_slot_duration)
-    inky_data_only = [slot_data[tuple_idx] for slot_data in inky_data]
-    high_slots_list = []
-    for i in range(0, len(inky_data_only) - num_high_slots - 1):
-        high_slots_list.append(sum(inky_data_only[i:i+num_high_slots])/num_high_slots)
+    # never pick a window with missing slots; the last two windows aren't candidates
+    high_slots_list = inky_data.window_means(tuple_idx, num_high_slots, float('-inf'))[:-2]
     high_slots_start_idx = high_slots_list.index(max(high_slots_list))
     high_slots_average = format_str.format(max(high_slots_list))
 
-    high_slots_start_time = str(datetime.strftime(pytz.utc.localize(
-        datetime.strptime(inky_data[high_slots_start_idx][0], "%Y-%m-%d %H:%M:%S"),
-        is_dst=None).astimezone(local_tz), "%H:%M"))
+    high_slots_start_time = str(datetime.strftime(utc_to_local(
+        inky_data[high_slots_start_idx][0]), "%H:%M"))
 
     print("Highest " + str(high_slot_duration) + " hours: average " +
           high_slots_average + short_unit + "/kWh at " + high_slots_start_time + ".")
 
-    max_slot = max(inky_data, key=lambda inky_data: inky_data[tuple_idx])
-    max_slot_value = str(max_slot[tuple_idx])
-    max_slot_time = str(datetime.strftime(pytz.utc.localize(datetime.strptime(
-        max_slot[0], "%Y-%m-%d %H:%M:%S"), is_dst=None).astimezone(local_tz), "%H:%M"))
+    max_slot = inky_data[inky_data.argmax(tuple_idx)]
+    max_slot_value = format_str.format(max_slot[tuple_idx])
+    max_slot_time = str(datetime.strftime(utc_to_local(max_slot[0]), "%H:%M"))
 
     print("Highest value slot: " + max_slot_value + short_unit + " at " + max_slot_time + ".")
 
     # figure out cheapest/lowest slots
     low_slot_duration = conf['InkyPHAT']['LowSlotDuration']
     num_low_slots = int(2 * low_slot_duration)
-    inky_data_only = [slot_data[tuple_idx] for slot_data in inky_data]
-    low_slots_list = []
-    for i in range(0, len(inky_data_only) - num_low_slots - 1):
-        low_slots_list.append(sum(inky_data_only[i:i+num_low_slots])/num_low_slots)
+    low_slots_list = inky_data.window_means(tuple_idx, num_low_slots, float('inf'))[:-2]
     low_slots_start_idx = low_slots_list.index(min(low_slots_list))
     low_slots_average = format_str.format(min(low_slots_list))
 
-    low_slots_start_time = str(datetime.strftime(pytz.utc.localize(
-        datetime.strptime(inky_data[low_slots_start_idx][0], "%Y-%m-%d %H:%M:%S"),
-        is_dst=None).astimezone(local_tz), "%H:%M"))
+    if conf['Mode'] == "agile_carbon":
+        # the lowest window is the one which is both cheap and green
+        low_slots_start_idx = find_cheap_green_window(inky_data, num_low_slots,
+                                                      conf['InkyPHAT']['GreenWeight'])
+        low_slots_average = format_str.format(
+            sum(inky_data.column(tuple_idx)[low_slots_start_idx:low_slots_start_idx + num_low_slots])
+            / num_low_slots)
+
+    low_slots_start_time = str(datetime.strftime(utc_to_local(
+        inky_data[low_slots_start_idx][0]), "%H:%M"))
 
     print("Lowest " + str(low_slot_duration) + " hours: average " +
           low_slots_average + short_unit + "/kWh at " + low_slots_start_time + ".")
 
-    min_slot = min(inky_data, key=lambda inky_data: inky_data[tuple_idx])
-    min_slot_value = str(min_slot[tuple_idx])
-    min_slot_time = str(datetime.strftime(pytz.utc.localize(datetime.strptime(
-        min_slot[0], "%Y-%m-%d %H:%M:%S"), is_dst=None).astimezone(local_tz), "%H:%M"))
+    min_slot = inky_data[inky_data.argmin(tuple_idx)]
+    min_slot_value = format_str.format(min_slot[tuple_idx])
+    min_slot_time = str(datetime.strftime(utc_to_local(min_slot[0]), "%H:%M"))
 
     print("Lowest value slot: " + min_slot_value + short_unit + " at " + min_slot_time + ".")
 
+    # the average line leaves out the highest 6 slots
+    slot_data_list = sorted(inky_data.known(tuple_idx), reverse=True)
+    del slot_data_list[:6]
+    average_slot_data = sum(slot_data_list) / len(slot_data_list)
+
+    return {'tuple_idx': tuple_idx, 'short_unit': short_unit, 'descriptor': descriptor,
+            'high_value': high_value, 'format_str': format_str,
+            'high_slot_duration': high_slot_duration, 'num_high_slots': num_high_slots,
+            'high_slots_start_idx': high_slots_start_idx,
+            'high_slots_average': high_slots_average, 'high_slots_start_time': high_slots_start_time,
+            'max_slot': max_slot, 'max_slot_value': max_slot_value, 'max_slot_time': max_slot_time,
+            'low_slot_duration': low_slot_duration, 'num_low_slots': num_low_slots,
+            'low_slots_start_idx': low_slots_start_idx,
+            'low_slots_average': low_slots_average, 'low_slots_start_time': low_slots_start_time,
+            'min_slot': min_slot, 'min_slot_value': min_slot_value, 'min_slot_time': min_slot_time,
+            'average_slot_data': average_slot_data}
+
+def update_inky(conf: dict, inky_data: dict, demo: bool, inky_display=None, stats: dict = None,
+                push: bool = True):
+    """Recieve a parsed configuration file and price/carbon data from the database,
+    as well as a flag indicating demo mode, and then update the Inky
+    display appropriately. Pass a HeadlessInky as inky_display to draw without
+    a display attached; the picture is returned either way. Pass the result of
+    inky_stats to save working it out again, and push=False to only draw the
+    picture, leaving the display as it is.
+
+    Notes: 'inky_data' as passed from update_display.py is an aligned
+    SlotSeries (see eco_series.py). Each row is a tuple: index [0] is the
+    time in SQLite date format and index [1] is the price in p/kWh as a float.
+    index [2] is the carbon intensity. In agile_carbon mode both are present
+    and the carbon intensity is drawn as dots over the price graph.
+    There is one row per half hour slot; slots missing from the database
+    have None for their values (NaN in the columns) and are left blank on the graph."""
+
+    if demo:
+        raise SystemExit("Demo mode not implemented!")
+
+    eco_profile.lap() # time the sections from here, if asked to
+
+    from math import ceil
+    from datetime import datetime, timedelta, timezone
+    from PIL import Image, ImageDraw
+    from font_roboto import RobotoMedium, RobotoBlack
+
+    if inky_display is None:
+        inky_display = find_inky()
+
+    #make an image framebuffer, explicit background colour of white (required for some Inky displays)
+    img = Image.new("P", (inky_display.WIDTH, inky_display.HEIGHT), inky_display.WHITE)
+    draw = ImageDraw.Draw(img)
+
+    # on 7-colour panels, draw straight in the panel's own palette indices so
+    # the driver has nothing to convert, and use the colours for the levels
+    palette = panel_palette(inky_display)
+    if palette is not None:
+        img.putpalette(palette_image_data(palette))
+    colour_levels = palette is not None and conf['InkyPHAT']['ColourLevels'] and \
+        deep_get(conf, ['Blinkt', 'Colours']) is not None
+    dither = conf['InkyPHAT']['Dither']
+
+    # deal with scaling for newer SSD1608 pHATs
+    if inky_display.resolution == (250, 122):
+        font_scale_factor = 1.2
+        x_scale_factor = 1.25
+        y_scale_factor = 1.25
+        graph_x_width = 126 * x_scale_factor
+
+    # original Inky pHAT
+    if inky_display.resolution == (212, 104):
+        font_scale_factor = 1
+        x_scale_factor = 1
+        y_scale_factor = 1
+        graph_x_width = 126 * x_scale_factor
+
+    # Inky Impression 7.3
+    if inky_display.resolution == (800, 480):
+        font_scale_factor = 2
+        x_scale_factor = 3
+        y_scale_factor = 2
+        graph_x_width = 126 * x_scale_factor    
+
+    data_duration = conf['InkyPHAT']['DataDuration']
+    graph_x_unit = graph_x_width / (data_duration * 2) # half hour slots!
+
+    if colour_levels:
+        # thresholds for the Blinkt!-style levels, highest first as in config.yaml
+        level_name = "Carbon" if conf['Mode'] == "carbon" else "Price"
+        levels = [(data[level_name], (data['R'], data['G'], data['B']))
+                  for data in conf['Blinkt']['Colours'].values()]
+
+    eco_profile.lap('setup')
+
+    if stats is None:
+        stats = inky_stats(conf, inky_data)
+    tuple_idx = stats['tuple_idx']
+    short_unit = stats['short_unit']
+    descriptor = stats['descriptor']
+    high_value = stats['high_value']
+    format_str = stats['format_str']
+    high_slot_duration = stats['high_slot_duration']
+    num_high_slots = stats['num_high_slots']
+    high_slots_start_idx = stats['high_slots_start_idx']
+    high_slots_average = stats['high_slots_average']
+    high_slots_start_time = stats['high_slots_start_time']
+    low_slot_duration = stats['low_slot_duration']
+    num_low_slots = stats['num_low_slots']
+    low_slots_start_idx = stats['low_slots_start_idx']
+    low_slots_average = stats['low_slots_average']
+    low_slots_start_time = stats['low_slots_start_time']
+    min_slot = stats['min_slot']
+
+    eco_profile.lap('stats')
+
     # draw current price, in colour if it's high...
     # also highlight display with a coloured border if current price is high
-    font = ImageFont.truetype(RobotoBlack, size=int(45 * font_scale_factor))
+    font = load_font(RobotoBlack, int(45 * font_scale_factor))
     message = format_str.format(inky_data[0][tuple_idx]) + short_unit
     x_pos = 4 * x_scale_factor
     y_pos = 8 * y_scale_factor
 
-    slot_start = str(datetime.strftime(pytz.utc.localize(datetime.strptime(
-        inky_data[0][0], "%Y-%m-%d %H:%M:%S"), is_dst=None).astimezone(
-            local_tz), "%H:%M"))
+    slot_start = str(datetime.strftime(utc_to_local(inky_data[0][0]), "%H:%M"))
 
     if inky_data[0][tuple_idx] > high_value:
         draw.text((x_pos, y_pos), message, inky_display.RED, font)
         inky_display.set_border(inky_display.RED)
         print("Current value from " + slot_start + ": " + message + " (High)")
+    elif colour_levels:
+        # no dithering on text, it just goes fuzzy
+        colour = panel_colour_mix(level_colour(levels, inky_data[0][tuple_idx]), palette)[0]
+        draw.text((x_pos, y_pos), message, colour, font)
+        inky_display.set_border(inky_display.WHITE)
+        print("Current value from " + slot_start + ": " + message)
     else:
         draw.text((x_pos, y_pos), message, inky_display.BLACK, font)
         inky_display.set_border(inky_display.WHITE)
         print("Current value from " + slot_start + ": " + message)
 
+    eco_profile.lap('text')
+
     # scale the y-axis
-    selected_inky_data = inky_data[:data_duration*2]
-    max_slot = max(selected_inky_data, key=lambda selected_inky_data: selected_inky_data[tuple_idx])
-    max_slot_value = max_slot[tuple_idx]
+    selected_inky_data = inky_data[:data_duration*2] # a view, not a copy
+    max_slot_value = max(selected_inky_data.known(tuple_idx))
     graph_y_unit = (inky_display.HEIGHT / 2.5) / max_slot_value
 
+    if conf['Mode'] == "agile_carbon":
+        max_carbon_value = max(selected_inky_data.known(2))
+        graph_carbon_unit = (inky_display.HEIGHT / 2.5) / max_carbon_value
+
     # draw graph solid bars...
     # shift axis for negative prices
     if min_slot[tuple_idx] < 0:
@@ -465,7 +577,20 @@ def update_inky(conf: dict, inky_data: dict, demo: bool):
         if (i + 1) * graph_x_unit > 127 * x_scale_factor:
             break # don't scribble on the small text
 
-        if conf['Mode'] == "agile_import" or conf['Mode'] == "carbon":
+        if slot_data[tuple_idx] is None:
+            i += 1
+            continue # a gap in the data, leave a gap in the graph
+
+        if inky_data.is_estimated(i):
+            # not published yet, just a dotted line at the usual value for this
+            # time of the week so it can't be taken for a real one
+            bar_top = graph_bottom - slot_data[tuple_idx] * graph_y_unit
+            for x_pos in range(int(i * graph_x_unit), int((i + 1) * graph_x_unit), 2):
+                draw.point((x_pos, bar_top), inky_display.BLACK)
+            i += 1
+            continue
+
+        if conf['Mode'] in ("agile_import", "carbon", "agile_carbon"):
             if low_slots_start_idx <= i < low_slots_start_idx + num_low_slots:
                 colour = inky_display.BLACK
             elif slot_data[tuple_idx] > high_value:
@@ -493,26 +618,44 @@ def update_inky(conf: dict, inky_data: dict, demo: bool):
         if y1 < y0:
             y0, y1 = y1, y0
 
-        draw.rectangle([x0, y0, x1, y1], colour)
+        if colour_levels and colour != inky_display.BLACK:
+            # the lowest slots stay black, everything else gets its level colour
+            mix = panel_colour_mix(level_colour(levels, slot_data[tuple_idx]), palette)
+            if dither:
+                fill_dithered(draw, [x0, y0, x1, y1], mix)
+            else:
+                draw.rectangle([x0, y0, x1, y1], mix[0])
+        else:
+            draw.rectangle([x0, y0, x1, y1], colour)
+
+        if conf['Mode'] == "agile_carbon":
+            # carbon as dots on its own scale, white on the black bars so they still show
+            dot_y = graph_bottom - slot_data[2] * graph_carbon_unit
+            dot_x = (i + 0.5) * graph_x_unit
+            dot_colour = inky_display.WHITE if colour == inky_display.BLACK else inky_display.BLACK
+            draw.rectangle([dot_x - y_scale_factor, dot_y - y_scale_factor,
+                            dot_x + y_scale_factor, dot_y + y_scale_factor], dot_colour)
 
         i += 1
         # graph solid bars finished
 
+    eco_profile.lap('bars')
+
     # draw time info above current price...
-    font = ImageFont.truetype(RobotoMedium, size=int(15 * font_scale_factor))
+    font = load_font(RobotoMedium, int(15 * font_scale_factor))
     message = descriptor + slot_start + "    " # trailing spaces prevent text clipping
     x_pos = 4 * x_scale_factor
     y_pos = 0 * y_scale_factor
     draw.text((x_pos, y_pos), message, inky_display.BLACK, font)
 
-    mins_until_next_slot = ceil((pytz.utc.localize(datetime.strptime(
-        inky_data[1][0], "%Y-%m-%d %H:%M:%S"), is_dst=None) - datetime.now(
-            pytz.timezone("UTC"))).total_seconds() / 60)
+    mins_until_next_slot = ceil((datetime.strptime(
+        inky_data[1][0], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc) - datetime.now(
+            timezone.utc)).total_seconds() / 60)
 
     print(str(mins_until_next_slot) + " mins until next slot.")
 
     # draw next 3 slot times...
-    font = ImageFont.truetype(RobotoMedium, size=int(15 * font_scale_factor))
+    font = load_font(RobotoMedium, int(15 * font_scale_factor))
     x_pos = 130 * x_scale_factor
     for i in range(3):
         message = "+" + str(mins_until_next_slot + (i * 30)) + ":    "
@@ -523,10 +666,13 @@ def update_inky(conf: dict, inky_data: dict, demo: bool):
     # draw next 3 slot prices...
     x_pos = 163 * x_scale_factor
     for i in range(3):
-        message = format_str.format(inky_data[i+1][tuple_idx]) + short_unit + "    "
+        if inky_data[i+1][tuple_idx] is None:
+            message = "--    "
+        else:
+            message = format_str.format(inky_data[i+1][tuple_idx]) + short_unit + "    "
         # trailing spaces prevent text clipping
         y_pos = i * 18 * y_scale_factor + 3 * y_scale_factor
-        if inky_data[i+1][tuple_idx] > high_value:
+        if inky_data[i+1][tuple_idx] is not None and inky_data[i+1][tuple_idx] > high_value:
             draw.text((x_pos, y_pos), message, inky_display.RED, font)
         else:
             draw.text((x_pos, y_pos), message, inky_display.BLACK, font)
@@ -539,11 +685,11 @@ def update_inky(conf: dict, inky_data: dict, demo: bool):
     # draw lowest slots info...
     x_pos = 130 * x_scale_factor
     y_pos = 10 * y_scale_factor + (3 * 18 * y_scale_factor)
-    font = ImageFont.truetype(RobotoMedium, size=int(13 * font_scale_factor))
+    font = load_font(RobotoMedium, int(13 * font_scale_factor))
 
 
 
-    if conf['Mode'] == "agile_import" or conf['Mode'] == "carbon":
+    if conf['Mode'] in ("agile_import", "carbon", "agile_carbon"):
         if '.' in str(low_slot_duration):
             lsd_text = str(low_slot_duration).rstrip('0').rstrip('.')
         else:
@@ -563,7 +709,7 @@ def update_inky(conf: dict, inky_data: dict, demo: bool):
                       str(min_slot_timedelta.total_seconds() / 3600) +
                       "h    ", inky_display.BLACK, font)
         else:
-            font = ImageFont.truetype(RobotoMedium, size=int(16 * font_scale_factor))
+            font = load_font(RobotoMedium, int(16 * font_scale_factor))
             draw.text((x_pos, y_pos), "NOW!", inky_display.RED, font)
 
     if conf['Mode'] == "agile_export":
@@ -593,27 +739,33 @@ def update_inky(conf: dict, inky_data: dict, demo: bool):
                       str(max_slot_timedelta.total_seconds() / 3600) +
                       "h    ", inky_display.BLACK, font)
         else:
-            font = ImageFont.truetype(RobotoMedium, size=int(16 * font_scale_factor))
+            font = load_font(RobotoMedium, int(16 * font_scale_factor))
             draw.text((x_pos, y_pos), "NOW!", inky_display.RED, font)
 
+    eco_profile.lap('text')
+
     # draw graph outline (last so it's over the top of everything else)
-    i = 0
-    for i, slot_data in enumerate(inky_data):
+    values = inky_data.column(tuple_idx)
+    for i, value in enumerate(values):
         colour = inky_display.BLACK
-        bar_y_height = slot_data[tuple_idx] * graph_y_unit
-        prev_bar_y_height = inky_data[i-1][tuple_idx] * graph_y_unit
 
         if (i + 1) * graph_x_unit > 127 * x_scale_factor: # don't scribble on the small text
             break
 
+        if isnan(value) or inky_data.is_estimated(i):
+            continue # a gap in the data, or an estimate, no outline
+
+        bar_y_height = value * graph_y_unit
+
         # horizontal lines...
         draw.line(((i + 1) * graph_x_unit, graph_bottom - bar_y_height,
                    ((i + 1) * graph_x_unit) - graph_x_unit,
                    graph_bottom - bar_y_height), colour)
 
         # vertical lines...
-        if i == 0: # skip the first vertical line
+        if i == 0 or isnan(values[i-1]): # skip the first one, and after gaps
             continue
+        prev_bar_y_height = values[i-1] * graph_y_unit
         draw.line((i * graph_x_unit, graph_bottom - bar_y_height,
                    i * graph_x_unit, graph_bottom - prev_bar_y_height), colour)
 
@@ -625,7 +777,7 @@ def update_inky(conf: dict, inky_data: dict, demo: bool):
     # draw graph hour marker text... XXX FIXME XXX
     for i in range(2, data_duration, ceil(data_duration / 8)):
         colour = inky_display.BLACK
-        font = ImageFont.truetype(RobotoMedium, size=int(10 * font_scale_factor))
+        font = load_font(RobotoMedium, int(10 * font_scale_factor))
         x_pos = i * graph_x_unit * 2 # it's half hour slots!!
         hours = datetime.strftime(datetime.now() + timedelta(hours=i), "%H")
         _, _, hours_w, hours_h = font.getbbox(hours) # we want to centre the labels
@@ -638,26 +790,215 @@ def update_inky(conf: dict, inky_data: dict, demo: bool):
                   inky_display.BLACK)
 
     # draw average line...
-    # extract just values from the list of tuples and put in descending order
-    slot_data_list = sorted(list(zip(*inky_data))[tuple_idx], reverse=True)
-    # now slice off the first (highest) 6 entries
-    del slot_data_list[:6]
-    # and calculate the mean
-    average_slot_data = sum(slot_data_list) / len(slot_data_list)
-
-    average_line_ypos = graph_bottom - average_slot_data * graph_y_unit
+    average_line_ypos = graph_bottom - stats['average_slot_data'] * graph_y_unit
 
     for x_pos in range(0, int(126 * x_scale_factor)):
         if x_pos % 6 == 2: # repeat every 6 pixels starting at 2
             draw.line((x_pos, average_line_ypos, x_pos + 2, average_line_ypos),
                       inky_display.BLACK)
 
+    eco_profile.lap('outline')
+
     # Flip orientation if option is set
     if conf['InkyPHAT']['DisplayOrientation'] == 'inverted':
         img=img.rotate(180)
 
-    inky_display.set_image(img)
-    inky_display.show()
+    if push:
+        inky_display.set_image(img)
+        inky_display.show()
+    return img
+
+def find_inky():
+    """Detect the Inky display attached to this Pi, or bail out if there isn't one."""
+    from inky.auto import auto
+    from inky.eeprom import read_eeprom
+
+    inky_eeprom = read_eeprom()
+
+    if inky_eeprom is None:
+        raise SystemExit("Error: Inky pHAT display not found")
+
+    try:
+        # detect display type automatically
+        return auto(ask_user=False, verbose=True)
+    except TypeError as inky_version:
+        raise TypeError("You need to update the Inky library to >= v1.1.0") from inky_version
+
+@lru_cache(maxsize=None)
+def load_font(font_file: str, size: int):
+    """Load a font at a size, once - each picture uses the same handful."""
+    from PIL import ImageFont
+
+    return ImageFont.truetype(font_file, size=size)
+
+class HeadlessInky:
+    """Stands in for an Inky display, with the same resolution and palette
+    indices, so pictures can be drawn (and saved) with no display attached."""
+
+    # the three sizes update_inky knows how to lay out
+    RESOLUTIONS = ((212, 104), (250, 122), (800, 480))
+
+    def __init__(self, resolution: tuple, colour: str = 'red'):
+        self.resolution = tuple(resolution)
+        self.WIDTH, self.HEIGHT = self.resolution # pylint: disable=invalid-name
+        if self.resolution == (800, 480):
+            # Inky Impression 7.3, the 7-colour panel
+            for index, name in enumerate(('BLACK', 'WHITE', 'GREEN', 'BLUE',
+                                          'RED', 'YELLOW', 'ORANGE')):
+                setattr(self, name, index)
+            self.palette = panel_palette(self)
+        else:
+            # pHATs are black, white and one of red or yellow, which share an index
+            self.WHITE, self.BLACK, self.RED, self.YELLOW = 0, 1, 2, 2 # pylint: disable=invalid-name
+            self.palette = ((0, PANEL_COLOURS['WHITE']), (1, PANEL_COLOURS['BLACK']),
+                            (2, PANEL_COLOURS['YELLOW' if colour == 'yellow' else 'RED']))
+        self.border = self.WHITE
+        self.image = None
+
+    def set_border(self, colour: int):
+        """Remember the border colour."""
+        self.border = colour
+
+    def set_image(self, image):
+        """Keep the picture, in colour so it can be saved as it would look."""
+        self.image = image.copy()
+        self.image.putpalette(palette_image_data(self.palette))
+
+    def show(self):
+        """Nothing to refresh."""
+
+def utc_to_local(sqlite_time: str):
+    """Convert a UTC time in SQLite date format to a local datetime. The standard
+    library knows the local timezone already, so this saves loading pytz and tzlocal."""
+    from datetime import datetime, timezone
+
+    return datetime.strptime(sqlite_time, "%Y-%m-%d %H:%M:%S").replace(
+        tzinfo=timezone.utc).astimezone()
+
+def db_uri(filename: str, mode: str) -> str:
+    """Build the URI to open an SQLite database file in a particular mode ('ro', 'rw'...).
+    This is what urllib.request.pathname2url does on Linux, but importing that
+    pulls in most of the HTTP and SSL libraries, which we don't need just for this."""
+    from urllib.parse import quote
+
+    return 'file:{}?mode={}'.format(quote(filename), mode)
+
+def find_cheap_green_window(data_rows, num_slots: int, green_weight: float) -> int:
+    """Receive a SlotSeries with prices and carbon intensities and return the index of the start of the window of num_slots slots which is
+    cheapest and greenest together. Each series is scaled to 0..1 over the data,
+    then weighted (green_weight of 1 means carbon only, 0 means price only), and
+    the windows are scored with a running sum in one pass over the slots.
+    Windows with a missing slot (NaN) are never chosen."""
+
+    from array import array
+    from eco_series import window_means
+
+    prices = data_rows.column(1)
+    carbons = data_rows.column(2)
+    known = [i for i in range(len(prices)) if not (isnan(prices[i]) or isnan(carbons[i]))]
+    price_low = min(prices[i] for i in known)
+    price_span = (max(prices[i] for i in known) - price_low) or 1
+    carbon_low = min(carbons[i] for i in known)
+    carbon_span = (max(carbons[i] for i in known) - carbon_low) or 1
+
+    # NaN in either gives a NaN score, which rules out every window it's in
+    scores = array('d', ((1 - green_weight) * (price - price_low) / price_span +
+                         green_weight * (carbon - carbon_low) / carbon_span
+                         for price, carbon in zip(prices, carbons)))
+    means = window_means(scores, num_slots, float('inf'))
+    return means.index(min(means)) if means else 0
+
+def panel_palette(inky_display) -> tuple:
+    """Return the palette of a 7-colour panel as a tuple of (index, (R, G, B))
+    pairs, or None if the display only has the usual black/white/red(/yellow)."""
+    if not all(hasattr(inky_display, name) for name in PANEL_COLOURS):
+        return None
+    return tuple((getattr(inky_display, name), rgb) for name, rgb in PANEL_COLOURS.items())
+
+def palette_image_data(palette: tuple) -> list:
+    """Flatten a panel palette into the list Image.putpalette() wants, so that
+    the frame looks right if it is ever saved or shown anywhere else."""
+    data = [0, 0, 0] * (max(index for index, _ in palette) + 1)
+    for index, rgb in palette:
+        data[index * 3:index * 3 + 3] = rgb
+    return data
+
+def level_colour(levels: list, value: float) -> tuple:
+    """Receive (threshold, (R, G, B)) levels, highest first, and return the colour
+    for this value the same way the Blinkt! does."""
+    for threshold, rgb in levels:
+        if value >= threshold:
+            return rgb
+    return levels[-1][1]
+
+@lru_cache(maxsize=None)
+def panel_colour_mix(rgb: tuple, palette: tuple) -> tuple:
+    """Match an (R, G, B) colour to the panel's inks. Returns the nearest ink, the
+    next nearest, and how much of the second should be mixed in (0 to 1) to get
+    closer to the colour when dithering. There are only a handful of level colours,
+    so this is cached rather than worked out for every bar on every refresh."""
+    def distance(ink):
+        return sum((a - b) ** 2 for a, b in zip(rgb, ink[1]))
+
+    nearest, second = sorted(palette, key=distance)[:2]
+
+    # how far along the line from the nearest ink to the second our colour lies
+    span = [b - a for a, b in zip(nearest[1], second[1])]
+    offset = [c - a for a, c in zip(nearest[1], rgb)]
+    length = sum(d * d for d in span)
+    fraction = sum(o * d for o, d in zip(offset, span)) / length if length else 0
+    return nearest[0], second[0], min(max(fraction, 0), 0.5)
+
+def fill_dithered(draw, box: list, mix: tuple):
+    """Fill a rectangle with an ordered dither of the two inks in 'mix'."""
+    primary, secondary, fraction = mix
+    draw.rectangle(box, primary)
+    threshold = fraction * 16
+    if threshold < 1:
+        return
+    x0, y0, x1, y1 = (int(round(coord)) for coord in box)
+    points = [(x, y) for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)
+              if BAYER_MATRIX[y % 4][x % 4] < threshold]
+    draw.point(points, secondary)
+
+def draw_sparkline(draw, inky_display, box: tuple, values: list, averages: list, font):
+    """Draw daily prices as a line graph in box (left, top, right, bottom): the
+    prices in black with gaps for missing days, their rolling average in red,
+    and the highest and lowest days marked and labelled."""
+    known = [value for value in values if value is not None]
+    if len(known) < 2:
+        return
+    left, top, right, bottom = box
+    highest, lowest = max(known), min(known)
+    span = (highest - lowest) or 1
+    text_height = draw.textbbox((0, 0), "0p", font)[3]
+    graph_top = top + text_height + 4
+    graph_bottom = bottom - text_height - 4
+    x_unit = (right - left) / (len(values) - 1)
+
+    def point(idx: int, value: float) -> tuple:
+        return (left + idx * x_unit, graph_bottom - (value - lowest) / span * (graph_bottom - graph_top))
+
+    for series, colour, width in ((averages, inky_display.RED, 1), (values, inky_display.BLACK, 2)):
+        run = []
+        for idx, value in enumerate(series + [None]):
+            if value is not None:
+                run.append(point(idx, value))
+                continue
+            if len(run) > 1:
+                draw.line(run, fill=colour, width=width)
+            run = []
+
+    # the extremes, labelled above the highest and below the lowest
+    marker = max(2, int((right - left) / 100))
+    for value, colour, y_text in ((highest, inky_display.RED, top), (lowest, inky_display.BLACK,
+                                                                     bottom - text_height)):
+        x_pos, y_pos = point(values.index(value), value)
+        draw.rectangle((x_pos - marker, y_pos - marker, x_pos + marker, y_pos + marker), colour)
+        label = "{:.1f}p".format(value)
+        width = draw.textbbox((0, 0), label, font)[2]
+        x_text = min(max(x_pos - width / 2, left), right - width)
+        draw.text((x_text, y_text), label, colour, font)
 
 def clear_display(conf: dict):
     """Determine what type of display is connected and
@@ -716,6 +1057,8 @@ def get_config(filename: str) -> dict:
     Read config file and do some basic checks that we have what we need.
     If not, set sensible defaults or bail out.
     """
+    import yaml
+
     try:
         config_file = open(filename, 'r')
     except FileNotFoundError as no_config:
@@ -729,7 +1072,18 @@ def get_config(filename: str) -> dict:
     if 'DisplayType' not in _config:
         raise SystemExit('Error: DisplayType not found in ' + filename)
 
-    if _config['DisplayType'] == 'blinkt':
+    if _config['DisplayType'] not in ('blinkt', 'inkyphat'):
+        raise SystemExit('Error: unknown DisplayType ' + _config['DisplayType'] + ' in ' + filename)
+
+    # every kind of output in use, so each one's settings get checked
+    display_types = {_config['DisplayType']}
+    for target in _config.get('Targets') or []:
+        if not isinstance(target, dict) or target.get('DisplayType') not in TARGET_TYPES:
+            raise SystemExit('Error: each of the Targets in ' + filename + ' needs a DisplayType of ' +
+                             ', '.join(TARGET_TYPES) + ', not ' + str(target))
+        display_types.add(target['DisplayType'])
+
+    if 'blinkt' in display_types:
         print('Blinkt! display selected.')
 
         conf_brightness = deep_get(_config, ['Blinkt', 'Brightness'])
@@ -747,7 +1101,7 @@ def get_config(filename: str) -> dict:
         if len(_config['Blinkt']['Colours'].items()) < 2:
             raise SystemExit('Error: Less than two colour levels found in ' + filename)
 
-    elif _config['DisplayType'] == 'inkyphat':
+    if 'inkyphat' in display_types or 'png' in display_types:
         print('Inky pHAT display selected.')
 
         if 'DisplayOrientation' not in _config['InkyPHAT']:
@@ -781,8 +1135,21 @@ def get_config(filename: str) -> dict:
                   ' Using default of ' + str(DEFAULT_DATADURATION) + '.')
             _config['InkyPHAT']['DataDuration'] = DEFAULT_DATADURATION
 
-    else:
-        raise SystemExit('Error: unknown DisplayType ' + _config['DisplayType'] + ' in ' + filename)
+        conf_colourlevels = deep_get(_config, ['InkyPHAT', 'ColourLevels'])
+        if not isinstance(conf_colourlevels, bool):
+            _config['InkyPHAT']['ColourLevels'] = DEFAULT_COLOURLEVELS
+
+        conf_dither = deep_get(_config, ['InkyPHAT', 'Dither'])
+        if not isinstance(conf_dither, bool):
+            _config['InkyPHAT']['Dither'] = DEFAULT_DITHER
+
+        conf_greenweight = deep_get(_config, ['InkyPHAT', 'GreenWeight'])
+        if not (isinstance(conf_greenweight, (int, float)) and 0 <= conf_greenweight <= 1):
+            if _config.get('Mode') == 'agile_carbon':
+                print('Green weight misconfigured: ' + str(conf_greenweight) +
+                      ' (must be between 0 and 1).' +
+                      ' Using default of ' + str(DEFAULT_GREENWEIGHT) + '.')
+            _config['InkyPHAT']['GreenWeight'] = DEFAULT_GREENWEIGHT
 
     if 'Mode' not in _config:
         raise SystemExit('Error: Mode not found in ' + filename)
@@ -793,6 +1160,8 @@ def get_config(filename: str) -> dict:
         print('Working in Octopus Agile export mode.')
     elif _config['Mode'] == 'carbon':
         print('Working in carbon intensity mode.')
+    elif _config['Mode'] == 'agile_carbon':
+        print('Working in combined Octopus Agile import and carbon intensity mode.')
     elif _config['Mode'] == 'tracker':
         print('Working in Octopus Tracker mode.')
     else:
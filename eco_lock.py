@@ -0,0 +1,117 @@
+"""
+Functions to stop the scripts treading on each other when cron starts them
+close together: one of each job at a time with at most one more waiting its
+turn, update_display.py waiting for store_data.py to finish writing, and one
+thing at a time talking to the display
+"""
+
+import os
+import sys
+import time
+import fcntl
+from contextlib import contextmanager
+import eco_storage
+
+JOB_TIMEOUT = 20 * 60 # seconds to wait for the previous run of the same job
+DATABASE_TIMEOUT = 10 * 60 # seconds update_display.py waits for store_data.py
+DISPLAY_TIMEOUT = 2 * 60 # seconds to wait for the display
+STALE_AFTER = 30 * 60 # a lock held longer than this is probably held by a stuck process
+POLL_INTERVAL = 0.5 # seconds
+
+# locks held until the script exits, so they aren't closed (and released) early
+_held = []
+
+def lock_file(conf: dict, name: str) -> str:
+    """Lock files live next to the working database. A shared database has its own,
+    named after it, as there are others in the same directory."""
+    if eco_storage.shared_database(conf):
+        directory, database = os.path.split(os.path.abspath(eco_storage.shared_database(conf)))
+        return os.path.join(directory, '.' + os.path.splitext(database)[0] + '.' + name + '.lock')
+    directory = eco_storage.working_dir(conf) or os.path.abspath(sys.path[0])
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, '.' + name + '.lock')
+
+def describe_holder(path: str) -> str:
+    """Who holds a lock and for how long, from what they wrote in it, and whether
+    that looks like a stuck process rather than a slow one."""
+    try:
+        with open(path) as lock:
+            pid, script, started = lock.read().split()
+        pid = int(pid)
+        held_for = time.time() - float(started)
+    except (OSError, ValueError):
+        return 'another process'
+    description = script + ' (pid ' + str(pid) + ', for {:.0f}s)'.format(held_for)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return description + ', which has gone - but its lock is still held by a process it started'
+    except PermissionError:
+        pass # it's there, just not ours
+    if held_for > STALE_AFTER:
+        description += ', which looks stuck'
+    return description
+
+def acquire(path: str, exclusive: bool = True, timeout: float = 0):
+    """Lock a file, waiting up to timeout seconds. Returns the open file descriptor,
+    which holds the lock until it's closed (or the process ends, however it ends -
+    so a crash or a power cut can't leave a stale lock behind), or None if the
+    lock couldn't be had in time."""
+    lock_fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+    deadline = time.monotonic() + timeout
+    told = False
+    while True:
+        try:
+            fcntl.flock(lock_fd, (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB)
+            break
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                os.close(lock_fd)
+                return None
+            if not told and timeout >= 1:
+                print('Waiting for ' + describe_holder(path) + '...')
+                told = True
+            time.sleep(POLL_INTERVAL)
+    if exclusive:
+        # say who we are, for anyone left waiting
+        os.ftruncate(lock_fd, 0)
+        os.write(lock_fd, (str(os.getpid()) + ' ' + os.path.basename(sys.argv[0]) + ' ' +
+                           str(time.time())).encode())
+    return lock_fd
+
+def run_alone(conf: dict, job: str, timeout: float = JOB_TIMEOUT):
+    """Make this the only run of a job, until the script exits. If one is already
+    running, wait for it - but if another is already waiting too, give up, as
+    cron is starting them faster than they finish and they'd only pile up."""
+    queue_fd = acquire(lock_file(conf, job + '-queue'))
+    if queue_fd is None:
+        raise SystemExit('Another ' + job + ' is already waiting to run, not queueing behind it.')
+    try:
+        job_fd = acquire(lock_file(conf, job), timeout=timeout)
+    finally:
+        os.close(queue_fd)
+    if job_fd is None:
+        raise SystemExit('Error: gave up waiting for ' + describe_holder(lock_file(conf, job)) + '.')
+    _held.append(job_fd)
+
+def hold_database(conf: dict, writing: bool, timeout: float = DATABASE_TIMEOUT):
+    """Until the script exits, hold the database for writing (store_data.py, which
+    can take a while when the APIs are slow) or reading (which waits for the
+    writer to finish, so the display shows the new data)."""
+    path = lock_file(conf, 'database')
+    lock_fd = acquire(path, exclusive=writing, timeout=timeout)
+    if lock_fd is None:
+        raise SystemExit('Error: gave up waiting for the database, held by ' + describe_holder(path) + '.')
+    _held.append(lock_fd)
+
+@contextmanager
+def display(conf: dict, timeout: float = DISPLAY_TIMEOUT):
+    """Hold the display hardware while updating or clearing it."""
+    path = lock_file(conf, 'display')
+    lock_fd = acquire(path, timeout=timeout)
+    if lock_fd is None:
+        raise SystemExit('Error: gave up waiting for the display, in use by ' + describe_holder(path) + '.')
+    try:
+        yield
+    finally:
+        os.close(lock_fd)
@@ -0,0 +1,161 @@
+"""
+Functions to keep the database tidy, run by maintain_db.py once a day rather
+than on every fetch: deleting data older than the configured retention a batch
+at a time, handing the freed space back, refreshing the query planner's
+statistics and checkpointing the WAL, all within a time budget
+"""
+
+import time
+from datetime import datetime, timedelta, timezone
+import eco_gaps
+import eco_sync
+import eco_polling
+
+SQLITE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+DEFAULT_RETENTION_DAYS = 3
+DEFAULT_BUDGET = 10 # seconds
+OVERDUE_DAYS = 2 # store_data.py prunes a little itself if maintenance hasn't run for this long
+FALLBACK_BUDGET = 2 # seconds store_data.py spends on it
+BATCH_SIZE = 500 # rows deleted per transaction, so the database is never locked for long
+VACUUM_PAGES = 100 # pages handed back per step
+ANALYSIS_LIMIT = 400 # rows ANALYZE looks at per index, which is plenty to plan with
+
+# the tables which grow with time: (the time their rows are pruned by, their keys,
+# so old rows can be deleted in batches, and the fewest days of them to keep)
+PRUNED_TABLES = {'eco': ('valid_from', ('valid_from',), 0),
+                 'forecast_history': ('valid_from', ('field', 'valid_from', 'revised_at'), 0),
+                 # a row every run, and polling learns from the last LEARNING_DAYS of them
+                 'fetch_log': ('fetched_at', ('rowid',), eco_polling.LEARNING_DAYS)}
+
+def retention_days(conf: dict) -> int:
+    """How many days of past data to keep in this mode, from Retention in the config."""
+    days = (conf.get('Retention') or {}).get(conf['Mode'], DEFAULT_RETENTION_DAYS)
+    if not (isinstance(days, int) and days > 0):
+        print('Retention for ' + conf['Mode'] + ' misconfigured: ' + str(days) +
+              '. Using default of ' + str(DEFAULT_RETENTION_DAYS) + ' days.')
+        days = DEFAULT_RETENTION_DAYS
+    return days
+
+def create_maintenance_state(cursor):
+    """Make sure the table of when each maintenance task last finished exists."""
+    cursor.execute('CREATE TABLE IF NOT EXISTS maintenance_state (task STRING PRIMARY KEY, done_at STRING)')
+
+def record_done(cursor, task: str):
+    """Remember that a task has just finished."""
+    cursor.execute('INSERT OR REPLACE INTO maintenance_state VALUES (?, ?)',
+                   (task, datetime.now(timezone.utc).strftime(SQLITE_FORMAT)))
+
+def overdue(cursor) -> bool:
+    """True if old data hasn't been pruned for OVERDUE_DAYS."""
+    cursor.execute('SELECT done_at FROM maintenance_state WHERE task = ?', ('prune',))
+    last = cursor.fetchone()
+    return last is None or last[0] < (datetime.now(timezone.utc) -
+                                      timedelta(days=OVERDUE_DAYS)).strftime(SQLITE_FORMAT)
+
+def table_exists(cursor, table: str) -> bool:
+    """True if the database has this table (not every mode and setting makes them all)."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    return cursor.fetchone() is not None
+
+def prune(conn, conf: dict, deadline: float) -> bool:
+    """Delete rows from before the retention period, BATCH_SIZE at a time, each batch
+    in its own transaction, until they're all gone or time.monotonic() passes the
+    deadline. Returns True if they're all gone."""
+    cursor = conn.cursor()
+    days = retention_days(conf)
+    cursor.execute("SELECT datetime('now', ?)", ('-' + str(days) + ' days',))
+    cutoff = cursor.fetchone()[0]
+
+    for table, (time_column, keys, min_days) in PRUNED_TABLES.items():
+        if not table_exists(cursor, table):
+            continue
+        cursor.execute("SELECT datetime('now', ?)", ('-' + str(max(days, min_days)) + ' days',))
+        table_cutoff = cursor.fetchone()[0]
+        key_list = ', '.join(keys)
+        deleted = 0
+        while True:
+            cursor.execute('DELETE FROM ' + table + ' WHERE (' + key_list + ') IN (SELECT ' + key_list +
+                           ' FROM ' + table + ' WHERE ' + time_column + ' < ? ORDER BY ' + time_column +
+                           ' LIMIT ?)', (table_cutoff, BATCH_SIZE))
+            conn.commit()
+            deleted += cursor.rowcount
+            if cursor.rowcount < BATCH_SIZE:
+                break
+            if time.monotonic() >= deadline:
+                print(str(deleted) + ' old rows deleted from ' + table + ', out of time for the rest.')
+                return False
+        if deleted:
+            print(str(deleted) + ' rows from before ' + table_cutoff + ' deleted from ' + table + '.')
+
+    # the bookkeeping for the rows that have gone
+    if table_exists(cursor, 'coverage'):
+        eco_gaps.trim_coverage(cursor, cutoff)
+    if table_exists(cursor, 'eco_changes'):
+        eco_sync.trim_change_feed(cursor, cutoff)
+    record_done(cursor, 'prune')
+    conn.commit()
+    return True
+
+def vacuum(conn, deadline: float) -> bool:
+    """Hand the pages freed by pruning back to the filesystem, a few at a time, so
+    the file doesn't stay at its biggest or fill up with holes over months. The
+    first time, switch the database to incremental vacuuming, which takes one
+    full VACUUM. Returns True if there's nothing left to hand back."""
+    cursor = conn.cursor()
+    conn.commit()
+    cursor.execute('PRAGMA auto_vacuum')
+    if cursor.fetchone()[0] != 2:
+        print('Switching the database to incremental vacuuming, this only happens once...')
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        cursor.execute('VACUUM')
+        return True
+
+    cursor.execute('PRAGMA freelist_count')
+    free_pages = start_pages = cursor.fetchone()[0]
+    while free_pages and time.monotonic() < deadline:
+        # executescript, as execute would only hand back one page
+        conn.executescript('PRAGMA incremental_vacuum(' + str(VACUUM_PAGES) + ');')
+        cursor.execute('PRAGMA freelist_count')
+        free_pages = cursor.fetchone()[0]
+    if start_pages != free_pages:
+        print(str(start_pages - free_pages) + ' free pages handed back.')
+    return free_pages == 0
+
+def analyze(conn):
+    """Refresh the statistics the query planner uses, looking at a sample of each index."""
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA analysis_limit = ' + str(ANALYSIS_LIMIT))
+    cursor.execute('ANALYZE')
+    record_done(cursor, 'analyze')
+    conn.commit()
+
+def checkpoint(conn):
+    """If the database is in WAL mode, copy the WAL back into it and empty it, so it
+    doesn't keep growing when there are always readers."""
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA journal_mode')
+    if cursor.fetchone()[0] != 'wal':
+        return
+    cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    busy, _, _ = cursor.fetchone()
+    if busy:
+        print('WAL checkpoint incomplete, a reader was busy.')
+
+def maintain(conn, conf: dict, budget: float = DEFAULT_BUDGET) -> bool:
+    """Do as much maintenance as fits into budget seconds, most important first.
+    Returns True if it all got done."""
+    deadline = time.monotonic() + budget
+    create_maintenance_state(conn.cursor())
+
+    if not prune(conn, conf, deadline):
+        return False
+    if not vacuum(conn, deadline):
+        print('Out of time for handing back free pages, the rest next time.')
+        return False
+    if time.monotonic() >= deadline:
+        print('Out of time before ANALYZE, next time.')
+        return False
+    analyze(conn)
+    checkpoint(conn)
+    return True
@@ -0,0 +1,137 @@
+"""
+Functions to decide when it's worth asking Octopus for tomorrow's Agile prices,
+learning when they are usually published from how previous fetches went
+"""
+
+from datetime import datetime, timedelta, timezone
+
+SQLITE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+POLLED_MODES = ('agile_import', 'agile_export')
+
+DEFAULT_PUBLISH_TIME = 16 * 60 # minutes after local midnight, until we know better
+LEARNING_DAYS = 14 # how far back to look at previous fetches
+WINDOW_BEFORE = 20 # minutes before the expected time to start polling hard
+WINDOW_AFTER = 40 # minutes after the expected time to stop polling hard
+POLL_INTERVAL = 5 # minutes, should match how often cron runs us
+MAX_BACKOFF = 60 # minutes, the longest we'll wait between attempts
+
+def create_fetch_log(cursor):
+    """Make sure the table of fetch outcomes exists, indexed for should_fetch,
+    which looks at one mode's recent fetches on every poll."""
+    cursor.execute('CREATE TABLE IF NOT EXISTS fetch_log (fetched_at STRING, mode STRING, '
+                   'latest_slot STRING, rows INTEGER)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS fetch_log_mode_time ON fetch_log (mode, fetched_at)')
+
+def record_fetch(cursor, mode: str, rows: int, now: datetime = None):
+    """Remember when we fetched, how many rows were new or changed, and how far the data
+    in the database now reaches."""
+    if now is None:
+        now = datetime.now(timezone.utc)
+
+    create_fetch_log(cursor)
+    cursor.execute("SELECT MAX(valid_from) FROM eco")
+    latest_slot = cursor.fetchone()[0]
+    cursor.execute('INSERT INTO fetch_log VALUES (?, ?, ?, ?)',
+                   (now.strftime(SQLITE_FORMAT), mode, latest_slot, rows))
+
+def last_slot_of_day(day) -> str:
+    """The start of the last half hour slot of a local day, as a UTC SQLite time."""
+    last_slot = datetime(day.year, day.month, day.day, 23, 30).astimezone()
+    return last_slot.astimezone(timezone.utc).strftime(SQLITE_FORMAT)
+
+def to_local(sqlite_time: str) -> datetime:
+    """A UTC SQLite time as a local datetime."""
+    return datetime.strptime(sqlite_time, SQLITE_FORMAT).replace(tzinfo=timezone.utc).astimezone()
+
+def minutes_after_midnight(local_time: datetime) -> float:
+    """How far into its day a local datetime is."""
+    return local_time.hour * 60 + local_time.minute + local_time.second / 60
+
+def expected_publish_time(attempts: list) -> float:
+    """Receive (fetched_at, latest_slot) rows in time order and estimate when
+    tomorrow's prices usually appear, in minutes after local midnight. For each
+    day, the first fetch which found the next day's prices is a hit; if an earlier
+    fetch that day missed them, they were published somewhere in between."""
+    from statistics import median
+
+    bracketed = []
+    unbracketed = []
+    by_day = {}
+    for fetched_at, latest_slot in attempts:
+        local_time = to_local(fetched_at)
+        by_day.setdefault(local_time.date(), []).append((local_time, latest_slot))
+
+    for day, day_attempts in by_day.items():
+        target = last_slot_of_day(day + timedelta(days=1))
+        last_miss = None
+        for local_time, latest_slot in day_attempts:
+            if latest_slot is not None and latest_slot >= target:
+                if last_miss is None:
+                    unbracketed.append(minutes_after_midnight(local_time))
+                else:
+                    bracketed.append((minutes_after_midnight(last_miss) +
+                                      minutes_after_midnight(local_time)) / 2)
+                break
+            last_miss = local_time
+
+    if bracketed:
+        return median(bracketed)
+    if unbracketed:
+        return median(unbracketed)
+    return DEFAULT_PUBLISH_TIME
+
+def should_fetch(cursor, mode: str, now: datetime = None) -> tuple:
+    """Decide whether to call the API on this run. Returns a flag and the reason,
+    so the log shows why we did or didn't bother."""
+    if mode not in POLLED_MODES:
+        return True, 'not polling in ' + mode + ' mode'
+
+    if now is None:
+        now = datetime.now(timezone.utc)
+    now_local = now.astimezone()
+    today = now_local.date()
+
+    cursor.execute("SELECT MAX(valid_from) FROM eco WHERE value_inc_vat IS NOT NULL")
+    latest_slot = cursor.fetchone()[0]
+
+    if latest_slot is not None and latest_slot >= last_slot_of_day(today + timedelta(days=1)):
+        return False, "we already have tomorrow's prices"
+
+    create_fetch_log(cursor)
+    since = (now - timedelta(days=LEARNING_DAYS)).strftime(SQLITE_FORMAT)
+    cursor.execute('SELECT fetched_at, latest_slot FROM fetch_log WHERE mode = ? '
+                   'AND fetched_at >= ? ORDER BY fetched_at', (mode, since))
+    attempts = cursor.fetchall()
+
+    expected = expected_publish_time(attempts)
+    window_start = expected - WINDOW_BEFORE
+    window_end = expected + WINDOW_AFTER
+    now_minutes = minutes_after_midnight(now_local)
+    expected_text = '{:02.0f}:{:02.0f}'.format(*divmod(round(expected), 60))
+
+    if window_start <= now_minutes <= window_end:
+        return True, 'prices are usually published around ' + expected_text
+
+    if attempts:
+        minutes_since_attempt = (now_local - to_local(attempts[-1][0])).total_seconds() / 60
+    else:
+        minutes_since_attempt = None
+
+    if now_minutes < window_start:
+        # too early for tomorrow's prices, only worth trying if we're missing today's
+        have_today = latest_slot is not None and latest_slot >= last_slot_of_day(today)
+        if have_today:
+            return False, 'too early, prices are usually published around ' + expected_text
+        if minutes_since_attempt is None or minutes_since_attempt >= MAX_BACKOFF:
+            return True, "we don't even have all of today's prices"
+        return False, "missing today's prices, but we tried recently"
+
+    # late: back off exponentially for each miss since the window closed
+    window_end_utc = (now_local.replace(hour=0, minute=0, second=0, microsecond=0) +
+                      timedelta(minutes=window_end)).astimezone(timezone.utc).strftime(SQLITE_FORMAT)
+    misses = sum(1 for fetched_at, _ in attempts if fetched_at > window_end_utc)
+    backoff = min(POLL_INTERVAL * 2 ** misses, MAX_BACKOFF)
+    if minutes_since_attempt is None or minutes_since_attempt >= backoff:
+        return True, 'prices are late, trying again after ' + str(misses) + ' misses'
+    return False, 'prices are late, backing off for ' + str(backoff) + ' minutes'
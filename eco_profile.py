@@ -0,0 +1,140 @@
+"""
+Profiling for the scripts, switched on from the command line so a slow Pi in
+the field can be profiled without changing any code: cProfile (pstats file),
+a sampling profiler (collapsed stacks, for flamegraph.pl or speedscope) and
+named section timers in the drawing code
+"""
+
+import os
+import sys
+import time
+import atexit
+import threading
+from collections import Counter
+
+SAMPLE_INTERVAL = 0.005 # seconds between samples
+
+# seconds spent in each named section, or None when not timing sections
+_sections = None
+_last_lap = 0.0
+# where profiles are written, worked out before the script changes directory
+_output_dir = None
+
+def add_arguments(parser):
+    """Add the profiling options to a script's argument parser."""
+    parser.add_argument('--profile', nargs='?', const='cprofile', choices=['cprofile', 'sample'],
+                        help='profile the run and write a .pstats file (or with sample, a .collapsed '
+                             'stack file) next to the log')
+    parser.add_argument('--profile-dir', metavar='DIR',
+                        help='directory to write profiles to (default: the one the output is going to, '
+                             'if it is going to a file, otherwise the one the script was run from)')
+    parser.add_argument('--profile-sections', action='store_true',
+                        help='print how long each part of drawing the display takes')
+
+def output_dir(args) -> str:
+    """The directory to write profiles to: --profile-dir, or next to the log when
+    the output is going to a file (as it is from cron), or where the script was
+    run from. Never the scripts' own directory, unless that's one of those."""
+    if args.profile_dir:
+        return os.path.abspath(args.profile_dir)
+    try:
+        log = os.path.realpath('/proc/self/fd/1')
+        if os.path.isfile(log):
+            return os.path.dirname(log)
+    except OSError:
+        pass
+    return os.getcwd()
+
+def output_file(name: str, extension: str) -> str:
+    """Where to write a profile, named after the script and when it ran."""
+    os.makedirs(_output_dir, exist_ok=True)
+    return os.path.join(_output_dir, name + '-' + time.strftime('%Y%m%d-%H%M%S') + extension)
+
+class Sampler(threading.Thread):
+    """Take a sample of the main thread's stack every so often, counting how many
+    times each stack was seen. Waits (for the network, the database or the
+    display) show up as well as work, which is what makes a Pi seem slow."""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.target_id = threading.main_thread().ident
+        self.stacks = Counter()
+        self.stopping = threading.Event()
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            frame = sys._current_frames().get(self.target_id) # pylint: disable=protected-access
+            stack = []
+            while frame is not None:
+                stack.append(os.path.basename(frame.f_code.co_filename) + ':' + frame.f_code.co_name)
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def write(self, filename: str):
+        """Stop sampling and write the stacks, one 'outer;...;inner count' line each."""
+        self.stopping.set()
+        self.join()
+        with open(filename, 'w') as collapsed:
+            for stack, count in self.stacks.most_common():
+                collapsed.write(stack + ' ' + str(count) + '\n')
+
+def start(args, name: str):
+    """Start whatever profiling the command line asked for. The results are written
+    (or printed) when the script exits, however it exits. Call it before the
+    script changes directory."""
+    global _sections, _last_lap, _output_dir # pylint: disable=global-statement
+
+    if args.profile_sections:
+        _sections = {}
+        _last_lap = time.perf_counter()
+        atexit.register(print_sections)
+
+    if args.profile:
+        _output_dir = output_dir(args)
+
+    if args.profile == 'cprofile':
+        import cProfile
+
+        profiler = cProfile.Profile()
+
+        def write_stats():
+            profiler.disable()
+            filename = output_file(name, '.pstats')
+            profiler.dump_stats(filename)
+            print('Profile written to ' + filename + ' (view it with python3 -m pstats).')
+
+        atexit.register(write_stats)
+        profiler.enable()
+
+    elif args.profile == 'sample':
+        sampler = Sampler()
+
+        def write_samples():
+            filename = output_file(name, '.collapsed')
+            sampler.write(filename)
+            print('Profile written to ' + filename + ' (' + str(sum(sampler.stacks.values())) +
+                  ' samples, view it with flamegraph.pl or speedscope).')
+
+        atexit.register(write_samples)
+        sampler.start()
+
+def lap(name: str = None):
+    """Mark the end of a named section of work, which is timed from the end of the
+    one before. With no name, just start timing from now. Does nothing unless
+    section timing is on, so it's cheap to leave in."""
+    global _last_lap # pylint: disable=global-statement
+    if _sections is None:
+        return
+    now = time.perf_counter()
+    if name is not None:
+        _sections[name] = _sections.get(name, 0.0) + now - _last_lap
+    _last_lap = now
+
+def print_sections():
+    """Print the time spent in each section, in the order they first ended."""
+    if _sections:
+        print('Section times: ' + ', '.join(name + ' {:.1f}ms'.format(seconds * 1000)
+                                            for name, seconds in _sections.items()) +
+              ' (total {:.1f}ms).'.format(sum(_sections.values()) * 1000))
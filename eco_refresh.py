@@ -0,0 +1,112 @@
+"""
+Functions to decide whether the Inky is worth refreshing on this run, from a
+summary of what it would show rather than by drawing it: not more often than
+every so often, not for small changes, not during quiet hours, but always
+when the value moves into a different colour level or past the high price
+"""
+
+from datetime import datetime, timezone
+
+SQLITE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+DEFAULT_MIN_MINUTES = 0
+DEFAULT_MAX_MINUTES = 180 # refresh at least this often, or the graph goes stale
+DEFAULT_MIN_CHANGE = 0.0
+
+def refresh_policy(conf: dict):
+    """Read InkyPHAT: Refresh from the config, checking it as we go. Returns None
+    (refresh every time, as before) if there isn't one."""
+    settings = (conf.get('InkyPHAT') or {}).get('Refresh')
+    if not settings:
+        return None
+
+    policy = {}
+    for key, default in (('MinMinutes', DEFAULT_MIN_MINUTES), ('MaxMinutes', DEFAULT_MAX_MINUTES),
+                         ('MinChange', DEFAULT_MIN_CHANGE)):
+        value = settings.get(key, default)
+        if not (isinstance(value, (int, float)) and value >= 0):
+            print('Refresh ' + key + ' misconfigured: ' + str(value) +
+                  '. Using default of ' + str(default) + '.')
+            value = default
+        policy[key] = value
+
+    policy['QuietHours'] = None
+    if settings.get('QuietHours'):
+        try:
+            start, end = (datetime.strptime(time.strip(), '%H:%M')
+                          for time in str(settings['QuietHours']).split('-'))
+        except ValueError:
+            print('Refresh QuietHours misconfigured: ' + str(settings['QuietHours']) +
+                  ' (must look like "23:00-06:30"). Not using quiet hours.')
+        else:
+            policy['QuietHours'] = (start.hour * 60 + start.minute, end.hour * 60 + end.minute)
+    return policy
+
+def in_quiet_hours(quiet_hours: tuple, now_local: datetime) -> bool:
+    """True if the local time is within (start, end) minutes after midnight, which
+    can run over midnight."""
+    start, end = quiet_hours
+    minutes = now_local.hour * 60 + now_local.minute
+    if start <= end:
+        return start <= minutes < end
+    return minutes >= start or minutes < end
+
+def summarise(conf: dict, data_rows, stats: dict) -> dict:
+    """The parts of what update_inky would draw which decide whether it's worth a
+    refresh: the current value, and which side of each threshold it's on (colour
+    level, high value, and whether we're in the lowest or highest window now)."""
+    value = data_rows[0][stats['tuple_idx']]
+    level = None
+    colours = (conf.get('Blinkt') or {}).get('Colours')
+    if colours:
+        level_name = "Carbon" if conf['Mode'] == "carbon" else "Price"
+        thresholds = [data[level_name] for data in colours.values()]
+        level = next((idx for idx, threshold in enumerate(thresholds) if value >= threshold),
+                     len(thresholds) - 1)
+    band = '/'.join(str(part) for part in (level, value > stats['high_value'],
+                                           stats['low_slots_start_idx'] == 0,
+                                           stats['high_slots_start_idx'] == 0))
+    return {'value': value, 'band': band}
+
+def create_refresh_state(cursor):
+    """Make sure the table of when each display was last refreshed exists."""
+    cursor.execute('CREATE TABLE IF NOT EXISTS refresh_state (target STRING PRIMARY KEY, '
+                   'refreshed_at STRING, value REAL, band STRING)')
+
+def last_refresh(cursor, name: str):
+    """(refreshed_at, value, band) from the last refresh of a display, or None."""
+    cursor.execute('SELECT refreshed_at, value, band FROM refresh_state WHERE target = ?', (name,))
+    return cursor.fetchone()
+
+def record_refresh(cursor, name: str, summary: dict, now: datetime = None):
+    """Remember what a display was refreshed with, and when."""
+    if now is None:
+        now = datetime.now(timezone.utc)
+    cursor.execute('INSERT OR REPLACE INTO refresh_state VALUES (?, ?, ?, ?)',
+                   (name, now.strftime(SQLITE_FORMAT), summary['value'], summary['band']))
+
+def should_refresh(policy: dict, summary: dict, last: tuple, now: datetime = None) -> tuple:
+    """Decide whether to refresh the display on this run. Returns a flag and the
+    reason, so the log shows why we did or didn't."""
+    if now is None:
+        now = datetime.now(timezone.utc)
+
+    if policy['QuietHours'] is not None and in_quiet_hours(policy['QuietHours'], now.astimezone()):
+        return False, 'quiet hours'
+
+    if last is None:
+        return True, 'not refreshed before'
+    refreshed_at, last_value, last_band = last
+
+    if summary['band'] != last_band:
+        return True, 'the value crossed a threshold'
+
+    minutes = (now - datetime.strptime(refreshed_at, SQLITE_FORMAT).replace(
+        tzinfo=timezone.utc)).total_seconds() / 60
+    if minutes >= policy['MaxMinutes']:
+        return True, 'last refreshed {:.0f} minutes ago'.format(minutes)
+    if minutes < policy['MinMinutes']:
+        return False, 'refreshed only {:.0f} minutes ago'.format(minutes)
+    if abs(summary['value'] - last_value) < policy['MinChange']:
+        return False, 'the value has only changed by {:.2f}'.format(summary['value'] - last_value)
+    return True, 'the value has changed by {:.2f}'.format(summary['value'] - last_value)
@@ -0,0 +1,91 @@
+"""
+Functions for drawing Inky pictures to PNG files rather than a display, used by
+render_images.py to make pictures for lots of regions and modes at once
+"""
+
+import os
+import io
+import time
+import sqlite3
+from contextlib import redirect_stdout
+import eco_indicator
+import eco_series
+import eco_daily
+
+# the font sizes used by update_inky and update_inky_tracker, before scaling
+FONT_SIZES = {'RobotoMedium': (10, 13, 15, 16, 20), 'RobotoBlack': (15, 35, 45)}
+FONT_SCALES = (1, 1.2, 2)
+
+def load_region(db_file: str) -> tuple:
+    """Read everything any mode could want from one region's database, in one go:
+    the slots from the current one on, and for Tracker the last two days and the
+    daily history."""
+    db_uri = eco_indicator.db_uri(db_file, 'ro')
+    try:
+        conn = sqlite3.connect(db_uri, uri=True)
+    except sqlite3.OperationalError as error:
+        raise SystemExit('Database ' + db_file + ' not found - you need to run store_data.py first.') from error
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM eco WHERE valid_from > datetime('now', '-30 minutes') "
+                       "ORDER BY valid_from")
+        upcoming = cursor.fetchall()
+        try:
+            latest_days = eco_daily.latest(cursor)
+            trend = eco_daily.trend(cursor)
+        except sqlite3.OperationalError:
+            # no daily history in this database (yet), so no trend either
+            cursor.execute("SELECT * FROM eco ORDER BY valid_from DESC")
+            latest_days = eco_series.SlotSeries.from_rows(cursor)
+            trend = None
+    finally:
+        conn.close()
+    return upcoming, latest_days, trend
+
+def rows_for_mode(region_data: tuple, mode: str) -> eco_series.SlotSeries:
+    """Pick out the rows update_display.py would have read for this mode."""
+    upcoming, latest_days, _ = region_data
+    if mode == 'tracker':
+        return latest_days
+    if mode == 'agile_carbon':
+        rows = [row for row in upcoming if row[1] is not None and row[2] is not None]
+    elif mode == 'carbon':
+        rows = [row for row in upcoming if row[2] is not None]
+    else:
+        rows = [row for row in upcoming if row[1] is not None]
+    return eco_series.SlotSeries.from_rows(rows, aligned=True)
+
+def preload_fonts():
+    """Load every font the pictures use, once per worker process, so no picture
+    pays for it."""
+    from font_roboto import RobotoMedium, RobotoBlack
+
+    font_files = {'RobotoMedium': RobotoMedium, 'RobotoBlack': RobotoBlack}
+    for name, sizes in FONT_SIZES.items():
+        for size in sizes:
+            for scale in FONT_SCALES:
+                eco_indicator.load_font(font_files[name], int(size * scale))
+
+def save_atomically(img, out_file: str):
+    """Write a PNG next to where it's going and rename it into place, so a web
+    server never sends half a picture."""
+    partial = out_file + '.partial'
+    img.save(partial, format='PNG', optimize=False)
+    os.replace(partial, out_file)
+
+def render(conf: dict, rows: eco_series.SlotSeries, resolution: tuple, colour: str, out_file: str,
+           trend: list = None) -> tuple:
+    """Draw one picture and save it. Returns (out_file, seconds taken, error or None).
+    Runs in a worker process, so it mustn't raise - and its chatter is thrown away."""
+    start = time.perf_counter()
+    display = eco_indicator.HeadlessInky(resolution, colour)
+    try:
+        with redirect_stdout(io.StringIO()):
+            if conf['Mode'] == 'tracker':
+                eco_indicator.update_inky_tracker(conf, rows, False, display, trend=trend)
+            else:
+                eco_indicator.update_inky(conf, rows, False, display)
+        save_atomically(display.image, out_file)
+    except (Exception, SystemExit) as error: # pylint: disable=broad-except
+        return out_file, time.perf_counter() - start, str(error) or type(error).__name__
+    return out_file, time.perf_counter() - start, None
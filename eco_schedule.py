@@ -0,0 +1,240 @@
+"""
+Functions to find the cheapest (or greenest) times to run appliances, using the
+half-hourly data stored by store_data.py
+"""
+
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+
+SLOT_LENGTH = timedelta(minutes=30)
+SQLITE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# appliance defaults
+DEFAULT_POWER = 1.0 # kW
+MAX_GROUP_SIZE = 10 # the group solver is exponential in this, keep it sane
+
+OBJECTIVES = {'cost': ('value_inc_vat', 'p'),
+              'carbon': ('intensity', 'g')}
+
+INFINITY = float('inf')
+
+def parse_appliances(appliances: dict) -> list:
+    """Receive the Appliances section of a parsed configuration file, check it
+    over and return a list of appliance dicts with defaults filled in. Bail out
+    if an appliance can't be scheduled at all."""
+
+    if not appliances:
+        raise SystemExit('Error: no appliances configured.')
+
+    parsed = []
+    for name, settings in appliances.items():
+        settings = settings or {}
+
+        duration = settings.get('Duration')
+        if not (isinstance(duration, (int, float)) and duration % 0.5 == 0 and duration > 0):
+            raise SystemExit('Error: appliance ' + str(name) + ' has a bad Duration: ' +
+                             str(duration) + ' (must be a whole number of half hours).')
+        num_slots = int(duration * 2)
+
+        profile = settings.get('Profile')
+        if profile is None:
+            power = settings.get('Power', DEFAULT_POWER)
+            if not (isinstance(power, (int, float)) and power > 0):
+                print('Misconfigured power for ' + str(name) + ': ' + str(power) +
+                      '. Using default of ' + str(DEFAULT_POWER) + 'kW.')
+                power = DEFAULT_POWER
+        else:
+            if not (isinstance(profile, list) and len(profile) == num_slots and
+                    all(isinstance(kw, (int, float)) and kw >= 0 for kw in profile)):
+                raise SystemExit('Error: appliance ' + str(name) + ' needs a Profile of ' +
+                                 str(num_slots) + ' non-negative kW values, one per half hour.')
+            power = None
+
+        deadline = settings.get('Deadline')
+        if deadline is not None:
+            try:
+                deadline = datetime.strptime(str(deadline), "%H:%M").time()
+            except ValueError as bad_time:
+                raise SystemExit('Error: appliance ' + str(name) + ' has a bad Deadline: ' +
+                                 str(deadline) + ' (must be HH:MM).') from bad_time
+
+        parsed.append({'Name': str(name),
+                       'Slots': num_slots,
+                       'Power': power,
+                       'Profile': profile,
+                       'Deadline': deadline,
+                       'Group': settings.get('Group')})
+
+    return parsed
+
+def deadline_to_slots(deadline, first_slot: datetime, now: datetime) -> int:
+    """Turn a local wall clock deadline into the number of slots (counted from
+    first_slot, a naive UTC datetime) which must all have finished by then.
+    The deadline is the next time the clock reads that time after 'now'."""
+
+    now_local = now.astimezone()
+    deadline_local = now_local.replace(hour=deadline.hour, minute=deadline.minute,
+                                       second=0, microsecond=0)
+    if deadline_local <= now_local:
+        deadline_local += timedelta(days=1)
+
+    deadline_utc = deadline_local.astimezone(timezone.utc).replace(tzinfo=None)
+    return max(int((deadline_utc - first_slot) // SLOT_LENGTH), 0)
+
+def contiguous_values(data_rows: list) -> tuple:
+    """Receive (valid_from, value) rows in time order and return the start time
+    and the values of the unbroken run of half hour slots at the front. We can't
+    schedule across a hole in the data, so the horizon stops at the first gap."""
+
+    first_slot = datetime.strptime(data_rows[0][0], SQLITE_FORMAT)
+    values = []
+    expected = first_slot
+    for valid_from, value in data_rows:
+        if value is None or datetime.strptime(valid_from, SQLITE_FORMAT) != expected:
+            break
+        values.append(value)
+        expected += SLOT_LENGTH
+
+    return first_slot, values
+
+def start_costs(values: list, appliance: dict, last_end: int) -> list:
+    """Return the cost of starting the appliance in each slot of 'values'.
+    Starts which would run past last_end (the deadline or the end of the data)
+    cost infinity. Flat loads use prefix sums so this is O(slots) however
+    long the appliance runs; profiled loads are a sliding dot product."""
+
+    num_slots = appliance['Slots']
+    costs = [INFINITY] * len(values)
+    last_start = min(last_end, len(values)) - num_slots
+
+    if appliance['Profile'] is None:
+        energy = appliance['Power'] / 2 # kWh per half hour
+        prefix = [0.0] + list(accumulate(values))
+        for start in range(0, last_start + 1):
+            costs[start] = energy * (prefix[start + num_slots] - prefix[start])
+    else:
+        energy = [kw / 2 for kw in appliance['Profile']]
+        for start in range(0, last_start + 1):
+            costs[start] = sum(kwh * value for kwh, value
+                               in zip(energy, values[start:start + num_slots]))
+
+    return costs
+
+def solve_group(costs: list, lengths: list) -> tuple:
+    """Place a group of mutually exclusive appliances so that none of them overlap
+    and the total cost is lowest. Dynamic programming over (slot, set of appliances
+    already placed), so O(slots * 2^appliances * appliances). Returns the total cost
+    and a start slot for each appliance, or (INFINITY, None) if they don't fit."""
+
+    num_appliances = len(lengths)
+    num_slots = len(costs[0])
+    full = (1 << num_appliances) - 1
+
+    # best[t][mask]: lowest cost with everything in mask finished by slot t
+    best = [[INFINITY] * (full + 1) for _ in range(num_slots + 1)]
+    came_from = [[None] * (full + 1) for _ in range(num_slots + 1)]
+    best[0][0] = 0.0
+
+    for slot in range(num_slots):
+        for mask in range(full + 1):
+            here = best[slot][mask]
+            if here == INFINITY:
+                continue
+
+            # leave this slot empty
+            if here < best[slot + 1][mask]:
+                best[slot + 1][mask] = here
+                came_from[slot + 1][mask] = (slot, mask, None)
+
+            # or start an appliance we haven't placed yet
+            for appliance in range(num_appliances):
+                bit = 1 << appliance
+                if mask & bit or costs[appliance][slot] == INFINITY:
+                    continue
+                end = slot + lengths[appliance]
+                total = here + costs[appliance][slot]
+                if total < best[end][mask | bit]:
+                    best[end][mask | bit] = total
+                    came_from[end][mask | bit] = (slot, mask, appliance)
+
+    if best[num_slots][full] == INFINITY:
+        return INFINITY, None
+
+    starts = [None] * num_appliances
+    slot, mask = num_slots, full
+    while came_from[slot][mask] is not None:
+        slot, mask, appliance = came_from[slot][mask]
+        if appliance is not None:
+            starts[appliance] = slot
+
+    return best[num_slots][full], starts
+
+def plan_schedule(appliances: list, data_rows: list, now: datetime = None) -> list:
+    """Receive parsed appliances and (valid_from, value) rows from the database,
+    starting with the current slot, and return the best plan as a list of dicts
+    with the appliance name, start and end (naive UTC datetimes) and total cost."""
+
+    if now is None:
+        now = datetime.now(timezone.utc)
+
+    if len(data_rows) == 0:
+        raise SystemExit('Error: No data found - perhaps you need to run store_data.py.')
+
+    first_slot, values = contiguous_values(data_rows)
+    print('Planning over ' + str(len(values) / 2) + ' hours of data.')
+
+    costs = []
+    for appliance in appliances:
+        if appliance['Deadline'] is None:
+            last_end = len(values)
+        else:
+            last_end = deadline_to_slots(appliance['Deadline'], first_slot, now)
+        costs.append(start_costs(values, appliance, last_end))
+
+    groups = {}
+    for idx, appliance in enumerate(appliances):
+        # appliances without a group are independent, so each is a group of one
+        key = appliance['Group'] if appliance['Group'] is not None else ('', idx)
+        groups.setdefault(key, []).append(idx)
+
+    plan = []
+    for key, members in groups.items():
+        if len(members) > MAX_GROUP_SIZE:
+            raise SystemExit('Error: group ' + str(key) + ' has more than ' +
+                             str(MAX_GROUP_SIZE) + ' appliances.')
+
+        if len(members) == 1:
+            member_costs = costs[members[0]]
+            best_cost = min(member_costs)
+            starts = [member_costs.index(best_cost)] if best_cost != INFINITY else None
+        else:
+            best_cost, starts = solve_group([costs[idx] for idx in members],
+                                            [appliances[idx]['Slots'] for idx in members])
+
+        if starts is None:
+            names = ', '.join(appliances[idx]['Name'] for idx in members)
+            raise SystemExit('Error: no way to fit ' + names + ' into the data available '
+                             'before the deadline - try again when more data is published.')
+
+        for idx, start in zip(members, starts):
+            plan.append({'Name': appliances[idx]['Name'],
+                         'Start': first_slot + start * SLOT_LENGTH,
+                         'End': first_slot + (start + appliances[idx]['Slots']) * SLOT_LENGTH,
+                         'Cost': costs[idx][start]})
+
+    plan.sort(key=lambda item: item['Start'])
+    return plan
+
+def store_plan(cursor, plan: list, objective: str):
+    """Replace whatever plan is in the database with this one, so the
+    displays (or anything else) can pick it up."""
+
+    cursor.execute('CREATE TABLE IF NOT EXISTS schedule (name STRING PRIMARY KEY, '
+                   'start STRING, end STRING, objective STRING, value REAL, planned_at STRING)')
+    cursor.execute('DELETE FROM schedule')
+
+    planned_at = datetime.now(timezone.utc).strftime(SQLITE_FORMAT)
+    cursor.executemany('INSERT INTO schedule VALUES (?, ?, ?, ?, ?, ?)',
+                       [(item['Name'], item['Start'].strftime(SQLITE_FORMAT),
+                         item['End'].strftime(SQLITE_FORMAT), objective,
+                         round(item['Cost'], 2), planned_at) for item in plan])
@@ -0,0 +1,174 @@
+"""
+A compact, array-backed series of slots for the displays to work from, instead of
+lists of tuples from the database
+"""
+
+import time
+from array import array
+from bisect import bisect_left
+from math import nan, isnan
+from datetime import datetime, timezone
+
+SQLITE_FORMAT = "%Y-%m-%d %H:%M:%S"
+SLOT_SECONDS = 1800
+
+# the columns of the eco table after valid_from, in order
+FIELDS = ('value_inc_vat', 'intensity', 'gas_value_inc_vat')
+
+def to_epoch(sqlite_time: str) -> int:
+    """A UTC time in SQLite date format as seconds since the epoch."""
+    return int(datetime.fromisoformat(sqlite_time).replace(tzinfo=timezone.utc).timestamp())
+
+def to_sqlite_time(epoch: int) -> str:
+    """Seconds since the epoch as a UTC time in SQLite date format."""
+    return time.strftime(SQLITE_FORMAT, time.gmtime(epoch))
+
+def window_means(values, num_slots: int, missing: float = nan) -> list:
+    """The mean of every run of num_slots values, in order of where each starts,
+    with a running sum so it's one pass whatever the window size. Windows with
+    a missing (NaN) value get 'missing' instead."""
+    means = []
+    running = 0.0
+    gaps = 0
+    for i, value in enumerate(values):
+        if isnan(value):
+            gaps += 1
+        else:
+            running += value
+        if i >= num_slots:
+            leaving = values[i - num_slots]
+            if isnan(leaving):
+                gaps -= 1
+            else:
+                running -= leaving
+        if i >= num_slots - 1:
+            means.append(missing if gaps else running / num_slots)
+    return means
+
+def from_arrays(times: array, columns: tuple, estimated_from: int = None):
+    """A SlotSeries looking at whole arrays of times and values."""
+    return SlotSeries(memoryview(times), tuple(memoryview(column) for column in columns),
+                      estimated_from)
+
+class SlotSeries:
+    """Slots from the eco table, one array per column: start times (seconds since
+    the epoch) and the three values, with NaN where there's no value. That's 32
+    bytes a slot, rather than a tuple, a string and three floats.
+
+    Indexing gives the same tuple a database row would be (None for no value),
+    so code written for rows still works, and slicing gives another SlotSeries
+    looking at the same arrays, without copying them.
+
+    Slots starting at or after estimated_from (if it's set) are estimates, not
+    published values - see eco_baseline.py."""
+
+    __slots__ = ('times', 'columns', 'estimated_from')
+
+    def __init__(self, times: memoryview, columns: tuple, estimated_from: int = None):
+        self.times = times
+        self.columns = columns
+        self.estimated_from = estimated_from
+
+    @classmethod
+    def from_rows(cls, rows, aligned: bool = False):
+        """Build a series from rows of the eco table (SELECT *, in time order), which
+        can be a cursor, so the rows never all exist as tuples at once. If aligned,
+        missing half hours are filled in with NaN, so position matches time."""
+        times = array('q')
+        columns = tuple(array('d') for _ in FIELDS)
+        for row in rows:
+            epoch = to_epoch(row[0])
+            if aligned and times:
+                expected = times[-1] + SLOT_SECONDS
+                while expected < epoch:
+                    times.append(expected)
+                    for column in columns:
+                        column.append(nan)
+                    expected += SLOT_SECONDS
+            times.append(epoch)
+            for column, value in zip(columns, row[1:]):
+                column.append(nan if value is None else value)
+        return from_arrays(times, columns)
+
+    def __reduce__(self):
+        """Pickle (e.g. to hand to a worker process) as arrays of just the slots in view."""
+        times = array('q')
+        times.frombytes(self.times.tobytes())
+        columns = []
+        for column in self.columns:
+            columns.append(array('d'))
+            columns[-1].frombytes(column.tobytes())
+        return (from_arrays, (times, tuple(columns), self.estimated_from))
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return SlotSeries(self.times[key], tuple(column[key] for column in self.columns),
+                              self.estimated_from)
+        values = tuple(column[key] for column in self.columns)
+        return (to_sqlite_time(self.times[key]),) + tuple(None if isnan(value) else value
+                                                          for value in values)
+
+    def __iter__(self):
+        for i in range(len(self.times)):
+            yield self[i]
+
+    def is_estimated(self, idx: int) -> bool:
+        """True if the slot at idx is an estimate rather than a published value."""
+        return self.estimated_from is not None and self.times[idx] >= self.estimated_from
+
+    def published(self):
+        """The slots before the first estimate, as a view."""
+        if self.estimated_from is None:
+            return self
+        return self[:bisect_left(self.times, self.estimated_from)]
+
+    def with_estimates(self, estimates: list):
+        """A copy with (epoch, (values...)) estimates added to the end, marked as
+        estimates."""
+        if not estimates:
+            return self
+        times = array('q', self.times)
+        columns = tuple(array('d', column) for column in self.columns)
+        for epoch, values in estimates:
+            times.append(epoch)
+            for column, value in zip(columns, values):
+                column.append(value)
+        return from_arrays(times, columns, estimates[0][0])
+
+    def column(self, tuple_idx: int) -> memoryview:
+        """The values at tuple_idx of each row (1 is price, 2 carbon, 3 gas), NaN where missing."""
+        return self.columns[tuple_idx - 1]
+
+    def known(self, tuple_idx: int) -> list:
+        """The values at tuple_idx which aren't missing."""
+        return [value for value in self.column(tuple_idx) if not isnan(value)]
+
+    def argmax(self, tuple_idx: int) -> int:
+        """Position of the highest value at tuple_idx (the first, if there's a tie)."""
+        column = self.column(tuple_idx)
+        return max((i for i in range(len(column)) if not isnan(column[i])), key=column.__getitem__)
+
+    def argmin(self, tuple_idx: int) -> int:
+        """Position of the lowest value at tuple_idx (the first, if there's a tie)."""
+        column = self.column(tuple_idx)
+        return min((i for i in range(len(column)) if not isnan(column[i])), key=column.__getitem__)
+
+    def window_means(self, tuple_idx: int, num_slots: int, missing: float = nan) -> list:
+        """The mean of the values at tuple_idx for every window of num_slots slots."""
+        return window_means(self.column(tuple_idx), num_slots, missing)
+
+    def resample(self, num_slots: int):
+        """Group every num_slots slots into one, starting when the first does, with
+        the mean of the values which aren't missing."""
+        times = array('q', self.times[::num_slots])
+        columns = []
+        for column in self.columns:
+            means = array('d')
+            for start in range(0, len(column), num_slots):
+                group = [value for value in column[start:start + num_slots] if not isnan(value)]
+                means.append(sum(group) / len(group) if group else nan)
+            columns.append(means)
+        return from_arrays(times, tuple(columns), self.estimated_from)
@@ -0,0 +1,100 @@
+"""
+Functions for keeping the working database off the SD card: it lives on a
+tmpfs (RAM) and is copied to the card with the SQLite backup API every so often,
+and copied back after a reboot
+"""
+
+import os
+import time
+import sqlite3
+
+DB_FILE = 'eco_indicator.sqlite' # on the card, next to the scripts
+DEFAULT_SNAPSHOT_MINUTES = 60
+
+def working_dir(conf: dict):
+    """The tmpfs directory to keep the working database in, or None to use the card."""
+    storage = conf.get('Storage') or {}
+    return storage.get('WorkingDir')
+
+def shared_database(conf: dict):
+    """The database this config shares with others (see run_households.py), or None
+    for the usual one next to the scripts."""
+    storage = conf.get('Storage') or {}
+    return storage.get('Database')
+
+def snapshot_minutes(conf: dict) -> int:
+    """How often to copy the working database to the card."""
+    storage = conf.get('Storage') or {}
+    minutes = storage.get('SnapshotMinutes', DEFAULT_SNAPSHOT_MINUTES)
+    if not (isinstance(minutes, int) and minutes > 0):
+        print('Snapshot interval misconfigured: ' + str(minutes) +
+              '. Using default of ' + str(DEFAULT_SNAPSHOT_MINUTES) + '.')
+        minutes = DEFAULT_SNAPSHOT_MINUTES
+    return minutes
+
+def copy_database(source: str, target: str):
+    """Copy a database with the SQLite backup API, which gets a consistent copy even
+    if another script is writing to it. The copy is made next to the target and
+    renamed over it, so the target is always either the old copy or the new one."""
+    partial = target + '.partial'
+    if os.path.exists(partial):
+        os.unlink(partial) # left by a power cut during the last copy
+
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(partial)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+    with open(partial, 'rb') as copied:
+        os.fsync(copied.fileno())
+    os.replace(partial, target)
+    # make the rename itself stick
+    dir_fd = os.open(os.path.dirname(os.path.abspath(target)), os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+def db_file(conf: dict) -> str:
+    """Return the path of the database the scripts should use. With a working
+    directory configured, that's the copy in RAM, which is restored from the
+    last snapshot on the card the first time it's needed after a reboot. A
+    shared database is used as it is."""
+    if shared_database(conf):
+        return shared_database(conf)
+    tmpfs_dir = working_dir(conf)
+    if tmpfs_dir is None:
+        return DB_FILE
+
+    working = os.path.join(tmpfs_dir, DB_FILE)
+    if not os.path.exists(working):
+        os.makedirs(tmpfs_dir, exist_ok=True)
+        if os.path.exists(DB_FILE):
+            print('Restoring database from ' + os.path.abspath(DB_FILE) + ' to ' + working)
+            copy_database(DB_FILE, working)
+    return working
+
+def snapshot_due(conf: dict) -> bool:
+    """True if the last snapshot on the card is older than the configured interval."""
+    try:
+        age = time.time() - os.stat(DB_FILE).st_mtime
+    except FileNotFoundError:
+        return True
+    return age >= snapshot_minutes(conf) * 60
+
+def snapshot(conf: dict, force: bool = False) -> bool:
+    """Copy the working database to the card if it's time (or if forced).
+    Return True if a snapshot was taken."""
+    tmpfs_dir = working_dir(conf)
+    if tmpfs_dir is None or shared_database(conf):
+        return False
+    working = os.path.join(tmpfs_dir, DB_FILE)
+    if not os.path.exists(working) or not (force or snapshot_due(conf)):
+        return False
+
+    copy_database(working, DB_FILE)
+    print('Database snapshot saved to ' + os.path.abspath(DB_FILE) + '.')
+    return True
@@ -0,0 +1,82 @@
+"""
+Functions for sharing one Pi's data with others in the same region: the hub
+keeps a feed of which slots changed at which version, serve_api.py serves the
+changes since a version, and nodes apply them with store_data.py instead of
+asking the upstream APIs themselves
+"""
+
+from datetime import datetime, timedelta
+
+SQLITE_FORMAT = "%Y-%m-%d %H:%M:%S"
+SLOT_SECONDS = 1800
+
+FIELDS = ('value_inc_vat', 'intensity', 'gas_value_inc_vat')
+
+def create_change_feed(cursor):
+    """Make sure the change feed tables and triggers exist. Every insert, or update
+    which actually changes a value, bumps the version and stamps the slot with it.
+    When the feed is first set up, everything already in the table is in it."""
+    cursor.execute('CREATE TABLE IF NOT EXISTS sync_version (version INTEGER)')
+    cursor.execute('CREATE TABLE IF NOT EXISTS eco_changes (valid_from STRING PRIMARY KEY, version INTEGER)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS eco_changes_version ON eco_changes (version)')
+    cursor.execute('SELECT version FROM sync_version')
+    if cursor.fetchone() is None:
+        cursor.execute('INSERT INTO sync_version VALUES (1)')
+        cursor.execute('INSERT OR REPLACE INTO eco_changes SELECT valid_from, 1 FROM eco')
+
+    # the store_data.py upserts' conflict handling would override OR REPLACE in here
+    stamp = ('BEGIN UPDATE sync_version SET version = version + 1; '
+             'DELETE FROM eco_changes WHERE valid_from = NEW.valid_from; '
+             'INSERT INTO eco_changes SELECT NEW.valid_from, version FROM sync_version; END')
+    cursor.execute('CREATE TRIGGER IF NOT EXISTS eco_insert_version AFTER INSERT ON eco ' + stamp)
+    cursor.execute('CREATE TRIGGER IF NOT EXISTS eco_update_version AFTER UPDATE ON eco WHEN ' +
+                   ' OR '.join('NEW.' + field + ' IS NOT OLD.' + field for field in FIELDS) +
+                   ' ' + stamp)
+
+def trim_change_feed(cursor, cutoff: str):
+    """Forget changes to slots before cutoff (an SQLite time), once the rows have gone."""
+    cursor.execute('DELETE FROM eco_changes WHERE valid_from < ?', (cutoff,))
+
+def load_change_feed(cursor) -> tuple:
+    """Return the current version and a list of (version, valid_from) in version order."""
+    cursor.execute('SELECT version FROM sync_version')
+    version = cursor.fetchone()[0]
+    cursor.execute('SELECT version, valid_from FROM eco_changes ORDER BY version')
+    return version, cursor.fetchall()
+
+def encode_feed(version: int, rows: list) -> dict:
+    """Pack rows (valid_from, then one value per FIELDS) into as few bytes of JSON as
+    we can: times go as a number of half hours after the first one, and the field
+    names only once."""
+    feed = {'v': version, 'r': []}
+    if rows:
+        first = datetime.strptime(rows[0][0], SQLITE_FORMAT)
+        feed['t'] = rows[0][0]
+        feed['f'] = FIELDS
+        feed['r'] = [[int((datetime.strptime(row[0], SQLITE_FORMAT) - first).total_seconds()
+                          // SLOT_SECONDS)] + list(row[1:]) for row in rows]
+    return feed
+
+def decode_feed(feed: dict) -> list:
+    """Unpack a feed from encode_feed back into rows in the order of FIELDS."""
+    if not feed['r']:
+        return []
+    first = datetime.strptime(feed['t'], SQLITE_FORMAT)
+    positions = [feed['f'].index(field) if field in feed['f'] else None for field in FIELDS]
+    rows = []
+    for packed in feed['r']:
+        values = packed[1:]
+        rows.append(((first + timedelta(seconds=packed[0] * SLOT_SECONDS)).strftime(SQLITE_FORMAT),) +
+                    tuple(None if pos is None else values[pos] for pos in positions))
+    return rows
+
+def synced_version(cursor, hub: str) -> int:
+    """The version of the hub's feed we last applied, 0 if we never have."""
+    cursor.execute('CREATE TABLE IF NOT EXISTS sync_state (hub STRING PRIMARY KEY, version INTEGER)')
+    cursor.execute('SELECT version FROM sync_state WHERE hub = ?', (hub,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+def set_synced_version(cursor, hub: str, version: int):
+    """Remember how far through the hub's feed we are."""
+    cursor.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?)', (hub, version))
@@ -0,0 +1,203 @@
+"""
+Functions for sending one run's data to several outputs - say an Inky, a Blinkt!
+and a PNG file for a web page - with the database read and the stats worked
+out once, and each picture only pushed out when it has changed
+"""
+
+import os
+import copy
+import hashlib
+import sqlite3
+import eco_indicator
+import eco_profile
+import eco_series
+import eco_baseline
+import eco_refresh
+import eco_lock
+import eco_daily
+
+# the InkyPHAT settings inky_stats uses; targets which agree on these share stats
+STATS_SETTINGS = ('LowSlotDuration', 'GreenWeight', 'HighPrice', 'HighIntensity')
+
+DEFAULT_PNG_RESOLUTION = '250x122'
+
+def targets(conf: dict) -> list:
+    """The outputs to update: the Targets in the config, or just the DisplayType."""
+    return conf.get('Targets') or [{'DisplayType': conf['DisplayType']}]
+
+def target_name(target: dict) -> str:
+    """What a target is called in messages and in the display_state table."""
+    if 'Name' in target:
+        return target['Name']
+    if target['DisplayType'] == 'png':
+        return 'png:' + target.get('File', '')
+    return target['DisplayType']
+
+def target_conf(conf: dict, target: dict) -> dict:
+    """The config to draw one target with: the main config with the target's own
+    settings on top, merged one level down, so a target can change just e.g.
+    InkyPHAT: DisplayOrientation."""
+    merged = copy.deepcopy({key: value for key, value in conf.items() if key != 'Targets'})
+    for key, value in target.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key].update(value)
+        else:
+            merged[key] = value
+    return merged
+
+def display_rows(cursor, conf: dict):
+    """Read what the displays show in this mode: the slots from the current one on,
+    made up with estimates if asked for, or for Tracker today and tomorrow."""
+    if conf['Mode'] == 'agile_carbon':
+        # both series, so only slots where we have both
+        field_names = ('value_inc_vat', 'intensity')
+
+    elif 'agile' in conf['Mode'] or conf['Mode'] == 'tracker':
+        field_names = ('value_inc_vat',)
+
+    elif conf['Mode'] == 'carbon':
+        field_names = ('intensity',)
+
+    else:
+        raise SystemExit('Error: invalid mode ' + conf['Mode'] + ' in config.')
+
+    if conf['Mode'] == "tracker":
+        # today and tomorrow, from the daily history store_data.py keeps
+        try:
+            return eco_daily.latest(cursor)
+        except sqlite3.OperationalError as error:
+            raise SystemExit('Error: No daily prices found - you need to run store_data.py first.') from error
+
+    conditions = ["valid_from > datetime('now', '-30 minutes')"] + [field_name + ' IS NOT NULL'
+                                                                   for field_name in field_names]
+    cursor.execute('SELECT * FROM eco WHERE ' + ' AND '.join(conditions) + ' ORDER BY valid_from')
+
+    # straight from the cursor into arrays, one row per half hour, with no values
+    # where slots are missing, so the displays can go by position in the series
+    data_rows = eco_series.SlotSeries.from_rows(cursor, aligned=True)
+
+    if eco_indicator.deep_get(conf, ['InkyPHAT', 'Estimates']) is True:
+        # fill the rest of the graph from the typical week, where prices aren't out yet
+        data_rows = eco_baseline.with_estimates(cursor, data_rows, conf['Mode'],
+                                                conf['InkyPHAT']['DataDuration'] * 2)
+    return data_rows
+
+def create_display_state(cursor):
+    """Tables of what each target was last showing, so unchanged pictures can be
+    skipped, and of when each Inky was refreshed, for the refresh policy."""
+    cursor.execute('CREATE TABLE IF NOT EXISTS display_state (target STRING PRIMARY KEY, '
+                   'signature STRING)')
+    eco_refresh.create_refresh_state(cursor)
+
+def picture_signature(img, inky_display) -> str:
+    """A digest of everything a picture would change on a display, border included."""
+    border = getattr(inky_display, 'border_colour', getattr(inky_display, 'border', None))
+    digest = hashlib.sha1(str((img.mode, img.size, border)).encode())
+    digest.update(img.tobytes())
+    return digest.hexdigest()
+
+def changed(cursor, name: str, signature: str) -> bool:
+    """True (and remember the new signature) if a target's picture is different
+    from the one it last showed."""
+    cursor.execute('SELECT signature FROM display_state WHERE target = ?', (name,))
+    last = cursor.fetchone()
+    if last is not None and last[0] == signature:
+        return False
+    cursor.execute('INSERT OR REPLACE INTO display_state VALUES (?, ?)', (name, signature))
+    return True
+
+def png_display(target: dict):
+    """A HeadlessInky the size and colour a png target asks for."""
+    resolution = str(target.get('Resolution', DEFAULT_PNG_RESOLUTION))
+    try:
+        size = tuple(int(pixels) for pixels in resolution.split('x'))
+    except ValueError as bad_size:
+        raise SystemExit('Error: Resolution of ' + target_name(target) + ' must look like 250x122, not ' +
+                         resolution) from bad_size
+    if size not in eco_indicator.HeadlessInky.RESOLUTIONS:
+        raise SystemExit('Error: Resolution of ' + target_name(target) + ' must be one of ' +
+                         ', '.join(str(width) + 'x' + str(height)
+                                   for width, height in eco_indicator.HeadlessInky.RESOLUTIONS))
+    return eco_indicator.HeadlessInky(size, target.get('Colour', 'red'))
+
+def stats_for(conf: dict, data_rows, stats_cache: dict) -> dict:
+    """inky_stats for a target, reusing them if another target has already worked
+    out the same ones."""
+    key = tuple(conf['InkyPHAT'].get(setting) for setting in STATS_SETTINGS)
+    if key not in stats_cache:
+        stats_cache[key] = eco_indicator.inky_stats(conf, data_rows)
+    return stats_cache[key]
+
+def draw_picture(conf: dict, data_rows, inky_display, stats_cache: dict, trend: list = None):
+    """Draw one Inky-style picture without pushing it anywhere."""
+    if conf['Mode'] == 'tracker':
+        return eco_indicator.update_inky_tracker(conf, data_rows, False, inky_display, push=False,
+                                                 trend=trend)
+    return eco_indicator.update_inky(conf, data_rows, False, inky_display,
+                                     stats_for(conf, data_rows, stats_cache), push=False)
+
+def update_targets(conf: dict, data_rows, cursor, demo: bool, stats_cache: dict = None):
+    """Update every target in turn from the same data. Pass a stats_cache to share
+    the stats with other configs drawn from the same data."""
+    if stats_cache is None:
+        stats_cache = {}
+    # the same history for every target, each draws as much of it as it's set to
+    trend = eco_daily.trend(cursor) if conf['Mode'] == 'tracker' else None
+    for target in targets(conf):
+        this_conf = target_conf(conf, target)
+        name = target_name(target)
+        display_type = target['DisplayType']
+
+        if display_type == 'blinkt':
+            # LEDs change instantly and without flicker, so they're always set. They
+            # can't show which slots are estimates, so they only get the published ones
+            with eco_lock.display(this_conf):
+                eco_indicator.update_blinkt(this_conf, data_rows.published(), demo)
+            continue
+
+        if demo:
+            # not implemented for the Inky, this says so
+            eco_indicator.update_inky(this_conf, data_rows, demo)
+
+        if display_type == 'inkyphat':
+            # decide from the stats whether a refresh is worth it, before loading
+            # the Inky library or drawing anything
+            policy = eco_refresh.refresh_policy(this_conf)
+            summary = None
+            if policy is not None and this_conf['Mode'] != 'tracker':
+                summary = eco_refresh.summarise(this_conf, data_rows,
+                                                stats_for(this_conf, data_rows, stats_cache))
+                refresh, reason = eco_refresh.should_refresh(policy, summary,
+                                                             eco_refresh.last_refresh(cursor, name))
+                if not refresh:
+                    print('Not refreshing ' + name + ': ' + reason + '.')
+                    continue
+                print('Refresh due for ' + name + ': ' + reason + '.')
+
+            inky_display = eco_indicator.find_inky()
+            img = draw_picture(this_conf, data_rows, inky_display, stats_cache, trend)
+            if changed(cursor, name, picture_signature(img, inky_display)):
+                print('Refreshing ' + name + '...')
+                with eco_lock.display(this_conf):
+                    eco_profile.lap()
+                    inky_display.set_image(img)
+                    inky_display.show()
+                    eco_profile.lap('push')
+                if summary is not None:
+                    eco_refresh.record_refresh(cursor, name, summary)
+            else:
+                print(name + ' already shows this picture, not refreshing.')
+
+        elif display_type == 'png':
+            if 'File' not in target:
+                raise SystemExit('Error: a png target needs a File to write to.')
+            inky_display = png_display(target)
+            img = draw_picture(this_conf, data_rows, inky_display, stats_cache, trend)
+            if changed(cursor, name, picture_signature(img, inky_display)) or not os.path.exists(target['File']):
+                import eco_render
+
+                inky_display.set_image(img)
+                eco_render.save_atomically(inky_display.image, target['File'])
+                print('Saved ' + target['File'] + '.')
+            else:
+                print(target['File'] + ' is up to date.')
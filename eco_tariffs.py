@@ -0,0 +1,161 @@
+"""
+Functions to cost half-hourly consumption against the tariffs and carbon
+intensity stored by store_data.py
+"""
+
+import csv
+import sqlite3
+from datetime import datetime, timezone
+from eco_indicator import db_uri
+
+CHUNK_SIZE = 50000 # consumption rows per pass through SQLite
+
+# how to find the price for a half hour of consumption, by mode:
+# 'slot' - prices are half-hourly, they must match the slot exactly
+# 'daily' - prices are daily, use the latest one which started at or before the slot
+PRICE_LOOKUP = {'agile_import': 'slot',
+                'agile_export': 'slot',
+                'carbon': 'slot',
+                'agile_carbon': 'slot',
+                'tracker': 'daily'}
+
+PERIODS = {'day': 'substr(u.valid_from, 1, 10)',
+           'month': 'substr(u.valid_from, 1, 7)',
+           'total': "'total'"}
+
+TOTALS = ('kwh', 'elec_cost', 'gas_kwh', 'gas_cost', 'carbon', 'unpriced')
+
+def to_sqlite_time(timestamp: str) -> str:
+    """Turn a consumption timestamp into SQLite date format in UTC. The usual
+    fixed formats (2023-03-01T00:00:00Z or 2023-03-01 00:00:00) are just sliced,
+    anything else with a UTC offset goes through the slow path."""
+    if len(timestamp) == 19 or (len(timestamp) == 20 and timestamp[19] == 'Z'):
+        return timestamp[:10] + ' ' + timestamp[11:19]
+    try:
+        parsed = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    except ValueError as bad_time:
+        raise SystemExit('Error: unrecognised timestamp in consumption data: ' + timestamp) from bad_time
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime("%Y-%m-%d %H:%M:%S")
+
+def read_csv_chunks(filename: str, chunk_size: int = CHUNK_SIZE):
+    """Yield lists of (household, valid_from, kwh, gas_kwh) tuples from a CSV file
+    with a header row. 'timestamp' and 'kwh' columns are required, 'gas_kwh' and
+    'household' are optional. Only one chunk is held in memory at a time."""
+    try:
+        csv_file = open(filename, 'r', newline='')
+    except FileNotFoundError as no_file:
+        raise SystemExit('Unable to find ' + filename) from no_file
+
+    with csv_file:
+        reader = csv.DictReader(csv_file)
+        if reader.fieldnames is None or not {'timestamp', 'kwh'} <= set(reader.fieldnames):
+            raise SystemExit('Error: ' + filename + ' needs at least timestamp and kwh columns.')
+        has_gas = 'gas_kwh' in reader.fieldnames
+        has_household = 'household' in reader.fieldnames
+
+        chunk = []
+        for line in reader:
+            chunk.append((line['household'] if has_household else 'default',
+                          to_sqlite_time(line['timestamp']),
+                          float(line['kwh'] or 0),
+                          float(line['gas_kwh'] or 0) if has_gas else 0.0))
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+def read_table_chunks(db_file: str, chunk_size: int = CHUNK_SIZE):
+    """Yield chunks of consumption from a 'consumption' table (household,
+    valid_from, kwh, gas_kwh) in an SQLite database, in the same form as
+    read_csv_chunks."""
+    conn = sqlite3.connect(db_uri(db_file, 'ro'), uri=True)
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('SELECT household, valid_from, kwh, IFNULL(gas_kwh, 0) FROM consumption')
+        except sqlite3.OperationalError as error:
+            raise SystemExit('Error: no consumption table in ' + db_file) from error
+        while True:
+            chunk = cursor.fetchmany(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        conn.close()
+
+def open_engine(sources: list) -> sqlite3.Connection:
+    """Create an in-memory working database with each price source attached
+    read-only. 'sources' is a list of (label, db_file, mode) tuples."""
+    engine = sqlite3.connect(':memory:', uri=True)
+    engine.execute('CREATE TABLE usage (household STRING, valid_from STRING, '
+                   'kwh REAL, gas_kwh REAL)')
+    for idx, (label, db_file, _) in enumerate(sources):
+        try:
+            engine.execute('ATTACH DATABASE ? AS src' + str(idx),
+                           (db_uri(db_file, 'ro'),))
+        except sqlite3.OperationalError as error:
+            raise SystemExit('Error: unable to open ' + db_file + ' for ' + label) from error
+    return engine
+
+def costing_query(idx: int, mode: str, period: str) -> str:
+    """Build one aggregate query which costs every row of the usage table against
+    price source number idx, grouped by household and period. SQLite does all the
+    per-slot work, so the Python side only ever sees the grouped totals."""
+    src = 'src' + str(idx) + '.eco'
+    period_expr = PERIODS[period]
+
+    if PRICE_LOOKUP[mode] == 'slot':
+        elec = 'p.value_inc_vat'
+        gas = 'p.gas_value_inc_vat'
+        join = 'LEFT JOIN ' + src + ' p ON p.valid_from = u.valid_from'
+    else:
+        elec = ('(SELECT value_inc_vat FROM ' + src + ' WHERE valid_from <= u.valid_from '
+                'AND value_inc_vat IS NOT NULL ORDER BY valid_from DESC LIMIT 1)')
+        gas = ('(SELECT gas_value_inc_vat FROM ' + src + ' WHERE valid_from <= u.valid_from '
+               'AND gas_value_inc_vat IS NOT NULL ORDER BY valid_from DESC LIMIT 1)')
+        join = ''
+
+    if mode == 'carbon':
+        # no prices in carbon mode, but we can work out the emissions
+        return ('SELECT u.household, ' + period_expr + ', SUM(u.kwh), NULL, SUM(u.gas_kwh), '
+                'NULL, SUM(u.kwh * p.intensity), SUM(p.intensity IS NULL) FROM usage u ' +
+                join + ' GROUP BY 1, 2')
+
+    # combined mode has carbon intensity alongside the prices
+    carbon = 'p.intensity' if mode == 'agile_carbon' else 'NULL'
+
+    return ('SELECT household, period, SUM(kwh), SUM(kwh * elec), SUM(gas_kwh), '
+            'SUM(gas_kwh * gas), SUM(kwh * carbon), SUM(elec IS NULL) FROM (SELECT u.household, ' +
+            period_expr + ' AS period, u.kwh, u.gas_kwh, ' + elec + ' AS elec, ' + gas +
+            ' AS gas, ' + carbon + ' AS carbon FROM usage u ' + join + ') GROUP BY 1, 2')
+
+def compare_tariffs(sources: list, chunks, period: str = 'total',
+                    date_from: str = None, date_to: str = None) -> dict:
+    """Cost all the consumption yielded by 'chunks' against every source, and
+    return a dict keyed by (household, period, source label) of dicts of totals
+    (kWh, pence, grams of CO2 and the number of slots we had no price for)."""
+    engine = open_engine(sources)
+    queries = [costing_query(idx, mode, period) for idx, (_, _, mode) in enumerate(sources)]
+    results = {}
+
+    for chunk in chunks:
+        if date_from is not None or date_to is not None:
+            chunk = [row for row in chunk
+                     if (date_from is None or row[1] >= date_from) and
+                     (date_to is None or row[1] < date_to)]
+
+        engine.execute('DELETE FROM usage')
+        engine.executemany('INSERT INTO usage VALUES (?, ?, ?, ?)', chunk)
+
+        for (label, _, _), query in zip(sources, queries):
+            for household, period_key, *sums in engine.execute(query):
+                totals = results.setdefault((household, period_key, label), dict.fromkeys(TOTALS))
+                for name, value in zip(TOTALS, sums):
+                    if value is not None:
+                        totals[name] = (totals[name] or 0) + value
+
+    engine.close()
+    return results
@@ -0,0 +1,16 @@
+"""
+Helpers shared by store_data.py and the stub API server, for recording
+responses from the upstream APIs and replaying them later
+"""
+
+import re
+from urllib.parse import urlsplit
+
+# the carbon intensity API puts the request time in the path, and the Octopus
+# API takes times in the query string, neither of which should matter for replay
+TIMESTAMP = re.compile(r'\d{4}-\d{2}-\d{2}T[0-9:.]+(Z|[+-]\d{2}:?\d{2})?')
+
+def recording_name(url: str) -> str:
+    """Return the file name a response from this URL is recorded under."""
+    path = TIMESTAMP.sub('TIME', urlsplit(url).path)
+    return path.strip('/').replace('/', '_') + '.json'
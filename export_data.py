@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# pylint: disable=invalid-name
+
+"""Export the stored history (or the forecast history, if it's kept) to CSV, JSON
+   lines or Parquet for other tools to use. Rows are read in batches, so memory
+   use stays the same however much history there is, and the database can still
+   be written to while an export runs."""
+
+import os
+import sys
+import time
+import argparse
+from contextlib import redirect_stdout
+import eco_indicator
+import eco_storage
+import eco_tariffs
+import eco_export
+
+parser = argparse.ArgumentParser(description=('Export Eco Indicator data to CSV, JSON lines or Parquet'))
+parser.add_argument('--conf', '-c', default='config.yaml', help='specify config file')
+parser.add_argument('--table', '-t', choices=eco_export.TABLE_KEYS.keys(), default='eco',
+                    help='table to export (default eco)')
+parser.add_argument('--format', '-f', dest='export_format', choices=eco_export.FORMATS,
+                    help='file format (default: from the output file name, otherwise csv)')
+parser.add_argument('--columns', help='comma separated columns to export (default: all of them)')
+parser.add_argument('--from', dest='date_from', help='only export slots from this UTC date')
+parser.add_argument('--to', dest='date_to', help='only export slots before this UTC date')
+parser.add_argument('--batch-size', type=int, default=eco_export.BATCH_SIZE, help='rows per batch')
+parser.add_argument('--output', '-o', default='-', help='file to write (default: standard output)')
+
+args = parser.parse_args()
+conf_file = args.conf
+# relative to where we were run from, not where the scripts are
+output_file = args.output if args.output == '-' else os.path.abspath(args.output)
+
+os.chdir(sys.path[0])
+# keep the config file chatter out of an export to stdout
+with redirect_stdout(sys.stderr if output_file == '-' else sys.stdout):
+    config = eco_indicator.get_config(conf_file)
+    db_file = eco_storage.db_file(config)
+
+if not os.path.exists(db_file):
+    raise SystemExit('Error: no database found - you need to run store_data.py first.')
+if args.batch_size < 1:
+    raise SystemExit('Error: --batch-size must be at least 1.')
+
+export_format = args.export_format or eco_export.format_for(output_file)
+columns = [column.strip() for column in args.columns.split(',')] if args.columns else None
+date_from = eco_tariffs.to_sqlite_time(args.date_from) if args.date_from else None
+date_to = eco_tariffs.to_sqlite_time(args.date_to) if args.date_to else None
+
+start_time = time.perf_counter()
+try:
+    num_rows = eco_export.export(db_file, args.table, output_file, export_format, columns,
+                                 date_from, date_to, args.batch_size)
+except BrokenPipeError:
+    # piped into something like head, which has seen enough
+    os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    raise SystemExit(0)
+if output_file != '-':
+    # on stdout this would end up in the export
+    print('Exported ' + str(num_rows) + ' rows from ' + args.table + ' to ' + output_file +
+          ' in {:.2f}s.'.format(time.perf_counter() - start_time))
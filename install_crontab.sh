@@ -34,7 +34,7 @@ fi
 
 eval $(parse_yaml config.yaml "CONF_")
 
-if [ "$CONF_Mode" = "carbon" ]; then
+if [ "$CONF_Mode" = "carbon" ] || [ "$CONF_Mode" = "agile_carbon" ]; then
     DELAY=$(( RANDOM % 60 ))
 	DELAYPLUS=$(( DELAY + 10 ))
     echo "Installing pi-eco-indicator cron jobs for $CONF_Mode mode..."
@@ -42,29 +42,34 @@ if [ "$CONF_Mode" = "carbon" ]; then
     (crontab -l 2>/dev/null; echo "@reboot /bin/sleep 40; $PYTHON_BIN $INSTALL_DIR/update_display.py > $LOG_FILE 2>&1") | crontab -
 	(crontab -l 2>/dev/null; echo "*/30 * * * * /bin/sleep $DELAY; $PYTHON_BIN $INSTALL_DIR/store_data.py > $LOG_FILE 2>&1") | crontab -
 	(crontab -l 2>/dev/null; echo "*/30 * * * * /bin/sleep $DELAYPLUS; $PYTHON_BIN $INSTALL_DIR/update_display.py > $LOG_FILE 2>&1") | crontab -
+	(crontab -l 2>/dev/null; echo "15 3 * * * $PYTHON_BIN $INSTALL_DIR/maintain_db.py > $LOG_FILE 2>&1") | crontab -
 	echo "Done."
 	exit 0
 
 elif [ "$CONF_Mode" = "agile_import" ] || [ "$CONF_Mode" = "agile_export" ]; then
-    MINUTES=$(( 30 + RANDOM % 29 ))
+    DELAY=$(( RANDOM % 60 ))
     echo "Installing pi-eco-indicator cron jobs for $CONF_Mode mode..."
     (crontab -l 2>/dev/null; echo "@reboot /bin/sleep 30; $PYTHON_BIN $INSTALL_DIR/store_data.py > $LOG_FILE 2>&1") | crontab -
     (crontab -l 2>/dev/null; echo "@reboot /bin/sleep 40; $PYTHON_BIN $INSTALL_DIR/update_display.py > $LOG_FILE 2>&1") | crontab -
     (crontab -l 2>/dev/null; echo "*/30 * * * * /bin/sleep 5; $PYTHON_BIN $INSTALL_DIR/update_display.py > $LOG_FILE 2>&1") | crontab -
-    (crontab -l 2>/dev/null; echo "$MINUTES 16 * * * $PYTHON_BIN $INSTALL_DIR/store_data.py > $LOG_FILE 2>&1") | crontab -
-    (crontab -l 2>/dev/null; echo "$MINUTES 18 * * * $PYTHON_BIN $INSTALL_DIR/store_data.py > $LOG_FILE 2>&1") | crontab -
-    (crontab -l 2>/dev/null; echo "$MINUTES 20 * * * $PYTHON_BIN $INSTALL_DIR/store_data.py > $LOG_FILE 2>&1") | crontab -
+    # store_data.py --poll decides for itself whether it's worth asking for new prices yet
+    (crontab -l 2>/dev/null; echo "*/5 12-23 * * * /bin/sleep $DELAY; $PYTHON_BIN $INSTALL_DIR/store_data.py --poll > $LOG_FILE 2>&1") | crontab -
+    # and every half hour in the morning, which only fetches if we're missing some of today's prices
+    (crontab -l 2>/dev/null; echo "*/30 0-11 * * * /bin/sleep $DELAY; $PYTHON_BIN $INSTALL_DIR/store_data.py --poll > $LOG_FILE 2>&1") | crontab -
+    (crontab -l 2>/dev/null; echo "15 3 * * * $PYTHON_BIN $INSTALL_DIR/maintain_db.py > $LOG_FILE 2>&1") | crontab -
     echo "Done."
     exit 0
 
 elif [ "$CONF_Mode" = "tracker" ]; then
     MINUTES=$(( RANDOM % 58 ))
     MINUTESPLUS=$(( MINUTES + 1 ))
+    MAINTENANCE=$(( (MINUTES + 30) % 60 ))
     echo "Installing pi-eco-indicator cron jobs for $CONF_Mode mode..."
     (crontab -l 2>/dev/null; echo "@reboot /bin/sleep 30; $PYTHON_BIN $INSTALL_DIR/store_data.py > $LOG_FILE 2>&1") | crontab -
     (crontab -l 2>/dev/null; echo "@reboot /bin/sleep 40; $PYTHON_BIN $INSTALL_DIR/update_display.py > $LOG_FILE 2>&1") | crontab -
     (crontab -l 2>/dev/null; echo "$MINUTES * * * * $PYTHON_BIN $INSTALL_DIR/store_data.py > $LOG_FILE 2>&1") | crontab -
     (crontab -l 2>/dev/null; echo "$MINUTESPLUS * * * * $PYTHON_BIN $INSTALL_DIR/update_display.py > $LOG_FILE 2>&1") | crontab -
+    (crontab -l 2>/dev/null; echo "$MAINTENANCE 3 * * * $PYTHON_BIN $INSTALL_DIR/maintain_db.py > $LOG_FILE 2>&1") | crontab -
     echo "Done."
     exit 0
 
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# pylint: disable=invalid-name
+
+"""Tidy the database: delete data older than the Retention in the config a batch
+   at a time, hand the freed space back, refresh the query planner's statistics
+   and checkpoint the WAL. Run once a day by cron, away from the fetches, so
+   store_data.py doesn't have to do it."""
+
+import os
+import sys
+import sqlite3
+import argparse
+import eco_indicator
+import eco_profile
+import eco_lock
+import eco_storage
+import eco_maintenance
+
+parser = argparse.ArgumentParser(description=('Prune old data from the Eco Indicator database and tidy it up'))
+parser.add_argument('--conf', '-c', default='config.yaml', help='specify config file')
+parser.add_argument('--budget', type=float, default=eco_maintenance.DEFAULT_BUDGET,
+                    help='seconds to spend, at most (default ' + str(eco_maintenance.DEFAULT_BUDGET) +
+                    '); whatever is left is done next time')
+eco_profile.add_arguments(parser)
+
+args = parser.parse_args()
+eco_profile.start(args, 'maintain_db')
+conf_file = args.conf
+
+os.chdir(sys.path[0])
+config = eco_indicator.get_config(conf_file)
+
+# never in the middle of a fetch
+eco_lock.run_alone(config, 'maintain_db', timeout=0)
+eco_lock.hold_database(config, writing=True)
+
+try:
+    DB_URI = eco_indicator.db_uri(eco_storage.db_file(config), 'rw')
+    conn = sqlite3.connect(DB_URI, uri=True)
+except sqlite3.OperationalError as error:
+    raise SystemExit('Database not found - you need to run store_data.py first.') from error
+
+print('Keeping ' + str(eco_maintenance.retention_days(config)) + ' days of data.')
+try:
+    if eco_maintenance.maintain(conn, config, args.budget):
+        print('Database maintenance done.')
+except sqlite3.Error as error:
+    raise SystemError('Database error: ' + str(error)) from error
+finally:
+    conn.close()
+
+# if the database is in RAM, copy it to the SD card every so often
+eco_storage.snapshot(config)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# pylint: disable=invalid-name
+
+"""Draw the Inky pictures for lots of configs (or every combination of some regions
+   and modes) at every display size, as PNG files for a web page, with no display
+   attached. Each region's data is read once, and the pictures are drawn in
+   parallel, one worker process per core."""
+
+import os
+import sys
+import glob
+import copy
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import eco_indicator
+import eco_profile
+import eco_storage
+import eco_render
+import eco_households
+
+MODES = ['agile_import', 'agile_export', 'carbon', 'agile_carbon', 'tracker']
+
+parser = argparse.ArgumentParser(description=('Draw Eco Indicator pictures to PNG files in bulk'))
+parser.add_argument('--conf', '-c', default='config.yaml',
+                    help='config file to base the pictures on (default config.yaml)')
+parser.add_argument('--configs', metavar='DIR', help='draw one set of pictures for each .yaml file in DIR')
+parser.add_argument('--region', '-r', action='append',
+                    help='DNO region to draw (can be repeated, default: the one in the config file)')
+parser.add_argument('--mode', '-m', action='append', choices=MODES,
+                    help='mode to draw (can be repeated, default: the one in the config file)')
+parser.add_argument('--data', '-d', metavar='DIR',
+                    help="directory of databases named after their region, e.g. B.sqlite, "
+                         "as run_households.py makes (default: this Pi's own database for everything)")
+parser.add_argument('--resolution', action='append', choices=['212x104', '250x122', '800x480'],
+                    help='display size to draw for (can be repeated, default: all of them)')
+parser.add_argument('--colour', choices=['red', 'yellow'], default='red', help='colour of the Inky pHATs')
+parser.add_argument('--output', '-o', default='renders', help='directory to write the PNG files to')
+parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count(),
+                    help='worker processes (with 1, the pictures are drawn in this process, so they can be profiled)')
+eco_profile.add_arguments(parser)
+
+args = parser.parse_args()
+eco_profile.start(args, 'render_images')
+conf_file = args.conf
+# these are relative to where we were run from, not where the scripts are
+configs_dir = os.path.abspath(args.configs) if args.configs else None
+data_dir = os.path.abspath(args.data) if args.data else None
+output_dir = os.path.abspath(args.output)
+
+os.chdir(sys.path[0])
+
+def region_db(conf: dict) -> str:
+    """The database to draw a config's pictures from."""
+    if data_dir:
+        return os.path.join(data_dir, eco_households.database_name(conf))
+    return eco_storage.db_file(conf)
+
+# (name for the files, config) for every set of pictures
+pictures = []
+if configs_dir:
+    for config_path in sorted(glob.glob(os.path.join(configs_dir, '*.yaml'))):
+        pictures.append((os.path.splitext(os.path.basename(config_path))[0],
+                         eco_indicator.get_config(config_path)))
+    if not pictures:
+        raise SystemExit('Error: no .yaml files found in ' + configs_dir)
+else:
+    config = eco_indicator.get_config(conf_file)
+    for region in args.region or [config['DNORegion']]:
+        for mode in args.mode or [config['Mode']]:
+            picture_conf = copy.deepcopy(config)
+            picture_conf['DNORegion'] = region
+            picture_conf['Mode'] = mode
+            pictures.append((region + '_' + mode, picture_conf))
+
+for name, picture_conf in pictures:
+    if picture_conf['DisplayType'] != 'inkyphat':
+        raise SystemExit('Error: ' + name + ' is set up for ' + picture_conf['DisplayType'] +
+                         ', only Inky pictures can be drawn.')
+
+# read each region's data once, however many pictures it's in
+region_data = {}
+for _, picture_conf in pictures:
+    db_file = region_db(picture_conf)
+    if db_file not in region_data:
+        region_data[db_file] = eco_render.load_region(db_file)
+
+resolutions = [tuple(int(size) for size in resolution.split('x'))
+               for resolution in args.resolution or ['212x104', '250x122', '800x480']]
+
+os.makedirs(output_dir, exist_ok=True)
+
+jobs = []
+for name, picture_conf in pictures:
+    rows = eco_render.rows_for_mode(region_data[region_db(picture_conf)], picture_conf['Mode'])
+    if not rows:
+        print('No data for ' + name + ', skipping.')
+        continue
+    trend = region_data[region_db(picture_conf)][2] if picture_conf['Mode'] == 'tracker' else None
+    for width, height in resolutions:
+        out_file = os.path.join(output_dir, name + '_' + str(width) + 'x' + str(height) + '.png')
+        jobs.append((picture_conf, rows, (width, height), args.colour, out_file, trend))
+
+if not jobs:
+    raise SystemExit('Error: nothing to draw.')
+
+print('Drawing ' + str(len(jobs)) + ' pictures from ' + str(len(region_data)) +
+      ' databases with ' + str(args.jobs) + ' workers...')
+
+def report(results) -> int:
+    """Print how each picture went. Returns how many failed."""
+    num_failed = 0
+    for out_file, seconds, error in results:
+        if error:
+            num_failed += 1
+            print(out_file + ': failed - ' + error)
+        else:
+            print(out_file + ': {:.0f}ms'.format(seconds * 1000))
+    return num_failed
+
+start = time.perf_counter()
+if args.jobs == 1:
+    eco_render.preload_fonts()
+    failed = report(map(eco_render.render, *zip(*jobs)))
+else:
+    # fork, so the workers don't run this script again to find the functions
+    with ProcessPoolExecutor(max_workers=args.jobs, mp_context=multiprocessing.get_context('fork'),
+                             initializer=eco_render.preload_fonts) as pool:
+        failed = report(pool.map(eco_render.render, *zip(*jobs)))
+elapsed = time.perf_counter() - start
+
+print('{} pictures in {:.2f}s, {:.1f} images/sec.'.format(
+    len(jobs) - failed, elapsed, (len(jobs) - failed) / elapsed if elapsed else 0))
+if failed:
+    raise SystemExit(str(failed) + ' pictures failed.')
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# pylint: disable=invalid-name
+
+"""Fetch the data for lots of households (one config file each) and draw their
+   pictures, all from one process. Each region's data is fetched once, into a
+   database shared by every household there, so the API calls and the work
+   grow with the number of regions rather than the number of households."""
+
+import os
+import sys
+import glob
+import time
+import sqlite3
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import eco_indicator
+import eco_profile
+import eco_lock
+import eco_targets
+import eco_households
+
+parser = argparse.ArgumentParser(description=('Fetch data and draw pictures for many households at once'))
+parser.add_argument('--configs', metavar='DIR', required=True, help='directory with a .yaml file for each household')
+parser.add_argument('--data', '-d', metavar='DIR', default='households',
+                    help='directory for the shared databases, named after their region (default households)')
+parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count(), help='fetches to run at once')
+parser.add_argument('--poll', action='store_true',
+                    help="only fetch if new prices are likely to have been published (Agile modes)")
+parser.add_argument('--no-fetch', action='store_true', help="just draw, from the data we have")
+parser.add_argument('--no-draw', action='store_true', help="just fetch")
+eco_profile.add_arguments(parser)
+
+args = parser.parse_args()
+# the fetches run in their own processes, so this shows them as waits
+eco_profile.start(args, 'run_households')
+# these are relative to where we were run from, not where the scripts are
+configs_dir = os.path.abspath(args.configs)
+data_dir = os.path.abspath(args.data)
+
+os.chdir(sys.path[0])
+
+households = [(os.path.splitext(os.path.basename(config_path))[0], eco_indicator.get_config(config_path))
+              for config_path in sorted(glob.glob(os.path.join(configs_dir, '*.yaml')))]
+if not households:
+    raise SystemExit('Error: no .yaml files found in ' + configs_dir)
+
+groups = eco_households.group_households(households)
+os.makedirs(data_dir, exist_ok=True)
+
+def fetch(database: str) -> tuple:
+    """Run store_data.py for one shared database. Returns (database, exit status,
+    output). Runs in a thread, the work is in the subprocess."""
+    import yaml
+
+    conf_path = eco_households.fetch_config_file(data_dir, database)
+    with open(conf_path, 'w') as conf_file:
+        yaml.safe_dump(eco_households.fetch_conf(groups[database], os.path.join(data_dir, database)), conf_file)
+    result = subprocess.run([sys.executable, 'store_data.py', '--conf', conf_path] +
+                            (['--poll'] if args.poll else []),
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, check=False)
+    return database, result.returncode, result.stdout
+
+failed = 0
+start = time.perf_counter()
+
+if not args.no_fetch:
+    print('Fetching for ' + str(len(households)) + ' households into ' + str(len(groups)) +
+          ' shared databases...')
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        for database, status, output in pool.map(fetch, groups):
+            lines = output.strip().splitlines() or ['no output']
+            if status:
+                failed += 1
+                print(database + ': failed - ' + lines[-1])
+            else:
+                print(database + ': ' + next((line for line in lines if 'rows were written' in line
+                                              or line.startswith('Not fetching')), lines[-1]))
+
+if not args.no_draw:
+    for database, members in groups.items():
+        db_file = os.path.join(data_dir, database)
+        confs = []
+        for name, conf in members:
+            if eco_households.drawable(conf):
+                confs.append((name, eco_households.household_conf(name, conf, db_file)))
+            else:
+                print(name + ': skipped, only png targets can be drawn here - a display needs '
+                      'the Pi it is plugged into, which can sync from serve_api.py.')
+        if not confs:
+            continue
+
+        # not while store_data.py is writing it, if it's being run some other way too
+        eco_lock.hold_database(confs[0][1], writing=False)
+        try:
+            conn = sqlite3.connect(eco_indicator.db_uri(db_file, 'rw'), uri=True)
+        except sqlite3.OperationalError:
+            failed += len(confs)
+            print(database + ': no database yet, run without --no-fetch first.')
+            continue
+        cursor = conn.cursor()
+        try:
+            eco_targets.create_display_state(cursor)
+        except sqlite3.Error as error:
+            raise SystemError('Database error: ' + str(error)) from error
+
+        # read the data and work out the stats once for each way the households here see it
+        rows_cache = {}
+        stats_cache = {}
+        for name, conf in confs:
+            key = (conf['Mode'], conf['InkyPHAT'].get('Estimates'), conf['InkyPHAT'].get('DataDuration'))
+            print('Drawing for ' + name + '...')
+            try:
+                if key not in rows_cache:
+                    rows_cache[key] = eco_targets.display_rows(cursor, conf)
+                if len(rows_cache[key]) == 0:
+                    raise SystemExit('Error: No data found in ' + database + '.')
+                eco_targets.update_targets(conf, rows_cache[key], cursor, False, stats_cache.setdefault(key, {}))
+            except SystemExit as error:
+                failed += 1
+                print(name + ': failed - ' + str(error))
+        conn.commit()
+        conn.close()
+
+print('{} households, {} shared databases, {:.2f}s.'.format(len(households), len(groups),
+                                                          time.perf_counter() - start))
+if failed:
+    raise SystemExit(str(failed) + ' fetches or households failed.')
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# pylint: disable=invalid-name
+
+"""Work out the cheapest (or lowest carbon) start times for the appliances listed
+   in the config file, using the data already in the SQLite database, and store
+   the plan in the database so the displays can show it."""
+
+import sqlite3
+import os
+import sys
+import time
+import argparse
+import eco_indicator
+import eco_storage
+import eco_schedule
+
+parser = argparse.ArgumentParser(description=('Find the best times to run appliances using SQLite data'))
+parser.add_argument('--conf', '-c', default='config.yaml', help='specify config file')
+parser.add_argument('--objective', '-o', choices=eco_schedule.OBJECTIVES.keys(), default=None,
+                    help='minimise cost or carbon (default: cost, or carbon in carbon mode)')
+parser.add_argument('--no-store', '-n', action='store_true', help="don't write the plan to the database")
+
+args = parser.parse_args()
+conf_file = args.conf
+
+os.chdir(sys.path[0])
+config = eco_indicator.get_config(conf_file)
+
+try:
+    # connect to the database in rw mode so we can catch the error if it doesn't exist
+    DB_URI = eco_indicator.db_uri(eco_storage.db_file(config), 'rw')
+    conn = sqlite3.connect(DB_URI, uri=True)
+    cursor = conn.cursor()
+    print('Connected to database...')
+
+except sqlite3.OperationalError as error:
+    # handle missing database case
+    raise SystemExit('Database not found - you need to run store_data.py first.') from error
+
+objective = args.objective
+if objective is None:
+    objective = 'carbon' if config['Mode'] == 'carbon' else 'cost'
+
+if config['Mode'] in ('agile_export', 'tracker'):
+    raise SystemExit('Error: scheduling needs half-hourly import prices or carbon data, not ' +
+                     config['Mode'] + ' mode.')
+
+appliances = eco_schedule.parse_appliances(config.get('Appliances'))
+field_name, short_unit = eco_schedule.OBJECTIVES[objective]
+
+cursor.execute("SELECT valid_from, " + field_name + " FROM eco WHERE valid_from > "
+               "datetime('now', '-30 minutes') AND " + field_name + " IS NOT NULL "
+               "ORDER BY valid_from")
+data_rows = cursor.fetchall()
+
+start_time = time.perf_counter()
+plan = eco_schedule.plan_schedule(appliances, data_rows)
+solve_ms = (time.perf_counter() - start_time) * 1000
+
+print('Solved for ' + str(len(appliances)) + ' appliances in {:.1f}ms.'.format(solve_ms))
+for item in plan:
+    print(item['Name'] + ': ' + item['Start'].strftime("%H:%M") + ' to ' +
+          item['End'].strftime("%H:%M on %a %d %b") + ' UTC, ' +
+          '{:.1f}'.format(item['Cost']) + short_unit)
+
+if not args.no_store:
+    try:
+        eco_schedule.store_plan(cursor, plan, objective)
+    except sqlite3.Error as error:
+        raise SystemError('Database error: ' + str(error)) from error
+    print('Plan stored in database.')
+
+# finish up the database operation
+if conn:
+    conn.commit()
+    conn.close()
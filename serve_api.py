@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# pylint: disable=invalid-name
+
+"""Serve the data in the SQLite database as read-only JSON over HTTP, so other
+   devices on the LAN can use it without hitting the remote APIs or opening the
+   database themselves. Everything is answered from memory; the database is only
+   read again when store_data.py has written to it."""
+
+import sqlite3
+import os
+import sys
+import json
+import threading
+import hashlib
+import gzip
+import math
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+import argparse
+import eco_indicator
+import eco_sync
+import eco_storage
+
+DEFAULT_PORT = 8080
+DEFAULT_BIND = '0.0.0.0'
+CHECK_INTERVAL = 1.0 # seconds between looking at the database file for changes
+MAX_CACHED_RESPONSES = 256 # per database version
+MAX_SLOTS = 96 * 7 # don't let a client ask for an absurd number of slots
+MIN_GZIP_SIZE = 256 # bytes, smaller responses aren't worth compressing
+
+FIELDS = ('value_inc_vat', 'intensity', 'gas_value_inc_vat')
+
+parser = argparse.ArgumentParser(description=('Serve Eco Indicator data as JSON over HTTP'))
+parser.add_argument('--conf', '-c', default='config.yaml', help='specify config file')
+parser.add_argument('--port', '-p', type=int, default=None, help='port to listen on')
+parser.add_argument('--bind', '-b', default=None, help='address to listen on')
+
+args = parser.parse_args()
+conf_file = args.conf
+
+cache_lock = threading.Lock()
+# the snapshot is replaced in one go, so request threads never see half an update
+cache = {'checked': 0.0, 'version': None,
+         'snapshot': {'times': [], 'rows': [], 'schedule': [], 'feed_version': 0,
+                      'changes': [], 'responses': {}}}
+
+def db_version() -> str:
+    """Return a token which changes whenever the database files change on disk.
+    This only stats the files, it doesn't touch SQLite."""
+    parts = []
+    for suffix in ('', '-wal'):
+        try:
+            stat = os.stat(DB_FILE + suffix)
+        except FileNotFoundError:
+            continue
+        parts.append(str(stat.st_mtime_ns) + ':' + str(stat.st_size))
+    return '-'.join(parts)
+
+def load_rows():
+    """Read everything we serve from the database into memory."""
+    db_uri = eco_indicator.db_uri(DB_FILE, 'ro')
+    try:
+        conn = sqlite3.connect(db_uri, uri=True)
+    except sqlite3.OperationalError as error:
+        raise SystemExit('Database not found - you need to run store_data.py first.') from error
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT valid_from, " + ", ".join(FIELDS) + " FROM eco ORDER BY valid_from")
+        rows = cursor.fetchall()
+        try:
+            cursor.execute("SELECT name, start, end, objective, value FROM schedule ORDER BY start")
+            schedule = cursor.fetchall()
+        except sqlite3.OperationalError:
+            schedule = [] # no plan has been made yet
+        try:
+            feed_version, changes = eco_sync.load_change_feed(cursor)
+        except sqlite3.OperationalError:
+            feed_version, changes = 0, [] # store_data.py hasn't set up the change feed yet
+    finally:
+        conn.close()
+
+    return rows, schedule, feed_version, changes
+
+def refresh_cache(now: float):
+    """Reload the cache if the database has changed since we last looked. Only
+    one thread looks at a time and at most once every CHECK_INTERVAL seconds."""
+    with cache_lock:
+        if now - cache['checked'] < CHECK_INTERVAL:
+            return
+        cache['checked'] = now
+        version = db_version()
+        if version == cache['version']:
+            return
+
+        rows, schedule, feed_version, changes = load_rows()
+        cache['snapshot'] = {'times': [row[0] for row in rows], 'rows': rows,
+                             'schedule': schedule, 'feed_version': feed_version,
+                             'changes': changes, 'responses': {}}
+        cache['version'] = version
+        print('Loaded ' + str(len(rows)) + ' slots from database.')
+
+def to_iso(sqlite_time: str) -> str:
+    """SQLite date format to the ISO 8601 format the upstream APIs use."""
+    return sqlite_time.replace(' ', 'T') + 'Z'
+
+def from_iso(iso_time: str) -> str:
+    """Accept ISO 8601 (with or without the Z) or SQLite format and return SQLite format."""
+    return iso_time.replace('T', ' ').rstrip('Z')[:19]
+
+def slot_end(sqlite_time: str) -> str:
+    """The time a half hour slot starting at sqlite_time finishes."""
+    return (datetime.strptime(sqlite_time, "%Y-%m-%d %H:%M:%S") +
+            timedelta(minutes=30)).strftime("%Y-%m-%d %H:%M:%S")
+
+def row_to_dict(row: tuple) -> dict:
+    """Turn a database row into something which reads nicely as JSON."""
+    slot = {'valid_from': to_iso(row[0])}
+    for field, value in zip(FIELDS, row[1:]):
+        if value is not None:
+            slot[field] = value
+    return slot
+
+def current_index(times: list, now_sqlite: str) -> int:
+    """Index of the slot we are in now (the latest which has started), or -1."""
+    return bisect_right(times, now_sqlite) - 1
+
+def get_int(query: dict, name: str, default: int) -> int:
+    """Read a positive integer query parameter, or raise ValueError."""
+    value = int(query.get(name, [default])[0])
+    if not 0 < value <= MAX_SLOTS:
+        raise ValueError(name + ' out of range')
+    return value
+
+def get_num_slots(query: dict, name: str, default: float) -> int:
+    """Read a length in hours (which can be a fraction) as a number of slots,
+    or raise ValueError."""
+    hours = float(query.get(name, [default])[0])
+    if not math.isfinite(hours): # int() can't take inf or nan
+        raise ValueError(name + ' out of range')
+    num_slots = int(hours * 2)
+    if not 0 < num_slots <= MAX_SLOTS:
+        raise ValueError(name + ' out of range')
+    return num_slots
+
+def cheapest_windows(rows: list, field_idx: int, num_slots: int, count: int) -> list:
+    """Find up to 'count' non-overlapping windows of num_slots contiguous slots
+    with the lowest mean value, using prefix sums over the given rows."""
+    values = []
+    for row in rows:
+        if row[field_idx] is None:
+            break # only consider the unbroken run of data at the front
+        values.append(row[field_idx])
+    if len(values) < num_slots:
+        return []
+
+    prefix = [0.0] + list(accumulate(values))
+    means = sorted(((prefix[i + num_slots] - prefix[i]) / num_slots, i)
+                   for i in range(len(values) - num_slots + 1))
+
+    windows = []
+    taken = []
+    for mean, start in means:
+        if any(start < other + num_slots and other < start + num_slots for other in taken):
+            continue
+        taken.append(start)
+        windows.append({'valid_from': to_iso(rows[start][0]),
+                        'valid_to': to_iso(slot_end(rows[start + num_slots - 1][0])),
+                        'slots': num_slots, 'mean': round(mean, 2)})
+        if len(windows) == count:
+            break
+    return windows
+
+def build_response(snapshot: dict, path: str, query: dict, now_sqlite: str):
+    """Work out the JSON for a request from a cache snapshot. Returns None for an unknown path."""
+    rows = snapshot['rows']
+    times = snapshot['times']
+    now_idx = current_index(times, now_sqlite)
+
+    if path == '/current':
+        if now_idx < 0 or now_idx >= len(rows):
+            return {'slot': None}
+        return {'slot': row_to_dict(rows[now_idx])}
+
+    if path == '/next':
+        num_slots = get_int(query, 'n', 3)
+        return {'slots': [row_to_dict(row) for row in rows[now_idx + 1:now_idx + 1 + num_slots]]}
+
+    if path == '/cheapest':
+        field = query.get('field', [default_field])[0]
+        if field not in FIELDS:
+            raise ValueError('unknown field')
+        num_slots = get_num_slots(query, 'hours', 3)
+        count = get_int(query, 'count', 1)
+        future = rows[max(now_idx, 0):]
+        return {'field': field,
+                'windows': cheapest_windows(future, FIELDS.index(field) + 1, num_slots, count)}
+
+    if path == '/history':
+        start = bisect_left(times, from_iso(query.get('from', [''])[0]))
+        end_time = query.get('to', [None])[0]
+        end = len(rows) if end_time is None else bisect_left(times, from_iso(end_time))
+        return {'slots': [row_to_dict(row) for row in rows[start:end]]}
+
+    if path == '/changes':
+        # for nodes keeping a copy of our data: every row changed since their version,
+        # or everything if they're ahead of us (our database has been started again)
+        since = int(query.get('since', [0])[0])
+        if since > snapshot['feed_version']:
+            since = 0
+        changes = snapshot['changes']
+        changed = sorted(valid_from for _, valid_from in
+                         changes[bisect_right(changes, (since, '\uffff')):])
+        changed_rows = []
+        for valid_from in changed:
+            idx = bisect_left(times, valid_from)
+            if idx < len(times) and times[idx] == valid_from:
+                changed_rows.append(rows[idx])
+        return eco_sync.encode_feed(snapshot['feed_version'], changed_rows)
+
+    if path == '/schedule':
+        return {'plan': [{'name': name, 'start': to_iso(start), 'end': to_iso(end),
+                          'objective': objective, 'value': value}
+                         for name, start, end, objective, value in snapshot['schedule']]}
+
+    return None
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """Answer GET requests from the in-memory cache, with ETags so that clients
+    polling for changes get a cheap 304 when nothing has moved."""
+
+    protocol_version = 'HTTP/1.1' # keep-alive, so pollers don't reconnect every time
+    disable_nagle_algorithm = True # headers and body go out as separate writes
+    server_version = 'EcoIndicator'
+
+    def do_GET(self): # pylint: disable=invalid-name
+        """Serve one request."""
+        now = datetime.now(timezone.utc)
+        try:
+            refresh_cache(now.timestamp())
+        except (SystemExit, sqlite3.Error) as error:
+            # the database has gone or can't be read: say so, rather than letting
+            # the exception end this thread and drop the connection. Requests
+            # before the next check get the data we already have
+            self.send_json(503, {'error': str(error)})
+            return
+        snapshot = cache['snapshot']
+
+        url = urlsplit(self.path)
+        now_sqlite = now.strftime("%Y-%m-%d %H:%M:%S")
+        # responses only change when the data does, or when we move into a new slot
+        now_idx = current_index(snapshot['times'], now_sqlite)
+        key = (url.path, url.query, now_idx)
+
+        cached = snapshot['responses'].get(key)
+        if cached is None:
+            try:
+                content = build_response(snapshot, url.path, parse_qs(url.query), now_sqlite)
+            except ValueError as error:
+                self.send_json(400, {'error': str(error)})
+                return
+            if content is None:
+                self.send_json(404, {'error': 'not found'})
+                return
+
+            body = json.dumps(content, separators=(',', ':')).encode()
+            etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+            compressed = gzip.compress(body) if len(body) >= MIN_GZIP_SIZE else None
+            cached = (body, etag, compressed)
+            if len(snapshot['responses']) < MAX_CACHED_RESPONSES:
+                snapshot['responses'][key] = cached
+
+        body, etag, compressed = cached
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if compressed is not None and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = compressed
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status: int, content: dict):
+        """Send an uncached JSON response, for errors."""
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        """Don't log every request, there may be hundreds a second."""
+
+os.chdir(sys.path[0])
+config = eco_indicator.get_config(conf_file)
+DB_FILE = eco_storage.db_file(config)
+
+default_field = 'intensity' if config['Mode'] == 'carbon' else 'value_inc_vat'
+
+port = args.port or eco_indicator.deep_get(config, ['API', 'Port'], DEFAULT_PORT)
+bind = args.bind or eco_indicator.deep_get(config, ['API', 'Bind'], DEFAULT_BIND)
+
+refresh_cache(datetime.now(timezone.utc).timestamp())
+
+server = ThreadingHTTPServer((bind, port), ApiHandler)
+print('Serving on http://' + bind + ':' + str(port) + '/ ...')
+
+try:
+    server.serve_forever()
+except KeyboardInterrupt:
+    print('Stopping.')
+    server.server_close()
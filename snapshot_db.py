@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# pylint: disable=invalid-name
+
+"""Copy the working database from RAM to the SD card now, rather than waiting for
+   store_data.py to do it, e.g. before shutting down. Only does anything if a
+   Storage: WorkingDir is set in the config file."""
+
+import os
+import sys
+import argparse
+import eco_indicator
+import eco_storage
+
+parser = argparse.ArgumentParser(description=('Save (or restore) the in-memory Eco Indicator database'))
+parser.add_argument('--conf', '-c', default='config.yaml', help='specify config file')
+parser.add_argument('--restore', '-r', action='store_true',
+                    help='copy the snapshot on the SD card back to RAM, replacing the working copy')
+
+args = parser.parse_args()
+conf_file = args.conf
+
+os.chdir(sys.path[0])
+config = eco_indicator.get_config(conf_file)
+
+tmpfs_dir = eco_storage.working_dir(config)
+if tmpfs_dir is None:
+    raise SystemExit('Error: no Storage: WorkingDir in ' + conf_file + ', the database is already on the SD card.')
+
+if args.restore:
+    if not os.path.exists(eco_storage.DB_FILE):
+        raise SystemExit('Error: there is no snapshot to restore.')
+    os.makedirs(tmpfs_dir, exist_ok=True)
+    eco_storage.copy_database(eco_storage.DB_FILE, os.path.join(tmpfs_dir, eco_storage.DB_FILE))
+    print('Database restored to ' + tmpfs_dir + '.')
+elif not eco_storage.snapshot(config, force=True):
+    print('No working database in ' + tmpfs_dir + ' yet, nothing to save.')
@@ -9,13 +9,22 @@ import sqlite3
 import os
 import sys
 import time
+import json
 from reprlib import Repr
-from datetime import datetime, timedelta
-from urllib.request import pathname2url
-import pytz
-import requests
+from datetime import datetime, timedelta, timezone
 import argparse
 import eco_indicator
+import eco_profile
+import eco_lock
+import eco_polling
+import eco_gaps
+import eco_baseline
+import eco_daily
+import eco_decode
+import eco_maintenance
+import eco_sync
+import eco_storage
+import eco_upstream
 
 AGILE_API_BASE = ('https://api.octopus.energy/v1/products/')
 
@@ -50,12 +59,32 @@ CARBON_REGIONS = {'A': '/regional/intensity/{from_time}/fw48h/regionid/10',
 
 MAX_RETRIES = 15 # give up once we've tried this many times to get the prices from the API
 
+MAX_REPAIRS = 4 # fetch at most this many missing stretches of slots per run
+MAX_REPAIR_ATTEMPTS = 3 # stop asking for a stretch once this many fetches haven't filled any of it
+REPAIR_DAYS = 7 # and don't ask for stretches from longer ago than this, they're off every display
+
+# the half-hourly columns each mode fills, which we look for gaps in
+GAP_FIELDS = {'agile_import': ['value_inc_vat'],
+              'agile_export': ['value_inc_vat'],
+              'carbon': ['intensity'],
+              'agile_carbon': ['value_inc_vat', 'intensity']}
+
 parser = argparse.ArgumentParser(description=('Read data from a remote API and store it in a local SQlite database'))
 parser.add_argument('--conf', '-c', default='config.yaml', help='specify config file')
 parser.add_argument('--print', '-p', action='store_true', help='print data which was retrieved (JSON format)')
+parser.add_argument('--record', '-r', metavar='DIR',
+                    help='save the data retrieved to this directory, for stub_api.py to replay')
+parser.add_argument('--retry-delay', type=float, default=1.0,
+                    help='seconds to wait before the first retry, doubling each time (default 1)')
+parser.add_argument('--poll', action='store_true',
+                    help="only fetch if new prices are likely to have been published (Agile modes)")
+eco_profile.add_arguments(parser)
 
 args = parser.parse_args()
+eco_profile.start(args, 'store_data')
 conf_file = args.conf
+retry_delay = args.retry_delay
+record_dir = os.path.abspath(args.record) if args.record else None
 
 def get_data_from_api(_request_uri: str) -> dict:
     """using the provided URI, request data from the API and return a JSON object.
@@ -64,6 +93,10 @@ def get_data_from_api(_request_uri: str) -> dict:
     # Try to handle issues with the API - rare but do happen, using an
     # exponential sleep time up to 2**14 (16384) seconds, approx 4.5 hours.
     # We will keep trying for over 9 hours and then give up.
+    # (--retry-delay scales this, for testing against stub_api.py.)
+
+    # only the modes which talk to an API need this, and it's a big import
+    import requests
 
     retry_count = 0
     my_repr = Repr()
@@ -83,19 +116,19 @@ def get_data_from_api(_request_uri: str) -> dict:
 
         except requests.exceptions.HTTPError as error:
             print(('API HTTP error ' + str(response.status_code) +
-                   ',retrying in ' + str(2**retry_count) + 's'))
-            time.sleep(2**retry_count)
+                   ', retrying in ' + str(retry_delay * 2**retry_count) + 's'))
+            time.sleep(retry_delay * 2**retry_count)
             retry_count += 1
 
         except requests.exceptions.ConnectionError as error:
             print(('API connection error: ' + my_repr.repr(str(error)) +
-                   ', retrying in ' + str(2**retry_count) + 's'))
-            time.sleep(2**retry_count)
+                   ', retrying in ' + str(retry_delay * 2**retry_count) + 's'))
+            time.sleep(retry_delay * 2**retry_count)
             retry_count += 1
 
         except requests.exceptions.Timeout:
-            print('API request timeout, retrying in ' + str(2**retry_count) + 's')
-            time.sleep(2**retry_count)
+            print('API request timeout, retrying in ' + str(retry_delay * 2**retry_count) + 's')
+            time.sleep(retry_delay * 2**retry_count)
             retry_count += 1
 
         except requests.exceptions.RequestException as error:
@@ -106,161 +139,196 @@ def get_data_from_api(_request_uri: str) -> dict:
             if args.print: print(response.json())
             return response.json()
 
-def insert_data(data: dict, is_gas: bool):
-    """Insert our data records one by one, keep track of how many were successfully inserted
-    and print the results of the insertion."""
+def fetch(_request_uri: str, decode) -> tuple:
+    """Get everything at this URI and decode it with one of the eco_decode functions,
+    returning the rows and when the last of them ends. The Octopus API splits long
+    responses into pages, so follow the 'next' links, decoding each page as it
+    comes so a bad one stops us before anything is stored. Only for a request with
+    a period_from, though: without one, the pages go back through the tariff's
+    whole history. Save the lot (all the results gathered into the first page)
+    if we are recording."""
+
+    data = get_data_from_api(_request_uri)
+    rows, ends = decode(data)
+    page = data
+    if page.get('next') and 'period_from=' not in _request_uri:
+        print('Not following the next page, this request has no period_from.')
+        page = {}
+    while page.get('next'):
+        page = get_data_from_api(page['next'])
+        page_rows, page_ends = decode(page)
+        rows.extend(page_rows)
+        ends = max(ends, page_ends)
+        data['results'].extend(page['results'])
+
+    if 'next' in data:
+        print(str(len(data['results'])) + ' results retrieved.')
+        data['next'] = None
+
+    if record_dir:
+        os.makedirs(record_dir, exist_ok=True)
+        record_file = os.path.join(record_dir, eco_upstream.recording_name(_request_uri))
+        with open(record_file, 'w') as recording:
+            json.dump(data, recording)
+        print('Recorded to ' + record_file)
+
+    return rows, ends
+
+def agile_period() -> str:
+    """The query for the Agile rates we want: from a day ago (so we still have the
+    current slot) to two days ahead, which covers everything published."""
+    now = datetime.now(timezone.utc)
+    return ('?period_from=' + (now - timedelta(days=1)).strftime("%Y-%m-%dT%H:%M:%SZ") +
+            '&period_to=' + (now + timedelta(days=2)).strftime("%Y-%m-%dT%H:%M:%SZ"))
+
+def insert_data(batch: tuple, source: str, is_gas: bool):
+    """Insert a batch of rows from fetch, keep track of how many were new or changed and
+    print the results of the insertion. 'source' is the API the data came from: 'agile',
+    'tracker' or 'carbon'."""
+
+    values, ends = batch
+    if source == 'carbon':
+        field = 'intensity'
+    else:
+        field = 'gas_value_inc_vat' if is_gas else 'value_inc_vat'
+    num_rows_inserted = store_values(field, values)
+
+    if num_rows_inserted > 0:
+        lastslot = datetime.strftime(datetime.strptime(ends, "%Y-%m-%d %H:%M:%S"),
+                                     "%H:%M on %A %d %b") if ends else 'an unknown time'
+        print(str(num_rows_inserted) + ' of ' + str(len(values)) +
+              (' intensities' if source == 'carbon' else ' prices') +
+              ' were new or changed, ending at ' + lastslot + '.')
+        if source != 'tracker':
+            slot_times = [valid_from for valid_from, _ in values]
+            eco_gaps.update_coverage(cursor, field, min(slot_times), max(slot_times))
+    elif source == 'carbon':
+        print('No values were inserted - maybe we have them'
+              ' already, or carbonintensity.org.uk are late with their update.')
+    else:
+        print('No prices were inserted - maybe we have them'
+              ' already, or Octopus are late with their update.')
 
-    num_rows_inserted = 0
+    return num_rows_inserted
 
-    if config['Mode'] == 'agile_import' or config['Mode'] == 'agile_export':
-        for result in data['results']:
-            # insert_record returns false if it was a duplicate record
-            # or true if a record was successfully entered.
-            if insert_record(result['valid_from'], result['value_inc_vat'], is_gas):
-                num_rows_inserted += 1
-
-        if num_rows_inserted > 0:
-            lastslot = datetime.strftime(datetime.strptime(
-                data['results'][0]['valid_to'], "%Y-%m-%dT%H:%M:%SZ"), "%H:%M on %A %d %b")
-            print(str(num_rows_inserted) + ' prices were inserted, ending at ' + lastslot + '.')
-        else:
-            print('No prices were inserted - maybe we have them'
-                  ' already, or Octopus are late with their update.')
-
-    if config['Mode'] == "tracker":
-        for result in data['results']:
-            # insert_record returns false if it was a duplicate record
-            # or true if a record was successfully entered.
-            if insert_record(result['valid_from'], result['value_inc_vat'], is_gas):
-                num_rows_inserted += 1
-
-        if num_rows_inserted > 0:
-            lastslot = datetime.strftime(datetime.strptime(
-                data['results'][0]['valid_to'], "%Y-%m-%dT%H:%M:%SZ"), "%H:%M on %A %d %b")
-            print(str(num_rows_inserted) + ' prices were inserted, ending at ' + lastslot + '.')
-        else:
-            print('No prices were inserted - maybe we have them'
-                  ' already, or Octopus are late with their update.')
-
-    if config['Mode'] == 'carbon':
-        if config['DNORegion'] == 'Z':
-            carbon_data = data['data']
-        else:
-            carbon_data = data['data']['data']
-
-        for result in carbon_data:
-            if insert_record(result['from'], result['intensity']['forecast'], is_gas):
-                num_rows_inserted += 1
-
-        if num_rows_inserted > 0:
-            lastslot = datetime.strftime(datetime.strptime(
-                carbon_data[47]['from'], "%Y-%m-%dT%H:%MZ"), "%H:%M on %A %d %b")
-            print(str(num_rows_inserted) + ' intensities were inserted, '
-                  'ending at ' + lastslot + '.')
-        else:
-            print('No values were inserted - maybe we have them'
-                  ' already, or carbonintensity.org.uk are late with their update.')
-
-def insert_record(valid_from: str, data_value: float, is_gas: bool) -> bool:
-    """Assuming we still have a cursor, take a tuple and stick it into the database.
-       Return False if it was a duplicate record (not inserted) and True if a record
-       was successfully inserted."""
+def store_values(field: str, values: list) -> int:
+    """Assuming we still have a cursor, write a list of (valid_from, value) tuples into
+    one column of the database. The values already stored are read in one go first,
+    and only the rows which are new or have changed are written, to save wear on the
+    SD card (the carbon forecast mostly stays the same from one run to the next).
+    Return how many rows were written."""
     if not cursor:
         raise SystemExit('Database connection lost!')
+    if not values:
+        return 0
 
-    if config['Mode'] == 'agile_import' or config['Mode'] == 'agile_export':
-        # make the date/time work for SQLite, it's picky about the format,
-        # easier to use the built in SQLite datetime functions
-        # when figuring out what records we want rather than trying to roll our own
-        valid_from_formatted = datetime.strftime(
-            datetime.strptime(valid_from, "%Y-%m-%dT%H:%M:%SZ"), "%Y-%m-%d %H:%M:%S")
-
-        data_tuple = (valid_from_formatted, data_value)
-        # print(data_tuple) # debug
-
-        try:
-            cursor.execute(
-                "INSERT INTO 'eco'('valid_from', 'value_inc_vat') VALUES (?, ?) ON CONFLICT(valid_from) DO UPDATE SET value_inc_vat=excluded.value_inc_vat;", data_tuple)
-
-        except sqlite3.Error as error:
-            raise SystemError('Database error: ' + str(error)) from error
-
-        else:
-            return True # the record was inserted
-
-    if config['Mode'] == "tracker":
-        # make the date/time work for SQLite, it's picky about the format,
-        # easier to use the built in SQLite datetime functions
-        # when figuring out what records we want rather than trying to roll our own
-        valid_from_formatted = datetime.strftime(
-            datetime.strptime(valid_from, "%Y-%m-%dT%H:%M:%SZ"), "%Y-%m-%d %H:%M:%S")
-
-        data_tuple = (valid_from_formatted, data_value)
-        # print(data_tuple) # debug
-
-        if is_gas:
-            try:
-                cursor.execute(
-                    "INSERT INTO 'eco'('valid_from', 'gas_value_inc_vat') VALUES (?, ?) ON CONFLICT(valid_from) DO UPDATE SET gas_value_inc_vat=excluded.gas_value_inc_vat;", data_tuple)
-
-            except sqlite3.Error as error:
-                raise SystemError('Database error: ' + str(error)) from error
-
-            else:
-                return True # the record was inserted
-        elif not is_gas:
-            try:
-                cursor.execute(
-                    "INSERT INTO 'eco'('valid_from', 'value_inc_vat') VALUES (?, ?) ON CONFLICT(valid_from) DO UPDATE SET value_inc_vat=excluded.value_inc_vat;", data_tuple)
-
-            except sqlite3.Error as error:
-                raise SystemError('Database error: ' + str(error)) from error
-
-            else:
-                return True # the record was inserted
-
-
-    if config['Mode'] == 'carbon':
-        valid_from_formatted = datetime.strftime(
-            datetime.strptime(valid_from, "%Y-%m-%dT%H:%MZ"), "%Y-%m-%d %H:%M:%S")
-
-        data_tuple = (valid_from_formatted, data_value)
-        # print(data_tuple) # debug
-
-        try:
-            cursor.execute(
-                "INSERT INTO 'eco'('valid_from', 'intensity') VALUES (?, ?) ON CONFLICT(valid_from) DO UPDATE SET intensity=excluded.intensity;", data_tuple)
-
-        except sqlite3.Error as error:
-            raise SystemError('Database error: ' + str(error)) from error
+    slot_times = [valid_from for valid_from, _ in values]
+    try:
+        cursor.execute('SELECT valid_from, ' + field + ' FROM eco WHERE valid_from BETWEEN ? AND ?',
+                       (min(slot_times), max(slot_times)))
+        stored = dict(cursor.fetchall())
+        changed = [(valid_from, value) for valid_from, value in values
+                   if valid_from not in stored or stored[valid_from] != value]
+
+        if forecast_history:
+            # keep the value each changed forecast had before
+            revised_at = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+            cursor.executemany('INSERT OR REPLACE INTO forecast_history VALUES (?, ?, ?, ?)',
+                               [(field, valid_from, revised_at, stored[valid_from])
+                                for valid_from, _ in changed if stored.get(valid_from) is not None])
+
+        cursor.executemany(
+            "INSERT INTO 'eco'('valid_from', '" + field + "') VALUES (?, ?) "
+            "ON CONFLICT(valid_from) DO UPDATE SET " + field + "=excluded." + field + ";", changed)
 
-        else:
-            return True # the record was inserted
+    except sqlite3.Error as error:
+        raise SystemError('Database error: ' + str(error)) from error
 
-    return False
+    return len(changed)
 
-def remove_old_data(age: str):
-    """Delete old data from the database, we don't want to display those and we don't want it
-    to grow too big. 'age' must be a string that SQLite understands"""
+def insert_rows(rows: list) -> int:
+    """Insert whole rows (valid_from in SQLite format, then value_inc_vat, intensity
+    and gas_value_inc_vat) in one go, as they come from a hub. Return how many."""
     if not cursor:
-        raise SystemExit('Database connection lost before pruning data!')
+        raise SystemExit('Database connection lost!')
+    if not rows:
+        return 0
+
     try:
-        cursor.execute("SELECT COUNT(*) FROM eco "
-                       "WHERE valid_from < datetime('now', '-" + age + "')")
-        selected_rows = cursor.fetchall()
-        num_old_rows = selected_rows[0][0]
-        # I don't know why this doesn't just return an int rather than a list of a list of an int
-        if num_old_rows > 0:
-            cursor.execute("DELETE FROM eco WHERE valid_from < datetime('now', '-" + age + "')")
-            print(str(num_old_rows) + ' unneeded data points from the past were deleted.')
-        else:
-            print('There were no old data points to delete.')
+        cursor.executemany(
+            "INSERT INTO 'eco'('valid_from', 'value_inc_vat', 'intensity', 'gas_value_inc_vat') "
+            "VALUES (?, ?, ?, ?) ON CONFLICT(valid_from) DO UPDATE SET "
+            "value_inc_vat=excluded.value_inc_vat, intensity=excluded.intensity, "
+            "gas_value_inc_vat=excluded.gas_value_inc_vat;", rows)
+        for field in GAP_FIELDS.get(config['Mode'], []):
+            eco_gaps.update_coverage(cursor, field, rows[0][0], rows[-1][0])
     except sqlite3.Error as error:
-        print('Failed while trying to remove old data points from database: ', error)
+        raise SystemError('Database error: ' + str(error)) from error
+
+    return len(rows)
+
+def sync_from_hub(hub: str) -> int:
+    """Get the rows which have changed on the hub since we last asked, and
+    insert them. Return how many rows were inserted."""
+    since = eco_sync.synced_version(cursor, hub)
+    feed = get_data_from_api(hub.rstrip('/') + '/changes?since=' + str(since))
+    rows = eco_sync.decode_feed(feed)
+    num_rows_inserted = insert_rows(rows)
+    eco_sync.set_synced_version(cursor, hub, feed['v'])
+
+    if num_rows_inserted > 0:
+        print(str(num_rows_inserted) + ' rows were synced from the hub, now at version ' +
+              str(feed['v']) + '.')
+    else:
+        print('Nothing new on the hub.')
+    return num_rows_inserted
+
+def repair_gaps(agile_uri: str, carbon_uri: str) -> int:
+    """Look for stretches of slots missing from the data (left by missed runs or
+    partial responses) and fetch just those. Return how many rows were inserted.
+    Stretches the API has no data for, however often it's asked, are given up on
+    so they don't take the place of newer ones."""
+    num_rows_inserted = 0
+    since = (datetime.now(timezone.utc) - timedelta(days=REPAIR_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
+    for field in GAP_FIELDS[config['Mode']]:
+        gaps = eco_gaps.find_gaps(cursor, field, since, MAX_REPAIR_ATTEMPTS)
+        num_skipped = len(eco_gaps.find_gaps(cursor, field)) - len(gaps)
+        if num_skipped:
+            print('Not fetching ' + str(num_skipped) + ' missing stretches of ' + field +
+                  ' which are too old, or which the API has never had.')
+        # the most recent gaps first, they're the ones on the display
+        for gap_start, gap_end in reversed(gaps[-MAX_REPAIRS:]):
+            print('Missing ' + field + ' from ' + gap_start + ' to ' + gap_end + ' UTC, fetching...')
+            period_to = eco_gaps.shift(gap_end, 1)
+            if field == 'value_inc_vat':
+                data = fetch(agile_uri + '?period_from=' + gap_start.replace(' ', 'T') + 'Z' +
+                             '&period_to=' + period_to.replace(' ', 'T') + 'Z', eco_decode.octopus_rates)
+                num_rows_inserted += insert_data(data, 'agile', False)
+            else:
+                # the carbon API takes a from and to time in place of fw48h
+                data = fetch(carbon_uri.replace('{from_time}/fw48h', '{from_time}/{to_time}').format(
+                    from_time=gap_start[:16].replace(' ', 'T') + 'Z',
+                    to_time=period_to[:16].replace(' ', 'T') + 'Z'), eco_decode.carbon_intensity)
+                num_rows_inserted += insert_data(data, 'carbon', False)
+            if not eco_gaps.record_repair(cursor, field, gap_start, gap_end):
+                print('None of it was there.')
+    return num_rows_inserted
 
 os.chdir(sys.path[0])
 config = eco_indicator.get_config(conf_file)
 
+# one at a time: wait for a slow run to finish rather than both writing at once.
+# A poll doesn't wait, as the run it would wait for is already fetching
+eco_lock.run_alone(config, 'store_data', timeout=0 if args.poll else eco_lock.JOB_TIMEOUT)
+eco_lock.hold_database(config, writing=True)
+
+# keep the old value whenever a forecast (or price) is revised
+forecast_history = config.get('ForecastHistory') is True
+
+# point these somewhere else (e.g. stub_api.py) to test without the real APIs
+agile_api_base = eco_indicator.deep_get(config, ['Upstream', 'OctopusAPI'], AGILE_API_BASE)
+carbon_api_base = eco_indicator.deep_get(config, ['Upstream', 'CarbonAPI'], CARBON_API_BASE)
+
 # print('conf_file: ') # debug
 # print(conf_file) # debug
 # print('config: ') # debug
@@ -268,7 +336,8 @@ config = eco_indicator.get_config(conf_file)
 
 try:
     # connect to the database in rw mode so we can catch the error if it doesn't exist
-    DB_URI = 'file:{}?mode=rw'.format(pathname2url('eco_indicator.sqlite'))
+    db_file = eco_storage.db_file(config)
+    DB_URI = eco_indicator.db_uri(db_file, 'rw')
     conn = sqlite3.connect(DB_URI, uri=True)
     cursor = conn.cursor()
     print('Connected to database...')
@@ -276,7 +345,7 @@ try:
 except sqlite3.OperationalError:
     # handle missing database case
     print('No database found. Creating a new one...')
-    conn = sqlite3.connect('eco_indicator.sqlite')
+    conn = sqlite3.connect(db_file)
     cursor = conn.cursor()
     # UNIQUE constraint prevents duplication of data on multiple runs of this script
     # ON CONFLICT FAIL allows us to count how many times this happens
@@ -285,7 +354,37 @@ except sqlite3.OperationalError:
     conn.commit()
     print('Database created... ')
 
-if config['Mode'] == 'agile_import':
+# if we have a hub, get everything from there rather than the upstream APIs
+sync_hub = eco_indicator.deep_get(config, ['Sync', 'Hub'])
+
+if args.poll and not sync_hub:
+    fetch_now, poll_reason = eco_polling.should_fetch(cursor, config['Mode'])
+    if not fetch_now:
+        print('Not fetching: ' + poll_reason + '.')
+        conn.commit()
+        conn.close()
+        raise SystemExit(0)
+    print('Fetching: ' + poll_reason + '.')
+
+try:
+    for gap_field in GAP_FIELDS.get(config['Mode'], []):
+        eco_gaps.create_coverage(cursor, gap_field)
+    # so we can be a hub for other Pis, via serve_api.py
+    eco_sync.create_change_feed(cursor)
+    if forecast_history:
+        cursor.execute('CREATE TABLE IF NOT EXISTS forecast_history (field STRING, valid_from STRING, '
+                       'revised_at STRING, value REAL, PRIMARY KEY (field, valid_from, revised_at)) '
+                       'WITHOUT ROWID')
+except sqlite3.Error as error:
+    raise SystemError('Database error: ' + str(error)) from error
+
+rows_inserted = 0
+
+if sync_hub:
+    print('Syncing from hub ' + sync_hub)
+    rows_inserted += sync_from_hub(sync_hub)
+
+elif config['Mode'] == 'agile_import':
     DNO_REGION = config['DNORegion']
 
     if DNO_REGION in AGILE_REGIONS:
@@ -294,9 +393,9 @@ if config['Mode'] == 'agile_import':
         raise SystemExit('Error: DNO region ' + DNO_REGION + ' is not a valid choice.')
 
     # Build the API for the request - public API so no authentication required
-    request_uri = (AGILE_API_BASE + AGILE_IMPORT + DNO_REGION + AGILE_API_TAIL)
-    data_rows = get_data_from_api(request_uri)
-    insert_data(data_rows, False)
+    request_uri = (agile_api_base + AGILE_IMPORT + DNO_REGION + AGILE_API_TAIL) + agile_period()
+    data_rows = fetch(request_uri, eco_decode.octopus_rates)
+    rows_inserted += insert_data(data_rows, 'agile', False)
 
 elif config['Mode'] == 'carbon':
     DNO_REGION = config['DNORegion']
@@ -307,11 +406,31 @@ elif config['Mode'] == 'carbon':
         raise SystemExit('Error: DNO region ' + DNO_REGION + ' is not a valid choice.')
 
     # Build the API for the request - public API so no authentication required
-    request_time = datetime.now().astimezone(pytz.utc).isoformat()
-    request_uri = (CARBON_API_BASE + CARBON_REGIONS[DNO_REGION])
+    request_time = datetime.now(timezone.utc).isoformat()
+    request_uri = (carbon_api_base + CARBON_REGIONS[DNO_REGION])
     request_uri = request_uri.format(from_time=request_time)
-    data_rows = get_data_from_api(request_uri)
-    insert_data(data_rows, False)
+    data_rows = fetch(request_uri, eco_decode.carbon_intensity)
+    rows_inserted += insert_data(data_rows, 'carbon', False)
+
+elif config['Mode'] == 'agile_carbon':
+    DNO_REGION = config['DNORegion']
+
+    if DNO_REGION in AGILE_REGIONS:
+        print('Selected region ' + DNO_REGION)
+    else:
+        raise SystemExit('Error: DNO region ' + DNO_REGION + ' is not a valid choice.')
+
+    # Build the API for the request - public API so no authentication required
+    request_uri = (agile_api_base + AGILE_IMPORT + DNO_REGION + AGILE_API_TAIL) + agile_period()
+    data_rows = fetch(request_uri, eco_decode.octopus_rates)
+    rows_inserted += insert_data(data_rows, 'agile', False)
+
+    # and the carbon intensity for the same region, into the same rows
+    request_time = datetime.now(timezone.utc).isoformat()
+    request_uri = (carbon_api_base + CARBON_REGIONS[DNO_REGION])
+    request_uri = request_uri.format(from_time=request_time)
+    data_rows = fetch(request_uri, eco_decode.carbon_intensity)
+    rows_inserted += insert_data(data_rows, 'carbon', False)
 
 elif config['Mode'] == 'agile_export':
     DNO_REGION = config['DNORegion']
@@ -322,9 +441,9 @@ elif config['Mode'] == 'agile_export':
         raise SystemExit('Error: DNO region ' + DNO_REGION + ' is not a valid choice.')
 
     # Build the API for the request - public API so no authentication required
-    request_uri = (AGILE_API_BASE + AGILE_EXPORT + DNO_REGION + AGILE_API_TAIL)
-    data_rows = get_data_from_api(request_uri)
-    insert_data(data_rows, False)
+    request_uri = (agile_api_base + AGILE_EXPORT + DNO_REGION + AGILE_API_TAIL) + agile_period()
+    data_rows = fetch(request_uri, eco_decode.octopus_rates)
+    rows_inserted += insert_data(data_rows, 'agile', False)
 
 elif config['Mode'] == 'tracker':
     DNO_REGION = config['DNORegion']
@@ -335,7 +454,7 @@ elif config['Mode'] == 'tracker':
         raise SystemExit('Error: DNO region ' + DNO_REGION + ' is not a valid choice.')
 
     # Build the API for the request - public API so no authentication required
-    request_uri = (AGILE_API_BASE + TRACKER_ELECTRICITY + DNO_REGION + AGILE_API_TAIL)
+    request_uri = (agile_api_base + TRACKER_ELECTRICITY + DNO_REGION + AGILE_API_TAIL)
 
     period_from = datetime.now() - timedelta(days=1)
     period_from = period_from.strftime("%Y-%m-%dT%H:%M:%SZ")
@@ -345,21 +464,52 @@ elif config['Mode'] == 'tracker':
 
     request_uri = request_uri + "?period_from=" + period_from + "&period_to=" + period_to
 
-    data_rows = get_data_from_api(request_uri)
-    insert_data(data_rows, False)
+    data_rows = fetch(request_uri, eco_decode.octopus_rates)
+    rows_inserted += insert_data(data_rows, 'tracker', False)
 
-    request_uri = (AGILE_API_BASE + TRACKER_GAS + DNO_REGION + AGILE_API_TAIL)
+    request_uri = (agile_api_base + TRACKER_GAS + DNO_REGION + AGILE_API_TAIL)
     request_uri = request_uri + "?period_from=" + period_from + "&period_to=" + period_to
 
-    data_rows = get_data_from_api(request_uri)
-    insert_data(data_rows, True)
+    data_rows = fetch(request_uri, eco_decode.octopus_rates)
+    rows_inserted += insert_data(data_rows, 'tracker', True)
 
 else:
     raise SystemExit('Error: Invalid mode ' + config['Mode'] + ' passed to store_data.py')
 
-remove_old_data('3 days')
+if config['Mode'] in GAP_FIELDS and not sync_hub:
+    agile_tariff = AGILE_EXPORT if config['Mode'] == 'agile_export' else AGILE_IMPORT
+    rows_inserted += repair_gaps(agile_api_base + agile_tariff + DNO_REGION + AGILE_API_TAIL,
+                                 carbon_api_base + CARBON_REGIONS.get(DNO_REGION, ''))
+
+# fold the slots which have finished into the typical week, for estimates
+try:
+    eco_baseline.create_baseline(cursor)
+    for baseline_field in eco_baseline.MODE_FIELDS.get(config['Mode'], []):
+        eco_baseline.update_profile(cursor, baseline_field)
+    # and Tracker prices into the daily history, which outlives the eco table
+    if config['Mode'] == 'tracker':
+        eco_daily.create_daily(cursor)
+        eco_daily.update_daily(cursor)
+except sqlite3.Error as error:
+    raise SystemError('Database error: ' + str(error)) from error
+
+print(str(rows_inserted) + ' rows were written this run.')
+eco_polling.record_fetch(cursor, config['Mode'], rows_inserted)
 
 # finish up the database operation
 if conn:
     conn.commit()
+
+    # pruning is maintain_db.py's job, but if it hasn't run for a while (it isn't in
+    # the crontab, or the Pi is always off at night) do a little of it here
+    try:
+        eco_maintenance.create_maintenance_state(cursor)
+        if eco_maintenance.overdue(cursor):
+            print("Old data hasn't been pruned lately - is maintain_db.py in the crontab? Pruning some now.")
+            eco_maintenance.prune(conn, config, time.monotonic() + eco_maintenance.FALLBACK_BUDGET)
+    except sqlite3.Error as error:
+        print('Failed while trying to remove old data points from database: ', error)
     conn.close()
+
+# if the database is in RAM, copy it to the SD card every so often
+eco_storage.snapshot(config)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# pylint: disable=invalid-name
+
+"""Stand in for the Octopus and carbonintensity.org.uk APIs, so store_data.py can
+   be tested (and load tested) with no network. Replays responses recorded with
+   store_data.py --record, or makes up plausible ones, and can add latency,
+   server errors, hung requests and pagination along the way."""
+
+import os
+import sys
+import json
+import time
+import random
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, urlencode
+import argparse
+import eco_upstream
+
+parser = argparse.ArgumentParser(description=('Serve recorded or made up API responses for testing store_data.py'))
+parser.add_argument('--recordings', '-d', metavar='DIR',
+                    help='directory of responses recorded with store_data.py --record')
+parser.add_argument('--port', '-p', type=int, default=8081, help='port to listen on')
+parser.add_argument('--bind', '-b', default='127.0.0.1', help='address to listen on')
+parser.add_argument('--latency', type=float, default=0, help='milliseconds to wait before each response')
+parser.add_argument('--jitter', type=float, default=0, help='up to this many more random milliseconds')
+parser.add_argument('--error-rate', type=float, default=0, help='fraction of requests to answer with a 5xx')
+parser.add_argument('--timeout-rate', type=float, default=0, help='fraction of requests to hang')
+parser.add_argument('--hang', type=float, default=10, help='seconds to hang for (store_data.py gives up after 5)')
+parser.add_argument('--page-size', type=int, default=0, help='split Octopus results into pages of this size')
+parser.add_argument('--history-days', type=int, default=30,
+                    help='days of made up prices an Octopus request without a period_from pages back through, '
+                         'as the real one goes back through the whole history of the tariff (default 30)')
+parser.add_argument('--seed', type=int, help='random seed, to make a run repeatable')
+
+args = parser.parse_args()
+
+recordings_dir = os.path.abspath(args.recordings) if args.recordings else None
+chaos = random.Random(args.seed)
+stats_lock = threading.Lock()
+stats = {'requests': 0, 'errors': 0, 'hangs': 0, 'not_found': 0, 'unbounded': 0}
+OCTOPUS_PAGE_SIZE = 100 # what the real API pages by when it isn't asked for a period
+recordings = {}
+
+def count(name: str):
+    """Add one to a statistic."""
+    with stats_lock:
+        stats[name] += 1
+
+def load_recording(name: str):
+    """Return a recorded response, from memory after the first time."""
+    if name not in recordings:
+        try:
+            with open(os.path.join(recordings_dir, name)) as recording:
+                recordings[name] = json.load(recording)
+        except FileNotFoundError:
+            recordings[name] = None
+    return recordings[name]
+
+def parse_time(value: str) -> datetime:
+    """A period_from or period_to, which can leave out the seconds."""
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+def made_up_rates(slot_length: timedelta, period_from: datetime = None, period_to: datetime = None) -> dict:
+    """An Octopus standard-unit-rates response, newest first as the real one is:
+    the slots in the period asked for, up to two days ahead. With no period_from,
+    every slot back to --history-days ago."""
+    now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    published = now + timedelta(days=2)
+    if period_from is None:
+        start = now - timedelta(days=args.history_days)
+    else:
+        start = period_from.replace(second=0, microsecond=0)
+        start -= timedelta(minutes=start.minute % 30)
+    if slot_length.days:
+        start = start.replace(hour=0, minute=0)
+        published = published.replace(hour=0)
+    end = min(period_to, published) if period_to is not None else published
+    results = []
+    for slot in range(max(0, int((end - start) / slot_length))):
+        valid_from = start + slot * slot_length
+        results.append({'value_exc_vat': 0, 'value_inc_vat': round(chaos.uniform(-2, 40), 2),
+                        'valid_from': valid_from.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                        'valid_to': (valid_from + slot_length).strftime("%Y-%m-%dT%H:%M:%SZ")})
+    results.reverse()
+    return {'count': len(results), 'next': None, 'previous': None, 'results': results}
+
+def made_up_intensity(regional: bool) -> dict:
+    """A carbonintensity.org.uk fw48h response, national or regional."""
+    start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    data = []
+    for slot in range(96):
+        valid_from = start + timedelta(minutes=30 * slot)
+        data.append({'from': valid_from.strftime("%Y-%m-%dT%H:%MZ"),
+                     'to': (valid_from + timedelta(minutes=30)).strftime("%Y-%m-%dT%H:%MZ"),
+                     'intensity': {'forecast': chaos.randint(20, 350), 'index': 'moderate'}})
+    if regional:
+        return {'data': {'regionid': 0, 'shortname': 'Stub', 'data': data}}
+    return {'data': data}
+
+def response_for(path: str, query: dict):
+    """The full response for a request path, recorded if we have it, otherwise made up."""
+    if recordings_dir:
+        recorded = load_recording(eco_upstream.recording_name(path))
+        if recorded is not None:
+            return recorded
+    if path.endswith('/standard-unit-rates/'):
+        period_from = parse_time(query['period_from'][0]) if 'period_from' in query else None
+        period_to = parse_time(query['period_to'][0]) if 'period_to' in query else None
+        if 'SILVER' in path: # Tracker prices are daily
+            return made_up_rates(timedelta(days=1), period_from, period_to)
+        return made_up_rates(timedelta(minutes=30), period_from, period_to)
+    if '/intensity/' in path:
+        return made_up_intensity('/regionid/' in path)
+    return None
+
+def paginate(content: dict, page: int, page_size: int, base_url: str, query: dict) -> dict:
+    """Cut an Octopus-style response down to one page, with links to the others,
+    which keep the rest of the query as the real ones do."""
+    results = content['results']
+    first = (page - 1) * page_size
+
+    def link(to_page: int) -> str:
+        return base_url + '?' + urlencode(dict(query, page=[str(to_page)]), doseq=True)
+
+    paged = dict(content)
+    paged['results'] = results[first:first + page_size]
+    paged['next'] = link(page + 1) if first + page_size < len(results) else None
+    paged['previous'] = link(page - 1) if page > 1 else None
+    return paged
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answer like the real APIs, with added chaos."""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self): # pylint: disable=invalid-name
+        """Serve one request."""
+        count('requests')
+        url = urlsplit(self.path)
+
+        delay = args.latency + chaos.uniform(0, args.jitter)
+        if delay:
+            time.sleep(delay / 1000)
+
+        if chaos.random() < args.timeout_rate:
+            count('hangs')
+            time.sleep(args.hang)
+
+        if chaos.random() < args.error_rate:
+            count('errors')
+            self.send_body(chaos.choice([500, 502, 503]), {'detail': 'Injected server error.'})
+            return
+
+        query = parse_qs(url.query)
+        content = response_for(url.path, query)
+        if content is None:
+            count('not_found')
+            self.send_body(404, {'detail': 'Not found.'})
+            return
+
+        page_size = args.page_size
+        if 'results' in content and 'period_from' not in query:
+            # like the real API, which pages back through years of prices
+            page_size = page_size or OCTOPUS_PAGE_SIZE
+            if 'page' not in query:
+                count('unbounded')
+                print('Request for ' + url.path + ' with no period_from, ' + str(len(content['results'])) +
+                      ' results in pages of ' + str(page_size) + '.')
+                sys.stdout.flush()
+        if page_size and 'results' in content:
+            page = int(query.get('page', [1])[0])
+            base_url = 'http://' + self.headers.get('Host', 'localhost') + url.path
+            content = paginate(content, page, page_size, base_url, {key: value for key, value in query.items()
+                                                                    if key != 'page'})
+
+        self.send_body(200, content)
+
+    def send_body(self, status: int, content: dict):
+        """Send a JSON response."""
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        """Keep quiet, we report totals at the end instead."""
+
+server = ThreadingHTTPServer((args.bind, args.port), StubHandler)
+server.daemon_threads = True # don't wait for hung requests when stopping
+print('Stub API serving on http://' + args.bind + ':' + str(args.port) + '/ ...')
+print("Set Upstream: OctopusAPI to http://" + args.bind + ':' + str(args.port) +
+      "/v1/products/ and CarbonAPI to http://" + args.bind + ':' + str(args.port) + " in config.yaml")
+sys.stdout.flush()
+
+started = time.perf_counter()
+try:
+    server.serve_forever()
+except KeyboardInterrupt:
+    server.server_close()
+    elapsed = time.perf_counter() - started
+    print('{requests} requests ({rate:.1f}/s), {errors} errors, {hangs} hangs, '
+          '{not_found} not found, {unbounded} without a period_from.'.format(
+              rate=stats['requests'] / elapsed, **stats))
@@ -0,0 +1,21 @@
+"""Check that the Inky pictures still match the golden ones, by running
+check_renders.py. Run with python3 -m pytest."""
+
+import os
+import sys
+import subprocess
+import pytest
+import check_renders
+
+def test_pictures_match_golden(tmp_path):
+    """Every mode at every display size, pixel for pixel, and within budget."""
+    made_with = check_renders.read_versions(check_renders.GOLDEN_DIR)
+    if made_with != check_renders.render_versions():
+        pytest.skip('the golden pictures were drawn with ' + str(made_with) + ', not ' +
+                    str(check_renders.render_versions()) + ' - run check_renders.py --update '
+                    'on a known-good checkout to make some for these versions')
+
+    # in its own process, as it stops the clock
+    result = subprocess.run([sys.executable, os.path.abspath(check_renders.__file__), '--output', str(tmp_path)],
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, check=False)
+    assert result.returncode == 0, result.stdout
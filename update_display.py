@@ -7,9 +7,12 @@
 import sqlite3
 import os
 import sys
-from urllib.request import pathname2url
 import argparse
 import eco_indicator
+import eco_profile
+import eco_lock
+import eco_storage
+import eco_targets
 
 # Blinkt! defaults
 DEFAULT_BRIGHTNESS = 10
@@ -21,15 +24,22 @@ DEFAULT_LOWSLOTDURATION = 3
 parser = argparse.ArgumentParser(description=('Update Eco Indicator display using SQLite data'))
 parser.add_argument('--demo', '-d', action='store_true', help='display demo data')
 parser.add_argument('--conf', '-c', default='config.yaml', help='specify config file')
+eco_profile.add_arguments(parser)
 
 args = parser.parse_args()
+eco_profile.start(args, 'update_display')
 conf_file = args.conf
 
 os.chdir(sys.path[0])
+config = eco_indicator.get_config(conf_file)
+
+# wait for store_data.py if it's still writing, so we show the new data
+eco_lock.run_alone(config, 'update_display')
+eco_lock.hold_database(config, writing=False)
 
 try:
     # connect to the database in rw mode so we can catch the error if it doesn't exist
-    DB_URI = 'file:{}?mode=rw'.format(pathname2url('eco_indicator.sqlite'))
+    DB_URI = eco_indicator.db_uri(eco_storage.db_file(config), 'rw')
     conn = sqlite3.connect(DB_URI, uri=True)
     cursor = conn.cursor()
     print('Connected to database...')
@@ -38,38 +48,18 @@ except sqlite3.OperationalError as error:
     # handle missing database case
     raise SystemExit('Database not found - you need to run store_data.py first.') from error
 
-config = eco_indicator.get_config(conf_file)
-
-if 'agile' in config['Mode'] or config['Mode'] == 'tracker':
-    field_name = 'value_inc_vat'
-
-elif config['Mode'] == 'carbon':
-    field_name = 'intensity'
-
-else:
-    raise SystemExit('Error: invalid mode ' + config['Mode'] + ' in config.')
-
-if config['Mode'] == "tracker":
-    cursor.execute("SELECT * FROM eco ORDER BY valid_from DESC")
-else:
-    cursor.execute("SELECT * FROM eco WHERE valid_from > datetime('now', '-30 minutes') AND " + field_name + " IS NOT NULL")
-
-data_rows = cursor.fetchall()
+data_rows = eco_targets.display_rows(cursor, config)
 
 if len(data_rows) == 0:
     raise SystemExit('Error: No data found - perhaps you need to run store_data.py.')
 
-if config['DisplayType'] == 'blinkt':
-    eco_indicator.update_blinkt(config, data_rows, args.demo)
-
-elif config['DisplayType'] == 'inkyphat':
-    if 'agile' in config['Mode'] or config['Mode'] == 'carbon':
-        eco_indicator.update_inky(config, data_rows, args.demo)
-    elif config['Mode'] == 'tracker':
-        eco_indicator.update_inky_tracker(config, data_rows, args.demo)
+# the display, or every one of the Targets in the config, from this one read
+try:
+    eco_targets.create_display_state(cursor)
+except sqlite3.Error as error:
+    raise SystemError('Database error: ' + str(error)) from error
 
-else:
-    raise SystemExit('Error: invalid display type ' + config['DisplayType'] + 'in config.')
+eco_targets.update_targets(config, data_rows, cursor, args.demo)
 
 # finish up the database operation
 if conn: